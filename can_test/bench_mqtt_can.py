@@ -0,0 +1,136 @@
+"""MQTT -> CAN 全链路压测 (无硬件)
+
+本机起替身 Broker，子进程运行 robot_agent_tracer.py --sim (进程内模拟底盘)，
+这里按固定频率发指令，速度在两个值之间阶跃切换，并订阅机器人的遥测上行:
+
+- MQTT -> CAN: 指令发出到遥测里 cmd_v (控制循环实际下发值) 变成新值
+- 端到端: 指令发出到遥测里 fb_v (底盘反馈速度) 跟上新值 (含模拟底盘的响应时间)
+
+遥测按 SAMPLE_HZ 采样，延迟的分辨率是一个采样周期。机器人退出时打印的
+[Telemetry] 行里还有 CAN 层的指令->反馈延迟直方图。
+
+    python can_test/bench_mqtt_can.py --rate 50 --duration 10
+"""
+import argparse
+import os
+import signal
+import subprocess
+import sys
+import threading
+import time
+
+import paho.mqtt.client as mqtt
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from common.clock_sync import now
+from common.cmd_codec import CmdEncoder, ENCODING_BINARY
+from common.latency_histogram import LatencyHistogram
+from common.local_broker import LocalBroker
+from telemetry_uplink import decode_batch
+
+AGENT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "robot_agent_tracer.py")
+TOPIC_CMD = "agilex/tracer/cmd_vel"
+TOPIC_TELEMETRY = "agilex/tracer/telemetry"
+SAMPLE_HZ = 50
+SPEEDS = (0.2, 0.4)   # 阶跃切换的两个线速度 m/s
+TOLERANCE = 0.005     # 判定"跟上"的误差 m/s
+
+
+class StepTracker:
+    """记录每次阶跃的发出时间，匹配遥测里第一次到达新值的样本"""
+
+    def __init__(self):
+        self.steps = []  # [t_send, v, cmd 已匹配, fb 已匹配]
+        self.cmd_latency = LatencyHistogram()
+        self.fb_latency = LatencyHistogram()
+        self._lock = threading.Lock()
+
+    def on_step(self, t_send, v):
+        with self._lock:
+            self.steps.append([t_send, v, False, False])
+
+    def on_samples(self, name, points):
+        idx, hist = (2, self.cmd_latency) if name == "cmd_v" else (3, self.fb_latency)
+        with self._lock:
+            for ts, value in points:
+                for step in self.steps:
+                    if not step[idx] and ts >= step[0] and abs(value - step[1]) <= TOLERANCE:
+                        step[idx] = True
+                        hist.record((ts - step[0]) * 1e6)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="MQTT -> CAN 全链路压测 (模拟底盘)")
+    parser.add_argument("--port", type=int, default=18830, help="替身 Broker 端口")
+    parser.add_argument("--rate", type=float, default=50.0, help="指令发送频率 Hz")
+    parser.add_argument("--step", type=float, default=1.0, help="速度阶跃间隔 s")
+    parser.add_argument("--duration", type=float, default=10.0, help="压测时长 s")
+    parser.add_argument("--qos", type=int, choices=(0, 1, 2), default=0)
+    args = parser.parse_args()
+
+    broker = LocalBroker("127.0.0.1", args.port)
+    broker.start_in_thread()
+
+    agent = subprocess.Popen(
+        [sys.executable, AGENT, "--sim", "--no-ramp", "--broker", "127.0.0.1", "--port", str(args.port),
+         "--telemetry-window", "0.2",
+         "--telemetry-rate", f"cmd_v={SAMPLE_HZ}", "--telemetry-rate", f"fb_v={SAMPLE_HZ}"],
+        stdout=subprocess.PIPE, stderr=subprocess.STDOUT, text=True)
+
+    tracker = StepTracker()
+
+    def on_connect(client, userdata, flags, rc, properties=None):
+        client.subscribe(TOPIC_TELEMETRY)
+
+    def on_message(client, userdata, msg):
+        try:
+            _, _, fields = decode_batch(msg.payload)
+        except ValueError:
+            return
+        for name in ("cmd_v", "fb_v"):
+            if name in fields:
+                tracker.on_samples(name, fields[name])
+
+    client = mqtt.Client(mqtt.CallbackAPIVersion.VERSION2)
+    client.on_connect = on_connect
+    client.on_message = on_message
+    client.connect("127.0.0.1", args.port, 60)
+    client.loop_start()
+    encoder = CmdEncoder(TOPIC_CMD, ENCODING_BINARY)
+
+    print(f"🚀 压测: {args.rate:.0f} Hz, 每 {args.step:.1f}s 阶跃一次, 持续 {args.duration:.0f}s")
+    time.sleep(1.0)  # 等机器人连上 Broker
+    period = 1.0 / args.rate
+    t_start = time.monotonic()
+    next_t = t_start
+    v = None
+    try:
+        while time.monotonic() - t_start < args.duration:
+            target = SPEEDS[int((time.monotonic() - t_start) / args.step) % len(SPEEDS)]
+            if target != v:
+                v = target
+                tracker.on_step(now(), v)
+            client.publish(TOPIC_CMD, encoder.encode(v, 0.0), qos=args.qos)
+            next_t += period
+            time.sleep(max(0.0, next_t - time.monotonic()))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        client.publish(TOPIC_CMD, encoder.encode(0.0, 0.0), qos=args.qos)
+        time.sleep(0.5)  # 接住最后一批遥测
+        agent.send_signal(signal.SIGINT)
+        output, _ = agent.communicate(timeout=5)
+        client.loop_stop()
+        broker.stop()
+
+    print(f"阶跃 {len(tracker.steps)} 次 (延迟分辨率 {1000 / SAMPLE_HZ:.0f} ms)")
+    for label, hist in (("MQTT -> CAN", tracker.cmd_latency), ("端到端 (底盘反馈)", tracker.fb_latency)):
+        print(f"{label}: {hist.format() if hist.total else '无样本'}")
+    print("--- 机器人端统计 ---")
+    for line in output.splitlines():
+        if "] [" in line:
+            print(line)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,85 @@
+import threading
+import time
+
+from common.mailbox import LatestSlot
+
+
+class ControlLoop(threading.Thread):
+    """固定频率控制循环: CAN 总线的唯一写入者
+
+    MQTT 回调和看门狗只往单槽邮箱里投递最新的 (v, w) 设定值，不直接碰总线；
+    本线程按固定节拍取最新设定值并发出 0x111 运动帧，所以指令突发不会卡住
+    paho 网络线程，CAN 帧的发送节拍也是确定的。
+
+    给了 shaper (TrajectoryShaper) 时，设定值先经过加速度/jerk 限幅再下发。
+    """
+
+    def __init__(self, driver, rate_hz=50.0, shaper=None):
+        super().__init__(name="control-loop", daemon=True)
+        self.driver = driver
+        self.shaper = shaper
+        self.set_rate(rate_hz)
+        self.mailbox = LatestSlot()
+        self._stop_event = threading.Event()
+
+        self.setpoint = (0.0, 0.0)
+        self.urgent = False  # 急停: 整形器按急停减速度刹车
+        self.output = (0.0, 0.0)  # 实际下发的速度
+        self._version = 0
+
+        # 节拍统计
+        self.ticks = 0
+        self.overruns = 0        # 一个周期内没跑完的次数
+        self.max_lateness = 0.0  # 最大延后 (秒)
+
+    def set_rate(self, rate_hz):
+        self.rate_hz = rate_hz
+        self.period = 1.0 / rate_hz
+
+    def submit(self, v, w, urgent=False):
+        """任意线程调用: 投递新的设定值 (旧的未执行值直接被覆盖)"""
+        self.mailbox.put(((v, w), urgent))
+
+    def stop(self, timeout=1.0):
+        self._stop_event.set()
+        self.join(timeout)
+
+    def run(self):
+        next_t = time.perf_counter()
+        try:
+            while not self._stop_event.is_set():
+                slot = self.mailbox.peek()
+                if slot is not None and slot[0] != self._version:
+                    self._version, (self.setpoint, self.urgent) = slot
+
+                self.step(self.period)
+                self.ticks += 1
+
+                # 按绝对时间表调度，避免 sleep 误差累积
+                next_t += self.period
+                now = time.perf_counter()
+                lateness = now - next_t
+                if lateness > 0:
+                    self.overruns += 1
+                    self.max_lateness = max(self.max_lateness, lateness)
+                    if lateness > self.period:
+                        next_t = now  # 落后太多就重新对齐，不补发
+                    continue
+                self._stop_event.wait(-lateness)
+        finally:
+            # 退出前最后发一帧停车 (仍由本线程发出)
+            self.driver.stop()
+
+    def step(self, dt):
+        """每个节拍执行一次: 整形后的设定值写到总线"""
+        # 先按驱动限幅裁剪，output 报告的就是真正下发的值
+        target = self.driver.clamp(*self.setpoint)
+        if self.shaper is not None:
+            self.output = self.shaper.step(target, dt, self.urgent)
+        else:
+            self.output = target
+        self.driver.send_motion_command(*self.output)
+
+    def describe(self):
+        return (f"{self.rate_hz:.0f}Hz ticks={self.ticks} overruns={self.overruns}"
+                f" max_late={self.max_lateness * 1000:.2f}ms dropped={self.mailbox.overwritten}")
@@ -1,56 +1,93 @@
+import os
 import sys
-import tty
-import termios
-import json
+import time
+import random
 import paho.mqtt.client as mqtt
 
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from common.clock_sync import ClockSyncResponder
+from common.cmd_codec import CmdEncoder, FLAG_ESTOP, ENCODING_AUTO
+from common.cmd_stream import CommandStreamer
+from teleop_io import TerminalKeyboard, TeleopLoop
+
 # 配置
 MQTT_BROKER = "broker.emqx.io"
 MQTT_TOPIC = "agilex/tracer/cmd_vel"
+MQTT_TOPIC_CLOCK = "agilex/tracer/clock"  # 时钟同步 (机器人来 ping)
+CLIENT_ID = f"tracer_controller_{random.randint(0, 1000)}"
+CMD_ENCODING = ENCODING_AUTO  # auto: 机器人声明支持二进制就用二进制，否则 JSON
+HEARTBEAT_HZ = 10.0  # 指令不变时的重发频率 (机器人看门狗 0.5s)
+IDLE_HZ = 1.0        # 停车状态下的重发频率
+STATUS_HZ = 5.0      # 终端状态行刷新频率
 
 # TRACER 推荐速度
 LINEAR_STEP = 0.4  # m/s
 ANGULAR_STEP = 0.5 # rad/s
 
-def get_key():
-    fd = sys.stdin.fileno()
-    old_settings = termios.tcgetattr(fd)
-    try:
-        tty.setraw(sys.stdin.fileno())
-        ch = sys.stdin.read(1)
-    finally:
-        termios.tcsetattr(fd, termios.TCSADRAIN, old_settings)
-    return ch
-
 def main():
-    client = mqtt.Client()
+    clock_responder = ClockSyncResponder(MQTT_TOPIC_CLOCK, CLIENT_ID)
+    encoder = CmdEncoder(MQTT_TOPIC, CMD_ENCODING)
+
+    def on_connect(client, userdata, flags, rc, properties=None):
+        if rc == 0:
+            clock_responder.subscribe(client)
+            encoder.subscribe(client)
+
+    client = mqtt.Client(mqtt.CallbackAPIVersion.VERSION2, client_id=CLIENT_ID)
+    client.on_connect = on_connect
+    clock_responder.attach(client)
+    encoder.attach(client)
+    # 不启动 paho 网络线程: socket 交给下面的事件循环，和按键一起 select
     client.connect(MQTT_BROKER, 1883, 60)
+
+    # 持续指令流: 变化立即发，不变按心跳重发，松手间隙机器人不会被看门狗停掉
+    # 心跳由事件循环的定时器驱动 (不用 streamer 自带线程)
+    streamer = CommandStreamer(client, MQTT_TOPIC, encoder, HEARTBEAT_HZ, IDLE_HZ)
     
     print("=== TRACER Remote Control ===")
-    print("WASD控制，Q停止，E退出")
-    
-    v, w = 0.0, 0.0
-    
+    print("WASD/方向键控制，Q停止，E退出")
+
+    def on_key(key):
+        v, w = streamer.current
+        flags = 0
+        if key == 'w': v = LINEAR_STEP; w = 0.0
+        elif key == 's': v = -LINEAR_STEP; w = 0.0
+        elif key == 'a': v = 0.0; w = ANGULAR_STEP
+        elif key == 'd': v = 0.0; w = -ANGULAR_STEP
+        elif key == 'q': v = 0.0; w = 0.0; flags = FLAG_ESTOP
+        elif key == 'e':
+            loop.stop()
+            return
+        else:
+            return
+
+        # 更新当前指令 (相同指令由心跳负责重发)
+        streamer.set(v, w, flags)
+        show_status()
+
+    def show_status():
+        v, w = streamer.current
+        link = "在线" if client.is_connected() else "断开"
+        print(f"\rCMD: v={v:+.2f}, w={w:+.2f} | {encoder.encoding} | MQTT {link}"
+              f" | 心跳 {streamer.sent_heartbeats}    ", end="", flush=True)
+        return time.monotonic() + 1.0 / STATUS_HZ
+
     try:
-        while True:
-            key = get_key()
-            if key == 'w': v = LINEAR_STEP; w = 0
-            elif key == 's': v = -LINEAR_STEP; w = 0
-            elif key == 'a': v = 0; w = ANGULAR_STEP
-            elif key == 'd': v = 0; w = -ANGULAR_STEP
-            elif key == 'q': v = 0; w = 0
-            elif key == 'e': break
-            
-            # 发送指令
-            payload = json.dumps({'v': v, 'w': w})
-            client.publish(MQTT_TOPIC, payload, qos=0)
-            print(f"\rCMD: v={v}, w={w}    ", end="")
-            
+        with TerminalKeyboard() as keyboard:
+            loop = TeleopLoop(client, keyboard, on_key)
+            loop.add_timer(streamer.tick)
+            loop.add_timer(show_status)
+            loop.run()
     except KeyboardInterrupt:
         pass
     finally:
-        client.publish(MQTT_TOPIC, json.dumps({'v': 0, 'w': 0}))
-        termios.tcsetattr(sys.stdin, termios.TCSADRAIN, termios.tcgetattr(sys.stdin))
+        # 最后一帧急停: 事件循环已退出，手动把它写出去
+        info = streamer.stop()
+        deadline = time.monotonic() + 1.0
+        while not info.is_published() and client.is_connected() and time.monotonic() < deadline:
+            client.loop(timeout=0.05)
+        print(f"\n[指令流] {streamer.describe()}")
+        client.disconnect()
 
 if __name__ == "__main__":
     main()
@@ -1,146 +1,334 @@
+import os
+import sys
 import time
-import json
 import threading
-import struct
 import platform  # 引入平台检测库
+import argparse
+import logging
 import paho.mqtt.client as mqtt
 
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from common.clock_sync import ClockSync
+from common import cmd_codec
+from common.log_util import setup_logging
+from common.cmd_coalesce import CommandCoalescer
+from control_loop import ControlLoop
+from trajectory import TrajectoryShaper
+import tracer_protocol as proto
+from watchdog import DeadlineWatchdog, IDLE, ARMED, EXPIRED
+from telemetry_uplink import TelemetryUplink, FIELDS_BY_NAME
+
 # 尝试导入 python-can，如果没有安装则提示
 try:
     import can
 except ImportError:
     print("请先运行: pip install python-can")
     exit()
+from tracer_telemetry import TelemetryReader
 
 # ================= 配置区域 =================
 MQTT_BROKER = "broker.emqx.io"
 MQTT_PORT = 1883
 MQTT_TOPIC_CMD = "agilex/tracer/cmd_vel"
+MQTT_TOPIC_CLOCK = "agilex/tracer/clock"  # 时钟同步 ping/pong
+MQTT_TOPIC_TELEMETRY = "agilex/tracer/telemetry"  # 遥测上行 (二进制批次)
 MQTT_ID = "tracer_robot_mac_sim" # 改个名字避免冲突
+CONTROL_HZ = 50.0  # 控制循环频率 (CAN 0x111 发送节拍)
+WATCHDOG_TIMEOUT = 0.5  # 指令超时 (秒)，超时停车一次
+MAX_CMD_AGE = 0.3  # 指令最大年龄 (秒)，网络积压送来的旧指令直接丢弃
+TELEMETRY_LOG_INTERVAL = 10.0  # 底盘反馈摘要的日志间隔 (秒)
+TELEMETRY_WINDOW = 1.0  # 遥测上行打包窗口 (秒)，各字段采样频率见 telemetry_uplink.FIELDS
+# 速度整形: 按键产生的阶跃指令在控制循环里按加速度 / jerk 上限平滑过渡
+LINEAR_ACCEL, LINEAR_JERK = 0.8, 4.0     # m/s^2, m/s^3
+ANGULAR_ACCEL, ANGULAR_JERK = 2.0, 10.0  # rad/s^2, rad/s^3
+DEBUG = os.environ.get("TRACER_DEBUG") == "1"  # 也可以用 --debug 打开逐条消息转储
+
+# 日志走队列 + 后台线程输出，回调里只付出入队的开销
+setup_logging(logging.DEBUG if DEBUG else logging.INFO)
+log = logging.getLogger("tracer")
+log_driver = logging.getLogger("tracer.driver")
+log_mqtt = logging.getLogger("tracer.mqtt")
 
 # ================= 驱动层 (自动适配 Mac/Linux) =================
 class TracerDriver:
-    def __init__(self, channel='can0', bitrate=500000):
+    MAX_LINEAR = 1.5   # m/s
+    MAX_ANGULAR = 1.0  # rad/s
+
+    def __init__(self, bitrate=500000):
         self.os_type = platform.system()
         self.bus = None
-        
-        print(f"[System] 检测到当前操作系统: {self.os_type}")
+        self.bitrate = bitrate
+        self.telemetry = None  # TelemetryReader，挂上后统计发送帧和指令->反馈延迟
+        self._last_sent = None
+
+    def open(self, channel=None, interface=None):
+        """打开 CAN 总线并发送使能帧；不指定时按平台选择 (Linux: socketcan can0，其它: virtual)"""
+        log.info("检测到当前操作系统: %s", self.os_type)
 
         try:
-            if self.os_type == 'Linux':
+            if interface is None and self.os_type == 'Linux':
                 # 生产环境：使用 SocketCAN
-                self.bus = can.interface.Bus(channel=channel, bustype='socketcan', bitrate=bitrate)
-                print(f"[Driver] Linux SocketCAN initialized on {channel}")
-            else:
+                channel = channel or 'can0'
+                self.bus = can.interface.Bus(channel=channel, interface='socketcan', bitrate=self.bitrate)
+                log_driver.info("Linux SocketCAN initialized on %s", channel)
+            elif interface is None or interface == 'virtual':
                 # 开发环境 (Mac/Win)：使用 Virtual 虚拟总线
-                # 这种模式下，数据只会在内存里转圈，不会报错，适合调试逻辑
-                self.bus = can.interface.Bus(channel='virtual_channel', bustype='virtual')
-                print(f"[Driver] Mac/Win Virtual CAN initialized (模拟模式)")
+                # 这种模式下，数据只会在内存里转圈，不会报错，适合调试逻辑 (--sim 时另一端是模拟底盘)
+                self.bus = can.interface.Bus(channel=channel or 'virtual_channel', interface='virtual')
+                log_driver.info("Virtual CAN initialized (模拟模式)")
+            else:
+                self.bus = can.interface.Bus(channel=channel, interface=interface, bitrate=self.bitrate)
+                log_driver.info("%s CAN initialized on %s", interface, channel)
             
             # 发送使能指令
             self.enable_control()
             
         except Exception as e:
-            print(f"[Driver] ⚠️ CAN Init Warning: {e}")
-            print("[Driver] 将运行在纯模拟模式 (无 CAN 对象)")
+            log_driver.warning("⚠️ CAN Init Warning: %s", e)
+            log_driver.warning("将运行在纯模拟模式 (无 CAN 对象)")
             self.bus = None
 
     def enable_control(self):
         if not self.bus: return
-        msg = can.Message(arbitration_id=0x421, data=[0x01, 0, 0, 0, 0, 0, 0, 0], is_extended_id=False)
+        msg = can.Message(arbitration_id=proto.ID_CONTROL_MODE, data=proto.encode_control_mode(), is_extended_id=False)
         try:
             self.bus.send(msg)
-            print("[Driver] >> 发送使能帧: ID=0x421 Data=01... (Mac上只显示不真发)")
+            if self.telemetry:
+                self.telemetry.on_frame_sent(msg.dlc)
+            log_driver.info(">> 发送使能帧: ID=0x421 Data=01... (Mac上只显示不真发)")
         except can.CanError as e:
-            print(f"[Driver] Enable Failed: {e}")
+            log_driver.error("Enable Failed: %s", e)
+
+    def clamp(self, linear_x, angular_z):
+        return (max(-self.MAX_LINEAR, min(self.MAX_LINEAR, linear_x)),
+                max(-self.MAX_ANGULAR, min(self.MAX_ANGULAR, angular_z)))
 
     def send_motion_command(self, linear_x, angular_z):
         # 1. 限制幅度
-        linear_x = max(-1.5, min(1.5, linear_x))
-        angular_z = max(-1.0, min(1.0, angular_z))
+        linear_x, angular_z = self.clamp(linear_x, angular_z)
 
         # 2. 协议打包
-        v_mm_s = int(linear_x * 1000)
-        w_mrad_s = int(angular_z * 1000)
-        payload = struct.pack('>hh', v_mm_s, w_mrad_s) + b'\x00\x00\x00\x00'
+        # 指令帧里是 float32 (0.7 -> 0.69999998)，先四舍五入再取整
+        v_mm_s = int(round(linear_x * 1000))
+        w_mrad_s = int(round(angular_z * 1000))
+        payload = proto.encode_motion_cmd(v_mm_s, w_mrad_s)
 
-        # 3. 发送
+        # 3. 发送 (控制循环每个节拍都会调用，只在数值变化时记日志，且限流)
+        changed = (v_mm_s, w_mrad_s) != self._last_sent
+        self._last_sent = (v_mm_s, w_mrad_s)
         if self.bus:
-            msg = can.Message(arbitration_id=0x111, data=payload, is_extended_id=False)
+            msg = can.Message(arbitration_id=proto.ID_MOTION_CMD, data=payload, is_extended_id=False)
             try:
                 self.bus.send(msg)
-                # 打印出来方便你在 Mac 上看到效果
-                print(f"[Driver] >> CAN发送: V={linear_x} m/s, W={angular_z} rad/s")
-            except can.CanError:
-                print("[Driver] Send Error")
-        else:
-            print(f"[Mock] 虚拟驱动执行: V={linear_x}, W={angular_z}")
+                if self.telemetry:
+                    self.telemetry.on_command_sent(msg.dlc, v_mm_s / 1000.0, w_mrad_s / 1000.0)
+                if changed:
+                    log_driver.info(">> CAN发送: V=%.3f m/s, W=%.3f rad/s", linear_x, angular_z,
+                                    extra={"throttle": 0.2})
+            except can.CanError as e:
+                log_driver.error("Send Error: %s", e, extra={"throttle": 1.0})
+        elif changed:
+            log_driver.info("[Mock] 虚拟驱动执行: V=%.3f, W=%.3f", linear_x, angular_z,
+                            extra={"throttle": 0.2})
 
     def stop(self):
         self.send_motion_command(0, 0)
 
 # ================= 业务逻辑 =================
 driver = TracerDriver()
-last_cmd_time = time.time()
+# 底盘反馈 (状态/里程计) 由 python-can Notifier 后台线程接收解码，总线打开后创建
+telemetry = None
+sim = None  # --sim: 进程内的模拟底盘
+
+# 控制循环是 CAN 总线的唯一写入者，其它线程只投递设定值
+shaper = TrajectoryShaper(LINEAR_ACCEL, LINEAR_JERK, ANGULAR_ACCEL, ANGULAR_JERK,
+                          max_linear=TracerDriver.MAX_LINEAR, max_angular=TracerDriver.MAX_ANGULAR)
+control = ControlLoop(driver, CONTROL_HZ, shaper)
+clock = ClockSync(MQTT_TOPIC_CLOCK, MQTT_ID)
+# 积压/乱序的旧指令在这里被过滤，不会送到控制循环
+coalescer = CommandCoalescer(MAX_CMD_AGE, clock)
 
 # 修复 DeprecationWarning: 使用 VERSION2
 def on_connect(client, userdata, flags, rc, properties=None):
     if rc == 0:
-        print(f"✅ [MQTT] 连接成功! 正在监听: {MQTT_TOPIC_CMD}")
+        log_mqtt.info("✅ 连接成功! 正在监听: %s", MQTT_TOPIC_CMD)
         client.subscribe(MQTT_TOPIC_CMD)
+        clock.subscribe(client)
+        cmd_codec.advertise(client, MQTT_TOPIC_CMD, MQTT_ID)
     else:
-        print(f"❌ 连接失败 code: {rc}")
+        log_mqtt.error("❌ 连接失败 code: %s", rc)
+
+def dump_msg(msg):
+    """调试用: 完整转储一条 MQTT 消息 (只在 --debug 时调用)"""
+    log_mqtt.debug("msg object: %s type: %s", msg, type(msg))
+    log_mqtt.debug("topic: %s qos: %s retain: %s mid: %s",
+                   getattr(msg, 'topic', None), getattr(msg, 'qos', None),
+                   getattr(msg, 'retain', None), getattr(msg, 'mid', None))
+    raw = msg.payload
+    log_mqtt.debug("payload (raw): %r", raw)
+    if isinstance(raw, (bytes, bytearray)):
+        log_mqtt.debug("payload (utf-8): %s", raw.decode('utf-8', errors='replace'))
+    if hasattr(msg, 'properties'):
+        log_mqtt.debug("properties: %s", msg.properties)
+    log_mqtt.debug("available attrs: %s", [a for a in dir(msg) if not a.startswith('_')])
 
 def on_message(client, userdata, msg):
-    global last_cmd_time
     try:
-        print("[MQTT] msg object:", msg)
-        print("[MQTT] type:", type(msg))
-        print("[MQTT] topic:", getattr(msg, 'topic', None))
-        print("[MQTT] qos:", getattr(msg, 'qos', None), "retain:", getattr(msg, 'retain', None), "mid:", getattr(msg, 'mid', None))
-        try:
-            raw = msg.payload
-            print("[MQTT] payload (raw):", raw)
-            if isinstance(raw, (bytes, bytearray)):
-                print("[MQTT] payload (utf-8):", raw.decode('utf-8', errors='replace'))
-        except Exception as e:
-            print("[MQTT] payload read error:", e)
-        if hasattr(msg, 'properties'):
-            print("[MQTT] properties:", msg.properties)
-        print("[MQTT] available attrs:", [a for a in dir(msg) if not a.startswith('_')])
-        parsed_payload = json.loads(msg.payload.decode())
-        v = float(parsed_payload.get('v', 0.0))
-        w = float(parsed_payload.get('w', 0.0))
+        if log_mqtt.isEnabledFor(logging.DEBUG):
+            dump_msg(msg)
+        cmd = cmd_codec.decode(msg.payload)
+        if not coalescer.offer(cmd):
+            log_mqtt.debug("丢弃旧指令 seq=%d (%s)", cmd.seq, coalescer.describe())
+            return
+
+        # 先喂狗再投递: 正在执行的超时停车看到 kick 就不再停车，否则它的停车会被这条指令覆盖
+        # 停车指令不上膛: 控制端停车时只按 idle 频率 (可能低于超时) 重发，
+        # 否则看门狗会每个空闲周期超时/恢复一次
+        if cmd.v == 0.0 and cmd.w == 0.0:
+            watchdog.disarm()
+        else:
+            watchdog.kick()
+        control.submit(cmd.v, cmd.w, urgent=bool(cmd.flags & cmd_codec.FLAG_ESTOP))
 
-        driver.send_motion_command(v, w)
-        last_cmd_time = time.time()
+        if cmd.ts:
+            latency_ms = clock.latency(cmd.ts) * 1000
+            log_mqtt.info("指令 v=%.2f w=%.2f 延迟 %.2f ms (%s)%s", cmd.v, cmd.w, latency_ms, cmd.encoding,
+                          "" if clock.synced else " (时钟未同步)", extra={"throttle": 1.0})
 
     except Exception as e:
-        print(f"[MQTT] Error: {e}")
+        log_mqtt.error("Error: %s", e, extra={"throttle": 1.0})
 
-def watchdog_task():
+def on_watchdog_expire(generation):
+    # 只在超时那一刻触发一次，不再每 100ms 刷一帧停车；回调期间新指令已经到了就不停
+    if not watchdog.if_still_expired(generation, lambda: control.submit(0.0, 0.0, urgent=True)):
+        return
+    log.warning("[Watchdog] 信号超时 (%.0fms)，停车 (第 %d 次)", watchdog.timeout * 1000, watchdog.fired)
+
+def on_watchdog_rearm():
+    log.info("[Watchdog] 指令恢复")
+
+watchdog = DeadlineWatchdog(WATCHDOG_TIMEOUT, on_watchdog_expire, on_watchdog_rearm)
+
+WATCHDOG_STATES = {IDLE: 0, ARMED: 1, EXPIRED: 2}
+
+def feedback_value(record_type, attr):
+    """遥测数据源: 取底盘反馈缓存里的一个字段，没有反馈时返回 None (不上报)"""
+    def source():
+        record = telemetry.get(record_type) if telemetry else None
+        return getattr(record, attr) if record else None
+    return source
+
+def setup_uplink(client, window, rate_args):
+    uplink = TelemetryUplink(client, MQTT_TOPIC_TELEMETRY, window)
+    uplink.add_source("cmd_v", lambda: control.output[0])
+    uplink.add_source("cmd_w", lambda: control.output[1])
+    uplink.add_source("fb_v", feedback_value(proto.MotionState, "linear"))
+    uplink.add_source("fb_w", feedback_value(proto.MotionState, "angular"))
+    uplink.add_source("odom_l", feedback_value(proto.Odometry, "left_m"))
+    uplink.add_source("odom_r", feedback_value(proto.Odometry, "right_m"))
+    uplink.add_source("battery_v", feedback_value(proto.SystemState, "battery_v"))
+    uplink.add_source("error_code", feedback_value(proto.SystemState, "error_code"))
+    uplink.add_source("can_rx", lambda: telemetry.rx_frames if telemetry else None)
+    uplink.add_source("can_tx", lambda: telemetry.tx_frames if telemetry else None)
+    uplink.add_source("watchdog", lambda: WATCHDOG_STATES[watchdog.state])
+    for name, hz in rate_args:
+        uplink.set_rate(name, hz)
+    return uplink
+
+def parse_rate(text):
+    """argparse 类型: 字段名=频率 -> (字段名, 频率)"""
+    name, sep, hz = text.partition("=")
+    try:
+        if sep and name in FIELDS_BY_NAME:
+            return name, float(hz)
+    except ValueError:
+        pass
+    raise argparse.ArgumentTypeError(f"格式为 字段=Hz，字段可选: {', '.join(FIELDS_BY_NAME)}")
+
+def telemetry_log_task():
+    """周期输出一行底盘反馈摘要"""
     while True:
-        if time.time() - last_cmd_time > 0.5:
-            # print("[Watchdog] 信号超时，停车...") # 刷屏太快先注释掉
-            driver.stop()
-        time.sleep(0.1)
+        time.sleep(TELEMETRY_LOG_INTERVAL)
+        log.info("[Telemetry] %s", telemetry.describe())
 
 # ================= 主程序 =================
 if __name__ == "__main__":
-    t = threading.Thread(target=watchdog_task)
-    t.daemon = True
-    t.start()
+    parser = argparse.ArgumentParser(description="Tracer 机器人 MQTT -> CAN 代理")
+    parser.add_argument("--broker", default=MQTT_BROKER)
+    parser.add_argument("--port", type=int, default=MQTT_PORT)
+    parser.add_argument("--can-channel", default=None, help="CAN 通道 (默认 Linux: can0，其它: virtual_channel，--sim: tracer_sim)")
+    parser.add_argument("--can-interface", default=None, help="python-can 接口，如 socketcan / virtual")
+    parser.add_argument("--sim", action="store_true", help="在 virtual 总线上启动进程内的模拟底盘")
+    parser.add_argument("--rate", type=float, default=CONTROL_HZ, help="控制循环频率 Hz")
+    parser.add_argument("--watchdog-timeout", type=float, default=WATCHDOG_TIMEOUT, help="指令超时 s")
+    parser.add_argument("--max-cmd-age", type=float, default=MAX_CMD_AGE, help="指令最大年龄 s (0=不检查)")
+    parser.add_argument("--accel", type=float, default=LINEAR_ACCEL, help="线加速度上限 m/s^2")
+    parser.add_argument("--jerk", type=float, default=LINEAR_JERK, help="线加加速度上限 m/s^3")
+    parser.add_argument("--no-ramp", action="store_true", help="关闭速度整形，设定值直接下发")
+    parser.add_argument("--telemetry-window", type=float, default=TELEMETRY_WINDOW, help="遥测打包窗口 s")
+    parser.add_argument("--telemetry-rate", type=parse_rate, action="append", default=[], metavar="FIELD=HZ",
+                        help="单个遥测字段的采样频率 (0=关闭)，可重复")
+    parser.add_argument("--debug", action="store_true", default=DEBUG, help="DEBUG 级别并逐条转储 MQTT 消息")
+    args = parser.parse_args()
+    setup_logging(logging.DEBUG if args.debug else logging.INFO)
+
+    if args.sim:
+        from tracer_sim import TracerSim
+        args.can_interface = "virtual"
+        args.can_channel = args.can_channel or "tracer_sim"
+        # 模拟底盘先上总线，才能收到驱动的使能帧
+        sim = TracerSim(args.can_channel, "virtual").start()
+    driver.open(args.can_channel, args.can_interface)
+    if driver.bus:
+        telemetry = TelemetryReader(driver.bus, driver.bitrate)
+        driver.telemetry = telemetry
+
+    control.set_rate(args.rate)
+    shaper.linear.max_accel = shaper.linear.max_decel = args.accel
+    shaper.linear.max_jerk = args.jerk
+    if args.no_ramp:
+        control.shaper = None
+    control.start()
+
+    if telemetry:
+        telemetry.start()
+        threading.Thread(target=telemetry_log_task, daemon=True).start()
+
+    watchdog.timeout = args.watchdog_timeout
+    watchdog.start()
+
+    coalescer.max_age = args.max_cmd_age
 
     # 修复 Warning: 显式指定 API 版本
     client = mqtt.Client(mqtt.CallbackAPIVersion.VERSION2, client_id=MQTT_ID)
     client.on_connect = on_connect
     client.on_message = on_message
+    clock.attach(client)
+    cmd_codec.clear_caps_on_disconnect(client, MQTT_TOPIC_CMD)
+
+    uplink = setup_uplink(client, args.telemetry_window, args.telemetry_rate)
 
-    print(f"[System] Connecting to {MQTT_BROKER}...")
+    log.info("Connecting to %s...", args.broker)
     try:
-        client.connect(MQTT_BROKER, MQTT_PORT, 60)
+        client.connect(args.broker, args.port, 60)
+        clock.start()
+        uplink.start()
         client.loop_forever()
     except KeyboardInterrupt:
-        print("\n程序退出")
+        log.info("程序退出")
     except Exception as e:
-        print(f"连接错误: {e}")
+        log.error("连接错误: %s", e)
+    finally:
+        uplink.stop()
+        watchdog.stop()
+        control.stop()
+        log.info("[Control] %s", control.describe())
+        log.info("[Watchdog] %s", watchdog.describe())
+        log.info("[Coalesce] %s", coalescer.describe())
+        log.info("[Uplink] %s", uplink.describe())
+        if telemetry:
+            telemetry.stop()
+            log.info("[Telemetry] %s", telemetry.describe())
+        if sim:
+            sim.stop()
+            log.info("[Sim] %s", sim.describe())
@@ -0,0 +1,222 @@
+"""机器人 -> MQTT 遥测上行: 按字段限频采样，按窗口打包，增量编码
+
+逐帧上报底盘状态 (50Hz 指令回显 + 每一帧 CAN 反馈) 会把 Broker 淹掉。这里每个
+字段有自己的采样频率，样本先攒在本地，每个窗口 (默认 1 秒) 打成一条二进制
+消息发出去，一条消息里装几十个样本。
+
+批次格式 (大端):
+
+    | magic "TLM1"(4) | batch_seq(4) | t0(8, clock_sync.now()) | n_fields(1) |
+    每个字段: | field_id(1) | n(varint) | n 个样本: dt_ms(varint) value(zigzag varint) |
+
+- 值按字段的 scale 量化成整数；第一个样本存绝对值，之后存相对上一个样本的差
+- dt_ms: 第一个样本相对 t0，之后相对上一个样本
+- 变化缓慢的量 (电池、里程、帧计数) 差值很小，一个样本通常只占 2~3 字节
+"""
+import struct
+import threading
+import time
+from collections import namedtuple
+
+from common.clock_sync import now
+
+MAGIC = b"TLM1"
+BATCH_HEADER = struct.Struct(">4sIdB")
+
+# fid: 线上的字段编号 (不要改动已有编号)；scale: 量化倍数；rate: 默认采样频率 Hz
+TelemetryField = namedtuple("TelemetryField", "fid name scale rate")
+
+FIELDS = [
+    TelemetryField(1, "cmd_v", 1000, 10.0),     # 控制循环实际下发的线速度 m/s
+    TelemetryField(2, "cmd_w", 1000, 10.0),     # 角速度 rad/s
+    TelemetryField(3, "fb_v", 1000, 10.0),      # 底盘反馈线速度 m/s
+    TelemetryField(4, "fb_w", 1000, 10.0),
+    TelemetryField(5, "odom_l", 1000, 5.0),     # 左轮里程 m
+    TelemetryField(6, "odom_r", 1000, 5.0),
+    TelemetryField(7, "battery_v", 10, 0.2),    # 电池电压 V
+    TelemetryField(8, "error_code", 1, 1.0),
+    TelemetryField(9, "can_rx", 1, 1.0),        # 累计收到的 CAN 帧
+    TelemetryField(10, "can_tx", 1, 1.0),
+    TelemetryField(11, "watchdog", 1, 2.0),     # 0=idle 1=armed 2=expired
+]
+FIELDS_BY_NAME = {f.name: f for f in FIELDS}
+FIELDS_BY_ID = {f.fid: f for f in FIELDS}
+
+
+# ================= varint =================
+def zigzag(n):
+    return (n << 1) ^ (n >> 63)
+
+
+def unzigzag(n):
+    return (n >> 1) ^ -(n & 1)
+
+
+def write_varint(buf, n):
+    while n >= 0x80:
+        buf.append((n & 0x7F) | 0x80)
+        n >>= 7
+    buf.append(n)
+
+
+def read_varint(data, pos):
+    result = shift = 0
+    while True:
+        b = data[pos]
+        pos += 1
+        result |= (b & 0x7F) << shift
+        if not b & 0x80:
+            return result, pos
+        shift += 7
+
+
+# ================= 编解码 =================
+def encode_batch(seq, t0, samples):
+    """samples: {fid: [(t, 量化后的整数), ...]}"""
+    buf = bytearray(BATCH_HEADER.pack(MAGIC, seq & 0xFFFFFFFF, t0, len(samples)))
+    for fid, points in samples.items():
+        buf.append(fid)
+        write_varint(buf, len(points))
+        prev_t, prev_q = t0, 0
+        for t, q in points:
+            # 按量化后的时间推进，解码端逐个累加时误差不会累积
+            dt_ms = max(0, int(round((t - prev_t) * 1000)))
+            write_varint(buf, dt_ms)
+            write_varint(buf, zigzag(q - prev_q))
+            prev_t += dt_ms / 1000.0
+            prev_q = q
+    return bytes(buf)
+
+
+def decode_batch(payload):
+    """返回 (batch_seq, t0, {字段名: [(ts, value), ...]})；格式错误抛 ValueError"""
+    if len(payload) < BATCH_HEADER.size or payload[:4] != MAGIC:
+        raise ValueError("不是遥测批次")
+    _, seq, t0, n_fields = BATCH_HEADER.unpack_from(payload)
+    pos = BATCH_HEADER.size
+    result = {}
+    try:
+        for _ in range(n_fields):
+            fid = payload[pos]
+            pos += 1
+            field = FIELDS_BY_ID.get(fid, TelemetryField(fid, f"field_{fid}", 1, 0.0))
+            n, pos = read_varint(payload, pos)
+            points = []
+            t_ms, q = 0, 0
+            for _ in range(n):
+                dt, pos = read_varint(payload, pos)
+                dq, pos = read_varint(payload, pos)
+                t_ms += dt
+                q += unzigzag(dq)
+                points.append((t0 + t_ms / 1000.0, q / field.scale))
+            result[field.name] = points
+    except IndexError:
+        raise ValueError("遥测批次被截断")
+    return seq, t0, result
+
+
+# ================= 上行发布 =================
+class TelemetryUplink:
+    """按字段限频采样，每个窗口发布一条批次消息
+
+    add_source(name, fn): fn() 返回当前值，返回 None 表示暂时没有数据 (跳过该样本)。
+    采样和发布都在本对象自己的线程里，不占用控制循环和 MQTT 回调。
+    """
+
+    def __init__(self, client, topic, window=1.0, rates=None, qos=0):
+        self.client = client
+        self.topic = topic
+        self.window = window
+        self.qos = qos
+        self.rates = {f.name: f.rate for f in FIELDS}
+        self.rates.update(rates or {})
+
+        self._sources = {}
+        self._next_sample = {}
+        self._samples = {}
+        self._seq = 0
+        self._stop_event = threading.Event()
+        self._thread = None
+
+        # 统计
+        self.batches = 0
+        self.samples = 0
+        self.bytes = 0
+        self.errors = 0
+
+    def add_source(self, name, fn):
+        if name not in FIELDS_BY_NAME:
+            raise ValueError(f"未知遥测字段: {name}")
+        self._sources[name] = fn
+
+    def set_rate(self, name, hz):
+        """hz=0 关闭该字段"""
+        if name not in FIELDS_BY_NAME:
+            raise ValueError(f"未知遥测字段: {name}")
+        self.rates[name] = hz
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name="telemetry-uplink", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self, timeout=1.0):
+        self._stop_event.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+        self.flush()
+
+    def sample(self, t_mono=None):
+        """采样所有到期的字段，返回下一次采样的单调时间"""
+        t_mono = time.monotonic() if t_mono is None else t_mono
+        t_wall = now()
+        next_t = t_mono + self.window
+        for name, fn in self._sources.items():
+            hz = self.rates.get(name, 0)
+            if hz <= 0:
+                continue
+            due = self._next_sample.get(name, t_mono)
+            if t_mono >= due:
+                try:
+                    value = fn()
+                except Exception:
+                    value = None
+                    self.errors += 1
+                if value is not None:
+                    field = FIELDS_BY_NAME[name]
+                    self._samples.setdefault(field.fid, []).append((t_wall, int(round(value * field.scale))))
+                    self.samples += 1
+                # 按固定步长推进，落后太多就重新对齐
+                due = max(due + 1.0 / hz, t_mono)
+                self._next_sample[name] = due
+            next_t = min(next_t, due)
+        return next_t
+
+    def flush(self):
+        """把已攒的样本打成一条消息发出去"""
+        if not self._samples:
+            return None
+        samples, self._samples = self._samples, {}
+        t0 = min(points[0][0] for points in samples.values())
+        payload = encode_batch(self._seq, t0, samples)
+        self._seq += 1
+        self.batches += 1
+        self.bytes += len(payload)
+        return self.client.publish(self.topic, payload, qos=self.qos)
+
+    def _run(self):
+        next_flush = time.monotonic() + self.window
+        while not self._stop_event.is_set():
+            t = time.monotonic()
+            if t >= next_flush:
+                self.flush()
+                next_flush += self.window
+                if next_flush < t:
+                    next_flush = t + self.window
+            next_sample = self.sample(t)
+            self._stop_event.wait(max(0.0, min(next_sample, next_flush) - time.monotonic()))
+
+    def describe(self):
+        per_sample = self.bytes / self.samples if self.samples else 0.0
+        return (f"batches={self.batches} samples={self.samples} bytes={self.bytes}"
+                f" ({per_sample:.1f} B/样本, 逐条发布需 {self.samples} 条消息)")
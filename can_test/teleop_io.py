@@ -0,0 +1,144 @@
+"""遥控端的非阻塞 I/O: 终端按键 + MQTT socket 放进同一个 selectors 事件循环
+
+原来的 get_key() 每次按键都要 tcgetattr / setraw / 阻塞 read(1) / 恢复终端，
+主循环除了等按键什么都干不了。这里终端只在进入时切一次 cbreak 模式，按键和
+paho 的 socket 一起交给 selector 等待，心跳、遥测显示等定时任务也在同一个循环里跑。
+"""
+import os
+import selectors
+import sys
+import termios
+import time
+import tty
+
+# 方向键的转义序列 -> 统一映射成 WASD
+ESCAPE_KEYS = {
+    "\x1b[A": "w",
+    "\x1b[B": "s",
+    "\x1b[D": "a",
+    "\x1b[C": "d",
+}
+
+
+class TerminalKeyboard:
+    """进入时切换到 cbreak (不回显、逐字符、保留 Ctrl+C)，退出时恢复终端"""
+
+    def __init__(self, stream=None):
+        self.stream = stream or sys.stdin
+        self.fd = self.stream.fileno()
+        self._old = None
+
+    def __enter__(self):
+        self._old = termios.tcgetattr(self.fd)
+        tty.setcbreak(self.fd)
+        return self
+
+    def __exit__(self, *exc):
+        if self._old is not None:
+            termios.tcsetattr(self.fd, termios.TCSADRAIN, self._old)
+        return False
+
+    def fileno(self):
+        return self.fd
+
+    def read_keys(self):
+        """fd 可读时调用，一次取走缓冲里所有按键；stdin 已关闭时抛 EOFError"""
+        raw = os.read(self.fd, 64)
+        if not raw:
+            # EOF 之后 fd 会一直可读，不处理就是空转
+            raise EOFError("stdin closed")
+        data = raw.decode("utf-8", errors="ignore")
+        keys = []
+        i = 0
+        while i < len(data):
+            seq = data[i:i + 3]
+            if seq in ESCAPE_KEYS:
+                keys.append(ESCAPE_KEYS[seq])
+                i += 3
+            else:
+                keys.append(data[i].lower())
+                i += 1
+        return keys
+
+
+class TeleopLoop:
+    """selectors 事件循环: 终端按键 + paho 外部 socket 驱动 + 定时任务
+
+    paho 不启动自己的网络线程 (不调用 loop_start)，由这里按 socket 可读/可写
+    调用 loop_read / loop_write，并每秒调用一次 loop_misc 处理心跳保活。
+    """
+
+    def __init__(self, client, keyboard, on_key, reconnect_interval=2.0):
+        self.client = client
+        self.keyboard = keyboard
+        self.on_key = on_key
+        self.reconnect_interval = reconnect_interval
+        self.timers = []  # [下一次时间, 回调]; 回调返回下一次的单调时间
+
+        self.selector = selectors.DefaultSelector()
+        self.selector.register(keyboard, selectors.EVENT_READ, "key")
+        self._sock = None
+        self._sock_events = 0
+        self._running = False
+
+    def add_timer(self, callback, first=None):
+        """callback() 返回下一次触发的 time.monotonic() 时间"""
+        self.timers.append([first if first is not None else time.monotonic(), callback])
+
+    def stop(self):
+        self._running = False
+
+    def _sync_socket(self):
+        """paho 重连后 socket 会变，按需更新注册和关心的事件"""
+        sock = self.client.socket()
+        events = 0
+        if sock is not None:
+            events = selectors.EVENT_READ | (selectors.EVENT_WRITE if self.client.want_write() else 0)
+        if sock is not self._sock:
+            if self._sock is not None:
+                self.selector.unregister(self._sock)
+            if sock is not None:
+                self.selector.register(sock, events, "mqtt")
+            self._sock, self._sock_events = sock, events
+        elif sock is not None and events != self._sock_events:
+            self.selector.modify(sock, events, "mqtt")
+            self._sock_events = events
+
+    def _misc(self):
+        if self.client.socket() is None:
+            try:
+                self.client.reconnect()
+            except OSError:
+                return time.monotonic() + self.reconnect_interval
+        self.client.loop_misc()
+        return time.monotonic() + 1.0
+
+    def run(self):
+        self._running = True
+        self.add_timer(self._misc)
+        while self._running:
+            self._sync_socket()
+            next_t = min(t[0] for t in self.timers)
+            timeout = max(0.0, next_t - time.monotonic())
+
+            for key, mask in self.selector.select(timeout):
+                if key.data == "key":
+                    try:
+                        keys = self.keyboard.read_keys()
+                    except EOFError:
+                        # 没有输入源了: 退出循环，由调用方发最后的急停
+                        self.selector.unregister(self.keyboard)
+                        self._running = False
+                        break
+                    for ch in keys:
+                        self.on_key(ch)
+                elif key.data == "mqtt":
+                    if mask & selectors.EVENT_READ:
+                        self.client.loop_read()
+                    if mask & selectors.EVENT_WRITE:
+                        self.client.loop_write()
+
+            now = time.monotonic()
+            for timer in self.timers:
+                if now >= timer[0]:
+                    timer[0] = timer[1]()
@@ -0,0 +1,98 @@
+"""AgileX Tracer CAN 协议 (V2，500kbps，标准帧，大端)
+
+控制帧 (上位机 -> 底盘):
+    0x421 控制模式设置   byte0 = 0x01 进入 CAN 指令控制
+    0x111 运动控制指令   int16 线速度 mm/s, int16 角速度 0.001rad/s
+
+反馈帧 (底盘 -> 上位机):
+    0x211 系统状态       车体状态, 控制模式, 电池电压 0.1V, 故障码, 计数
+    0x221 运动状态       int16 线速度 mm/s, int16 角速度 0.001rad/s
+    0x251~0x252 电机高速信息  int16 转速 RPM, int16 电流 0.1A, int32 脉冲数
+    0x261~0x262 电机低速信息  uint16 驱动器电压 0.1V, int16 驱动器温度, int8 电机温度, 驱动器状态
+    0x311 里程计         int32 左轮里程 mm, int32 右轮里程 mm
+"""
+import struct
+from collections import namedtuple
+
+ID_CONTROL_MODE = 0x421
+ID_MOTION_CMD = 0x111
+
+ID_SYSTEM_STATE = 0x211
+ID_MOTION_STATE = 0x221
+ID_MOTOR_HS_BASE = 0x251  # + 电机序号 (0, 1)
+ID_MOTOR_LS_BASE = 0x261
+ID_ODOMETRY = 0x311
+MOTOR_COUNT = 2
+
+CONTROL_MODE_CAN = 0x01
+
+# 反馈记录，ts 为帧时间戳 (python-can Message.timestamp)
+SystemState = namedtuple("SystemState", "ts vehicle_state control_mode battery_v error_code count")
+MotionState = namedtuple("MotionState", "ts linear angular")
+MotorHighSpeed = namedtuple("MotorHighSpeed", "ts motor_id rpm current_a pulse_count")
+MotorLowSpeed = namedtuple("MotorLowSpeed", "ts motor_id driver_voltage driver_temp motor_temp driver_state")
+Odometry = namedtuple("Odometry", "ts left_m right_m")
+
+_SYSTEM = struct.Struct(">BBHHxB")
+_MOTION = struct.Struct(">hh4x")
+_MOTOR_HS = struct.Struct(">hhi")
+_MOTOR_LS = struct.Struct(">HhbB2x")
+_ODOM = struct.Struct(">ii")
+
+
+# ================= 控制帧 =================
+def encode_control_mode(mode=CONTROL_MODE_CAN):
+    return bytes([mode, 0, 0, 0, 0, 0, 0, 0])
+
+
+def encode_motion_cmd(v_mm_s, w_mrad_s):
+    return _MOTION.pack(v_mm_s, w_mrad_s)
+
+
+def decode_motion_cmd(data):
+    """返回 (v_mm_s, w_mrad_s)"""
+    return _MOTION.unpack_from(bytes(data).ljust(8, b"\x00"))
+
+
+# ================= 反馈帧 =================
+def encode_system_state(vehicle_state, control_mode, battery_v, error_code, count):
+    return _SYSTEM.pack(vehicle_state, control_mode, int(round(battery_v * 10)), error_code, count & 0xFF)
+
+
+def encode_motion_state(linear, angular):
+    return _MOTION.pack(int(round(linear * 1000)), int(round(angular * 1000)))
+
+
+def encode_motor_hs(rpm, current_a, pulse_count):
+    return _MOTOR_HS.pack(int(rpm), int(round(current_a * 10)), int(pulse_count))
+
+
+def encode_motor_ls(driver_voltage, driver_temp, motor_temp, driver_state):
+    return _MOTOR_LS.pack(int(round(driver_voltage * 10)), int(driver_temp), int(motor_temp), driver_state)
+
+
+def encode_odometry(left_m, right_m):
+    return _ODOM.pack(int(round(left_m * 1000)), int(round(right_m * 1000)))
+
+
+def decode_feedback(arbitration_id, data, ts):
+    """把一帧反馈解码成对应的记录，不认识的帧返回 None"""
+    data = bytes(data)
+    if len(data) < 8:
+        return None
+    if arbitration_id == ID_MOTION_STATE:
+        v, w = _MOTION.unpack(data)
+        return MotionState(ts, v / 1000.0, w / 1000.0)
+    if arbitration_id == ID_ODOMETRY:
+        left, right = _ODOM.unpack(data)
+        return Odometry(ts, left / 1000.0, right / 1000.0)
+    if arbitration_id == ID_SYSTEM_STATE:
+        state, mode, volt, err, count = _SYSTEM.unpack(data)
+        return SystemState(ts, state, mode, volt / 10.0, err, count)
+    if ID_MOTOR_HS_BASE <= arbitration_id < ID_MOTOR_HS_BASE + MOTOR_COUNT:
+        rpm, current, pulses = _MOTOR_HS.unpack(data)
+        return MotorHighSpeed(ts, arbitration_id - ID_MOTOR_HS_BASE, rpm, current / 10.0, pulses)
+    if ID_MOTOR_LS_BASE <= arbitration_id < ID_MOTOR_LS_BASE + MOTOR_COUNT:
+        volt, dtemp, mtemp, dstate = _MOTOR_LS.unpack(data)
+        return MotorLowSpeed(ts, arbitration_id - ID_MOTOR_LS_BASE, volt / 10.0, dtemp, mtemp, dstate)
+    return None
@@ -0,0 +1,204 @@
+"""模拟 Tracer 底盘: 挂在 CAN 总线另一端，没有硬件也能跑通 MQTT -> CAN 全链路
+
+- 收到 0x421 (模式=CAN) 之后才执行 0x111 运动指令，和真车一样
+- 运动模型: 差速底盘，速度按一阶惯性 + 加速度上限跟随指令，超过 CMD_TIMEOUT
+  没收到运动指令自动停车 (真车的指令超时保护)
+- 按接近真车的频率发反馈: 运动状态 / 电机高速信息 50Hz，里程计 20Hz，
+  系统状态 / 电机低速信息 10Hz
+
+python-can 的 virtual 总线只在同一进程内互通，所以 robot_agent_tracer.py --sim
+会在进程内起一个模拟底盘；跨进程 (CI 上) 用 vcan:
+
+    sudo ip link add dev vcan0 type vcan && sudo ip link set up vcan0
+    python can_test/tracer_sim.py --channel vcan0 --interface socketcan
+    python can_test/robot_agent_tracer.py --can-channel vcan0 --can-interface socketcan
+"""
+import argparse
+import math
+import threading
+import time
+
+import can
+
+import tracer_protocol as proto
+
+TICK_HZ = 200.0
+CMD_TIMEOUT = 0.5      # 秒，超时没收到 0x111 就停车
+RESPONSE_TAU = 0.08    # 速度跟随的一阶时间常数 (秒)
+MAX_ACCEL = 1.5        # m/s^2，电机能给出的最大加速度
+MAX_ANG_ACCEL = 3.0    # rad/s^2
+TRACK_WIDTH = 0.52     # 轮距 m
+WHEEL_RADIUS = 0.075   # 驱动轮半径 m
+GEAR_RATIO = 40.0
+PULSES_PER_REV = 4096  # 电机编码器每转脉冲数
+
+# 反馈帧发送周期 (秒)
+FEEDBACK_PERIODS = {
+    "motion": 1 / 50.0,
+    "motor_hs": 1 / 50.0,
+    "odometry": 1 / 20.0,
+    "system": 1 / 10.0,
+    "motor_ls": 1 / 10.0,
+}
+
+
+class TracerSim:
+    def __init__(self, channel="virtual_channel", interface="virtual", bus=None):
+        self.bus = bus or can.Bus(channel=channel, interface=interface)
+        self._own_bus = bus is None
+        self._stop_event = threading.Event()
+        self._thread = None
+
+        # 车体状态
+        self.control_mode = 0  # 0=待机 (未使能)，1=CAN 指令控制
+        self.target = (0.0, 0.0)
+        self.linear = 0.0
+        self.angular = 0.0
+        self.wheel_dist = [0.0, 0.0]  # 左右轮累计里程 m
+        self.x = self.y = self.heading = 0.0
+        self.battery_v = 26.0
+        self._last_cmd_t = None
+        self._count = 0
+        self._next_feedback = {}
+
+        # 统计
+        self.rx_cmds = 0
+        self.ignored_cmds = 0  # 未使能时收到的运动指令
+        self.timeouts = 0
+        self.tx_frames = 0
+
+    # ---------- 生命周期 ----------
+    def start(self):
+        self._thread = threading.Thread(target=self.run, name="tracer-sim", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self, timeout=1.0):
+        self._stop_event.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+        if self._own_bus:
+            self.bus.shutdown()
+
+    def run(self):
+        period = 1.0 / TICK_HZ
+        next_t = time.monotonic()
+        while not self._stop_event.is_set():
+            # 收帧直到下一个节拍
+            while True:
+                remaining = next_t - time.monotonic()
+                msg = self.bus.recv(timeout=max(0.0, remaining))
+                if msg is None:
+                    break
+                self.on_frame(msg)
+            now = time.monotonic()
+            self.step(period, now)
+            self.send_feedback(now)
+            next_t += period
+            if next_t < now - period:
+                next_t = now  # 落后太多就重新对齐
+
+    # ---------- 指令 ----------
+    def on_frame(self, msg):
+        if msg.arbitration_id == proto.ID_CONTROL_MODE:
+            self.control_mode = msg.data[0] if msg.data else 0
+        elif msg.arbitration_id == proto.ID_MOTION_CMD:
+            if self.control_mode != proto.CONTROL_MODE_CAN:
+                self.ignored_cmds += 1
+                return
+            v_mm_s, w_mrad_s = proto.decode_motion_cmd(msg.data)
+            self.target = (v_mm_s / 1000.0, w_mrad_s / 1000.0)
+            self._last_cmd_t = time.monotonic()
+            self.rx_cmds += 1
+
+    # ---------- 运动模型 ----------
+    def step(self, dt, now):
+        if self._last_cmd_t is not None and now - self._last_cmd_t > CMD_TIMEOUT:
+            self.target = (0.0, 0.0)
+            self._last_cmd_t = None
+            self.timeouts += 1
+
+        alpha = 1.0 - math.exp(-dt / RESPONSE_TAU)
+        dv = (self.target[0] - self.linear) * alpha
+        dw = (self.target[1] - self.angular) * alpha
+        self.linear += max(-MAX_ACCEL * dt, min(MAX_ACCEL * dt, dv))
+        self.angular += max(-MAX_ANG_ACCEL * dt, min(MAX_ANG_ACCEL * dt, dw))
+
+        half_track = TRACK_WIDTH / 2.0
+        self.wheel_dist[0] += (self.linear - self.angular * half_track) * dt
+        self.wheel_dist[1] += (self.linear + self.angular * half_track) * dt
+        self.heading += self.angular * dt
+        self.x += self.linear * math.cos(self.heading) * dt
+        self.y += self.linear * math.sin(self.heading) * dt
+        # 电池缓慢掉电，跑起来掉得快一点
+        self.battery_v -= (2e-6 + 2e-5 * abs(self.linear)) * dt
+
+    def wheel_rpm(self, i):
+        wheel_speed = (self.linear + (1 if i else -1) * self.angular * TRACK_WIDTH / 2.0)
+        return wheel_speed / (2 * math.pi * WHEEL_RADIUS) * 60.0 * GEAR_RATIO
+
+    def wheel_pulses(self, i):
+        return int(self.wheel_dist[i] / (2 * math.pi * WHEEL_RADIUS) * GEAR_RATIO * PULSES_PER_REV)
+
+    # ---------- 反馈 ----------
+    def send_feedback(self, now):
+        for kind, period in FEEDBACK_PERIODS.items():
+            due = self._next_feedback.get(kind, now)
+            if now < due:
+                continue
+            self._next_feedback[kind] = max(due + period, now)
+            for arbitration_id, data in self.feedback_frames(kind):
+                self._send(arbitration_id, data)
+
+    def feedback_frames(self, kind):
+        if kind == "motion":
+            return [(proto.ID_MOTION_STATE, proto.encode_motion_state(self.linear, self.angular))]
+        if kind == "odometry":
+            return [(proto.ID_ODOMETRY, proto.encode_odometry(*self.wheel_dist))]
+        if kind == "system":
+            self._count += 1
+            return [(proto.ID_SYSTEM_STATE,
+                     proto.encode_system_state(0, self.control_mode, self.battery_v, 0, self._count))]
+        if kind == "motor_hs":
+            return [(proto.ID_MOTOR_HS_BASE + i,
+                     proto.encode_motor_hs(self.wheel_rpm(i), abs(self.linear) * 4.0, self.wheel_pulses(i)))
+                    for i in range(proto.MOTOR_COUNT)]
+        if kind == "motor_ls":
+            return [(proto.ID_MOTOR_LS_BASE + i,
+                     proto.encode_motor_ls(self.battery_v, 32, 35, 0))
+                    for i in range(proto.MOTOR_COUNT)]
+        return []
+
+    def _send(self, arbitration_id, data):
+        try:
+            self.bus.send(can.Message(arbitration_id=arbitration_id, data=data, is_extended_id=False))
+            self.tx_frames += 1
+        except can.CanError:
+            pass
+
+    def describe(self):
+        mode = "CAN" if self.control_mode == proto.CONTROL_MODE_CAN else "待机"
+        return (f"mode={mode} v={self.linear:+.3f} w={self.angular:+.3f}"
+                f" pose=({self.x:.2f}, {self.y:.2f}, {math.degrees(self.heading):.0f}°)"
+                f" rx_cmd={self.rx_cmds} ignored={self.ignored_cmds} timeouts={self.timeouts}"
+                f" tx={self.tx_frames}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="模拟 Tracer 底盘 (virtual / vcan)")
+    parser.add_argument("--channel", default="vcan0")
+    parser.add_argument("--interface", default="socketcan")
+    parser.add_argument("--report-interval", type=float, default=2.0, help="状态输出间隔 s")
+    args = parser.parse_args()
+
+    sim = TracerSim(args.channel, args.interface).start()
+    print(f"🚜 模拟底盘已启动: {args.interface}:{args.channel}")
+    try:
+        while True:
+            time.sleep(args.report_interval)
+            print(f"[Sim] {sim.describe()}")
+    except KeyboardInterrupt:
+        pass
+    finally:
+        sim.stop()
+        print(f"[Sim] {sim.describe()}")
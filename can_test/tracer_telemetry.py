@@ -0,0 +1,138 @@
+"""Tracer CAN 反馈接收: python-can Notifier 后台线程解码状态 / 里程计帧
+
+- latest: 每种反馈 (电机信息按电机区分) 的最新记录
+- history: 有界环形缓冲，保存最近的所有记录
+- 指令 -> 反馈延迟: 运动指令值变化后，到底盘运动反馈第一次跟上该值的时间
+- 总线负载: 收发帧按标准帧位数估算 (不含位填充，实际略高)
+
+只依赖 python-can 的 Listener 接口，虚拟总线 (virtual) 上同样可用。
+"""
+import threading
+import time
+from collections import deque
+
+import can
+
+import tracer_protocol as proto
+from common.latency_histogram import LatencyHistogram
+
+# 标准帧 (11bit ID) 除数据外的固定位数: SOF+ID+RTR+IDE+r0+DLC+CRC+ACK+EOF+帧间隔
+CAN_FRAME_OVERHEAD_BITS = 47
+
+
+def frame_bits(dlc):
+    return CAN_FRAME_OVERHEAD_BITS + 8 * dlc
+
+
+class TelemetryReader(can.Listener):
+    def __init__(self, bus, bitrate=500000, history=2000, match_tolerance=(0.01, 0.01)):
+        super().__init__()
+        self.bus = bus
+        self.bitrate = bitrate
+        self.match_tolerance = match_tolerance  # (m/s, rad/s)
+
+        self.latest = {}
+        self.history = deque(maxlen=history)
+        self._lock = threading.Lock()
+        self._notifier = None
+
+        # 计数
+        self.rx_frames = 0
+        self.tx_frames = 0
+        self.unknown_frames = 0
+        self.errors = 0
+        self._bits = 0
+        self._load_window = (time.monotonic(), 0)  # (窗口起点, 起点时的累计位数)
+        self.bus_load = 0.0
+
+        # 指令 -> 反馈延迟
+        self.cmd_to_fb = LatencyHistogram()  # 微秒
+        self._pending_cmds = deque(maxlen=256)  # (t_send, v, w)
+        self._last_cmd = None
+
+    # ---------- 生命周期 ----------
+    def start(self):
+        self._notifier = can.Notifier(self.bus, [self], timeout=0.1)
+        return self
+
+    def stop(self):
+        # Notifier.stop() 会回调每个 Listener 的 stop()，先置空避免递归
+        notifier, self._notifier = self._notifier, None
+        if notifier is not None:
+            notifier.stop()
+
+    # ---------- 接收 (Notifier 线程) ----------
+    def on_message_received(self, msg):
+        t_rx = time.monotonic()
+        self.rx_frames += 1
+        self._bits += frame_bits(msg.dlc)
+        record = proto.decode_feedback(msg.arbitration_id, msg.data, msg.timestamp)
+        if record is None:
+            self.unknown_frames += 1
+            return
+
+        key = (type(record).__name__, getattr(record, "motor_id", None))
+        with self._lock:
+            self.latest[key] = record
+            self.history.append(record)
+        if isinstance(record, proto.MotionState):
+            self._match_feedback(record, t_rx)
+
+    def on_error(self, exc):
+        # Notifier 默认出错就停，这里只记录，继续收
+        self.errors += 1
+
+    # ---------- 发送侧统计 (由驱动调用) ----------
+    def on_command_sent(self, dlc, v, w):
+        """驱动每发出一帧 0x111 调用一次; 只有指令值变化才作为延迟测量起点"""
+        self.tx_frames += 1
+        self._bits += frame_bits(dlc)
+        if (v, w) != self._last_cmd:
+            self._last_cmd = (v, w)
+            with self._lock:
+                self._pending_cmds.append((time.monotonic(), v, w))
+
+    def on_frame_sent(self, dlc):
+        self.tx_frames += 1
+        self._bits += frame_bits(dlc)
+
+    def _match_feedback(self, record, t_rx):
+        tol_v, tol_w = self.match_tolerance
+        with self._lock:
+            pending = self._pending_cmds
+            for i, (t_send, v, w) in enumerate(pending):
+                if abs(record.linear - v) <= tol_v and abs(record.angular - w) <= tol_w:
+                    # 反馈第一次跟上这条指令: 它和它之前的都出队
+                    for _ in range(i + 1):
+                        pending.popleft()
+                    self.cmd_to_fb.record((t_rx - t_send) * 1e6)
+                    return
+
+    # ---------- 查询 ----------
+    def get(self, record_type, motor_id=None):
+        return self.latest.get((record_type.__name__, motor_id))
+
+    def snapshot(self):
+        with self._lock:
+            return list(self.history)
+
+    def update_bus_load(self):
+        """按上次调用以来的收发位数计算总线负载 (0~1)"""
+        now = time.monotonic()
+        t0, bits0 = self._load_window
+        if now - t0 > 0:
+            self.bus_load = (self._bits - bits0) / (now - t0) / self.bitrate
+        self._load_window = (now, self._bits)
+        return self.bus_load
+
+    def describe(self):
+        parts = [f"rx={self.rx_frames} tx={self.tx_frames} load={self.update_bus_load() * 100:.1f}%"]
+        state = self.get(proto.SystemState)
+        if state:
+            parts.append(f"电池 {state.battery_v:.1f}V 故障 0x{state.error_code:04x}")
+        odom = self.get(proto.Odometry)
+        if odom:
+            parts.append(f"里程 L={odom.left_m:.3f}m R={odom.right_m:.3f}m")
+        if self.cmd_to_fb.total:
+            parts.append(f"指令->反馈 {self.cmd_to_fb.format()}")
+        return " | ".join(parts)
@@ -0,0 +1,83 @@
+import math
+
+
+class JerkLimitedAxis:
+    """单轴速度整形: 加速度和加加速度 (jerk) 都受限
+
+    每个控制节拍调用一次 step()。加速度以最大 jerk 变化，并提前估算"现在开始
+    把加速度收回到 0 还会多走多少速度"，到点就开始收，这样速度平滑地落在目标上
+    而不会冲过头 (S 曲线)。max_jerk=None 时退化成只限加速度的梯形曲线。
+    max_velocity 给定时，目标和内部速度都先限幅 (和驱动的限幅一致)，
+    否则超限的目标会把内部速度带到驱动永远发不出去的值，刹车时要先"降"回限幅才开始减速。
+    """
+
+    def __init__(self, max_accel, max_jerk=None, max_decel=None, max_velocity=None):
+        self.max_accel = max_accel
+        self.max_decel = max_decel or max_accel
+        self.max_jerk = max_jerk
+        self.max_velocity = max_velocity
+        self.velocity = 0.0
+        self.accel = 0.0
+
+    def reset(self, velocity=0.0):
+        self.velocity = velocity
+        self.accel = 0.0
+
+    def step(self, target, dt, decel=None):
+        """推进 dt 秒，返回新的速度；decel 给定时按该减速度直接刹车 (急停)"""
+        if self.max_velocity is not None:
+            target = max(-self.max_velocity, min(self.max_velocity, target))
+            self.velocity = max(-self.max_velocity, min(self.max_velocity, self.velocity))
+        v, a = self.velocity, self.accel
+        err = target - v
+        if err == 0.0 and a == 0.0:
+            return v
+
+        if decel is not None:
+            # 急停: 不限 jerk，直接用急停减速度
+            dv = math.copysign(min(abs(err), decel * dt), err)
+            self.velocity, self.accel = v + dv, 0.0
+            return self.velocity
+
+        # 朝目标方向加速是否属于"刹车" (速度绝对值在减小)
+        braking = v * err < 0
+        limit = self.max_decel if braking else self.max_accel
+
+        if self.max_jerk is None:
+            a_new = max(-limit, min(limit, err / dt))
+        else:
+            # 以最大 jerk 把当前加速度收回 0 期间还会产生的速度变化
+            dv_settle = a * abs(a) / (2.0 * self.max_jerk)
+            a_goal = math.copysign(limit, err - dv_settle) if err != dv_settle else 0.0
+            da = self.max_jerk * dt
+            a_new = a + max(-da, min(da, a_goal - a))
+            a_new = max(-limit, min(limit, a_new))
+
+        v_new = v + 0.5 * (a + a_new) * dt
+        # 越过目标 (或正好到达) 就直接落在目标上
+        if (target - v_new) * err <= 0:
+            v_new, a_new = target, 0.0
+        self.velocity, self.accel = v_new, a_new
+        return v_new
+
+
+class TrajectoryShaper:
+    """底盘线速度 / 角速度两轴整形，在控制循环里按节拍调用"""
+
+    def __init__(self, linear_accel=0.8, linear_jerk=4.0,
+                 angular_accel=2.0, angular_jerk=10.0,
+                 estop_linear_decel=2.0, estop_angular_decel=4.0,
+                 max_linear=None, max_angular=None):
+        self.linear = JerkLimitedAxis(linear_accel, linear_jerk, max_velocity=max_linear)
+        self.angular = JerkLimitedAxis(angular_accel, angular_jerk, max_velocity=max_angular)
+        self.estop_decel = (estop_linear_decel, estop_angular_decel)
+
+    def step(self, target, dt, urgent=False):
+        """target=(v, w)；urgent=True 时按急停减速度刹车"""
+        v_decel, w_decel = self.estop_decel if urgent else (None, None)
+        return (self.linear.step(target[0], dt, v_decel),
+                self.angular.step(target[1], dt, w_decel))
+
+    def reset(self):
+        self.linear.reset()
+        self.angular.reset()
@@ -0,0 +1,106 @@
+import threading
+import time
+
+from common.latency_histogram import LatencyHistogram
+
+IDLE = "idle"        # 还没收到过指令
+ARMED = "armed"      # 指令持续到达，截止时间未到
+EXPIRED = "expired"  # 超时已触发，等待下一条指令重新上膛
+
+
+class DeadlineWatchdog(threading.Thread):
+    """基于单调时钟截止时间的看门狗
+
+    每条指令调用 kick() 把截止时间推到 now + timeout；线程用 Condition.wait
+    精确睡到截止时间，到点只触发一次 on_expire(generation)，之后一直睡到下一次 kick。
+    同时记录相邻两次 kick 的间隔分布，方便按实测数据设置超时。
+
+    on_expire 在锁外执行，期间可能已经来了新指令；回调里的停车动作要交给
+    if_still_expired(generation, action)，没有新指令时才执行。
+    """
+
+    def __init__(self, timeout, on_expire, on_rearm=None):
+        super().__init__(name="watchdog", daemon=True)
+        self.timeout = timeout
+        self.on_expire = on_expire
+        self.on_rearm = on_rearm
+
+        self.state = IDLE
+        self.fired = 0    # 超时触发次数
+        self.rearmed = 0  # 超时后又恢复的次数
+        self.gaps = LatencyHistogram()  # 指令间隔 (微秒)
+
+        self._cond = threading.Condition()
+        self._deadline = None
+        self._last_kick = None
+        self._generation = 0  # 每次 kick / disarm 加一
+        self._stopped = False
+
+    def kick(self):
+        """收到一条有效指令时调用 (任意线程)"""
+        now = time.monotonic()
+        rearmed = False
+        with self._cond:
+            if self._last_kick is not None:
+                self.gaps.record((now - self._last_kick) * 1e6)
+            self._last_kick = now
+            self._deadline = now + self.timeout
+            self._generation += 1
+            if self.state == EXPIRED:
+                self.rearmed += 1
+                rearmed = True
+            self.state = ARMED
+            self._cond.notify()
+        if rearmed and self.on_rearm:
+            self.on_rearm()
+
+    def disarm(self):
+        """收到停车指令时调用: 车已经在停，不需要截止时间，回到 IDLE 等下一条运动指令"""
+        with self._cond:
+            self.state = IDLE
+            self._deadline = None
+            self._last_kick = None  # 停车期间的空闲心跳不计入指令间隔
+            self._generation += 1
+            self._cond.notify()
+
+    def stop(self, timeout=1.0):
+        with self._cond:
+            self._stopped = True
+            self._cond.notify()
+        self.join(timeout)
+
+    def run(self):
+        while True:
+            with self._cond:
+                while not self._stopped:
+                    if self.state == ARMED:
+                        remaining = self._deadline - time.monotonic()
+                        if remaining <= 0:
+                            break
+                        self._cond.wait(remaining)
+                    else:
+                        self._cond.wait()
+                if self._stopped:
+                    return
+                self.state = EXPIRED
+                self.fired += 1
+                generation = self._generation
+            # 回调放在锁外，避免和 kick() 互相阻塞
+            self.on_expire(generation)
+
+    def if_still_expired(self, generation, action):
+        """超时回调里用: 从这次超时到现在没有 kick / disarm 过才执行 action()，返回是否执行了
+
+        持锁执行，和 kick() 排出先后: 要么 action 先做，随后的新指令覆盖它；要么 kick 先到，
+        action 不再做。调用方要先 kick() 再投递指令。action 必须很快，且不能再调用看门狗。
+        """
+        with self._cond:
+            if self.state != EXPIRED or self._generation != generation:
+                return False
+            action()
+            return True
+
+    def describe(self):
+        gaps = self.gaps.format() if self.gaps.total else "无样本"
+        return (f"state={self.state} timeout={self.timeout * 1000:.0f}ms fired={self.fired}"
+                f" rearmed={self.rearmed} | 指令间隔 {gaps}")
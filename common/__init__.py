@@ -0,0 +1,6 @@
+"""各测试脚本共用的工具模块 (编解码、统计、本地 Broker 等)。
+
+脚本都是在自己的目录下直接运行的，使用前先把仓库根目录加进 sys.path:
+
+    sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+"""
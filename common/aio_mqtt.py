@@ -0,0 +1,252 @@
+"""paho-mqtt 的 asyncio 适配: 网络收发直接挂在事件循环上
+
+原来的写法是 paho 的 loop_start() 网络线程里调用 asyncio.Queue.put_nowait()，
+asyncio 的对象不是线程安全的，而且队列可能绑在另一个事件循环上。这里不开网络线程，
+用 paho 的外部事件循环接口把 socket 注册到 asyncio:
+
+- socket 可读 -> loop_read()；有数据要发 -> add_writer，可写时 loop_write()
+- 每秒 loop_misc() 处理保活；断线后按退避间隔自动重连，重连后恢复订阅
+- publish() / subscribe() 默认等连上再发，途中断线就等重连后补上，调用方不用处理断线
+- paho 的回调 (on_message 等) 都在事件循环线程里执行，可以直接操作 asyncio 对象
+
+paho 的 socket 回调可能来自别的线程 (在其它线程 publish、线程池里重连时)，这些经
+call_soon_threadsafe 转回事件循环，所以 publish_nowait() 在任何线程里调用都安全。
+依赖 loop.add_reader，Windows 上需要 SelectorEventLoop。
+"""
+import asyncio
+import threading
+
+import paho.mqtt.client as mqtt
+
+RECONNECT_MIN = 1.0   # 秒
+RECONNECT_MAX = 30.0
+RETRY_DELAY = 0.1     # 秒；paho 已经发现断线、on_disconnect 还没到时，重发前稍等
+
+
+class MessageStream:
+    """async for msg in stream: 按到达顺序取匹配 topic_filter 的消息"""
+
+    def __init__(self, owner, topic_filter, maxsize=0):
+        self.owner = owner
+        self.topic_filter = topic_filter
+        self.queue = asyncio.Queue(maxsize)
+        self.dropped = 0
+
+    def _put(self, msg):
+        try:
+            self.queue.put_nowait(msg)
+        except asyncio.QueueFull:
+            self.dropped += 1
+
+    async def get(self):
+        return await self.queue.get()
+
+    def drain(self):
+        """丢掉已经排队的消息，返回丢掉的条数"""
+        n = 0
+        while not self.queue.empty():
+            self.queue.get_nowait()
+            n += 1
+        return n
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        return await self.queue.get()
+
+    def close(self):
+        self.owner._streams.discard(self)
+
+
+class AsyncMqttClient:
+    """在事件循环里创建和使用；client 属性是底层的 paho Client (will_set / message_callback_add 等照常用)"""
+
+    def __init__(self, client_id="", loop=None):
+        self.loop = loop or asyncio.get_running_loop()
+        self._loop_thread = threading.get_ident()
+        self.client = mqtt.Client(mqtt.CallbackAPIVersion.VERSION2, client_id=client_id)
+        self.client.on_socket_open = self._threadsafe(self._on_socket_open)
+        self.client.on_socket_close = self._threadsafe(self._on_socket_close)
+        self.client.on_socket_register_write = self._threadsafe(self._on_register_write)
+        self.client.on_socket_unregister_write = self._threadsafe(self._on_unregister_write)
+        self.client.on_connect = self._on_connect
+        self.client.on_disconnect = self._on_disconnect
+        self.client.on_message = self._on_message
+        self.client.on_subscribe = self._on_subscribe
+        self.client.on_publish = self._on_publish
+
+        self.connect_callbacks = []  # 每次 (重新) 连上后调用 callback(paho_client)，在这里发能力声明等
+        self.connected = asyncio.Event()
+        self._subscriptions = {}     # topic -> qos，重连后恢复
+        self._streams = set()
+        self._pending = {}           # mid -> Future (SUBACK / 发布完成)
+        self._misc_task = None
+        self._closing = False
+        self.reconnects = 0
+
+    # ---------- paho socket 回调 -> 事件循环 ----------
+    def _threadsafe(self, callback):
+        # 事件循环线程里直接执行；别的线程排队执行，传 fd 而不是 socket 对象
+        # (paho 调完 on_socket_close 马上关 socket，排到时 fileno() 已经是 -1)
+        def wrapper(client, userdata, sock):
+            if threading.get_ident() == self._loop_thread:
+                callback(sock.fileno())
+            else:
+                self.loop.call_soon_threadsafe(callback, sock.fileno())
+        return wrapper
+
+    def _on_socket_open(self, fd):
+        self.loop.add_reader(fd, self.client.loop_read)
+        if self._misc_task is None:
+            self._misc_task = self.loop.create_task(self._misc_loop())
+
+    def _on_socket_close(self, fd):
+        self._forget(self.loop.remove_writer, fd)
+        self._forget(self.loop.remove_reader, fd)
+
+    def _on_register_write(self, fd):
+        self.loop.add_writer(fd, self.client.loop_write)
+
+    def _on_unregister_write(self, fd):
+        self._forget(self.loop.remove_writer, fd)
+
+    @staticmethod
+    def _forget(remove, fd):
+        try:
+            remove(fd)
+        except (OSError, ValueError):
+            pass  # 排队期间 socket 已被 paho 关掉，selector 已自动注销
+
+    async def _misc_loop(self):
+        """保活 + 断线重连 (paho 的 loop_start 线程原来做的事)"""
+        delay = RECONNECT_MIN
+        while not self._closing:
+            await asyncio.sleep(1.0)
+            if self.client.loop_misc() == mqtt.MQTT_ERR_SUCCESS or self._closing:
+                continue
+            try:
+                await self.loop.run_in_executor(None, self.client.reconnect)
+                self.reconnects += 1
+                delay = RECONNECT_MIN
+            except OSError as e:
+                print(f"⚠️ [MQTT] 重连失败: {e}，{delay:.0f}s 后重试")
+                await asyncio.sleep(delay)
+                delay = min(delay * 2, RECONNECT_MAX)
+
+    # ---------- paho 协议回调 (都在事件循环线程里) ----------
+    def _on_connect(self, client, userdata, flags, rc, properties=None):
+        if rc != 0:
+            print(f"❌ [MQTT] 连接失败: {rc}")
+            return
+        for topic, qos in self._subscriptions.items():
+            client.subscribe(topic, qos)
+        for callback in self.connect_callbacks:
+            callback(client)
+        self.connected.set()
+
+    def _on_disconnect(self, client, userdata, flags, rc, properties=None):
+        self.connected.clear()
+        for future in self._pending.values():
+            if not future.done():
+                future.set_exception(ConnectionError(f"MQTT 断开: {rc}"))
+        self._pending.clear()
+
+    def _on_message(self, client, userdata, msg):
+        for stream in list(self._streams):
+            if mqtt.topic_matches_sub(stream.topic_filter, msg.topic):
+                stream._put(msg)
+
+    def _on_subscribe(self, client, userdata, mid, reason_codes, properties=None):
+        self._resolve(mid, reason_codes)
+
+    def _on_publish(self, client, userdata, mid, reason_code=None, properties=None):
+        self._resolve(mid, None)
+
+    def _resolve(self, mid, result):
+        future = self._pending.pop(mid, None)
+        if future is not None and not future.done():
+            future.set_result(result)
+
+    def _track(self, mid):
+        future = self.loop.create_future()
+        self._pending[mid] = future
+        return future
+
+    # ---------- 对外接口 ----------
+    async def connect(self, host, port=1883, keepalive=60):
+        """连上并等到 CONNACK；DNS / TCP 握手放在线程池里，不阻塞事件循环"""
+        await self.loop.run_in_executor(None, self.client.connect, host, port, keepalive)
+        await self.connected.wait()
+
+    async def subscribe(self, topic, qos=0):
+        """等到 SUBACK，返回 Broker 授予的 reason codes
+
+        订阅会记下来，每次重连后自动恢复: 没连上时先等连接；等 SUBACK 期间断线不算失败，
+        等重连 (_on_connect 已经重新订阅) 后返回 None。
+        """
+        self._subscriptions[topic] = qos
+        await self.connected.wait()
+        result, mid = self.client.subscribe(topic, qos)
+        if result == mqtt.MQTT_ERR_SUCCESS:
+            try:
+                return await self._track(mid)
+            except ConnectionError:
+                pass
+        await self.connected.wait()
+        return None
+
+    def publish_nowait(self, topic, payload, qos=0, retain=False):
+        """只入队不等待，返回 MQTTMessageInfo；任何线程都可以调用
+
+        断线时不抛异常: QoS 0 的消息直接丢掉 (info.rc 为 MQTT_ERR_NO_CONN)，QoS 1/2 的
+        由 paho 留着，重连后重发。适合遥测、指令这类丢了就丢了的消息。
+        """
+        return self.client.publish(topic, payload, qos=qos, retain=retain)
+
+    async def publish(self, topic, payload, qos=0, retain=False, retry=True):
+        """等到写进 socket (QoS 0) 或收到确认 (QoS 1/2)，返回 MQTTMessageInfo
+
+        retry=True: 没连上时先等连接，途中断线就等重连后补发 (QoS 1/2 的消息 paho 自己
+        留着重发，不会重复；QoS 0 的重新发布一次)。只有 disconnect() 之后才抛 ConnectionError。
+        retry=False: 断线时抛 ConnectionError，由调用方决定怎么办。
+        """
+        info = None
+        while True:
+            if self._closing:
+                raise ConnectionError("MQTT 已关闭")
+            if info is None:
+                if retry:
+                    await self.connected.wait()
+                info = self.client.publish(topic, payload, qos=qos, retain=retain)
+            if info.is_published():
+                return info
+            # QoS 1/2 即使没连上也已经在 paho 的发送队列里，重连后会重发
+            queued = info.rc == mqtt.MQTT_ERR_SUCCESS or (qos > 0 and info.rc == mqtt.MQTT_ERR_NO_CONN)
+            if queued:
+                try:
+                    await self._track(info.mid)
+                    return info
+                except ConnectionError:
+                    if not retry:
+                        raise
+            elif not retry or info.rc != mqtt.MQTT_ERR_NO_CONN:
+                raise ConnectionError(f"发布失败: {mqtt.error_string(info.rc)}")
+            else:
+                await asyncio.sleep(RETRY_DELAY)
+            if qos == 0:
+                info = None  # QoS 0 断线就丢了，重连后重新发布
+            await self.connected.wait()
+
+    def messages(self, topic_filter="#", maxsize=0):
+        """返回一个消息流 (async 迭代器)；订阅要另外调用 subscribe()"""
+        stream = MessageStream(self, topic_filter, maxsize)
+        self._streams.add(stream)
+        return stream
+
+    async def disconnect(self):
+        self._closing = True
+        self.client.disconnect()
+        if self._misc_task is not None:
+            self._misc_task.cancel()
+            self._misc_task = None
@@ -0,0 +1,131 @@
+"""大消息分片传输
+
+一帧大图作为一条 PUBLISH 发出去，会撞上 Broker 的最大报文限制 (不少云 Broker
+只允许 128KB)，而且同一条连接上排在它后面的小消息 (指令、心跳) 要等整帧写完。
+这里把大负载切成不超过 chunk_size 的分片，每片带消息号和偏移，接收端拼回原样。
+
+分片格式 (大端，13 字节头):
+
+    | magic 0xC7(1) | msg_id(4) | total_len(4) | offset(4) | 数据 |
+
+不超过 chunk_size 的负载原样发送 (首字节不是 0xC7)，接收端直接放行，所以
+新旧两端可以混用。分片走 QoS 0 可能丢失: 超时没拼齐的消息整条丢弃；新消息
+拼齐时，比它旧的未完成消息也直接丢弃 (实时流只要最新的)。
+
+发送端重启后消息号从一个随机值重新开始，接收端看到消息号大幅倒退 (超过
+REORDER_WINDOW)，或者隔了 timeout 以上才来新分片时，当作新的消息序列重新计数，
+不会把新消息全当成"比已拼齐的旧"丢掉。
+"""
+import itertools
+import random
+import struct
+import time
+
+CHUNK_MAGIC = 0xC7
+CHUNK_HEADER = struct.Struct(">BIII")
+DEFAULT_CHUNK_SIZE = 16 * 1024
+REORDER_WINDOW = 64  # 消息号倒退不超过这么多才算迟到的旧分片，再多就是发送端重启了
+
+
+def _newer(a, b):
+    """msg_id 按 32 位回绕比较 (RFC 1982)"""
+    return a != b and ((a - b) & 0xFFFFFFFF) < 0x80000000
+
+
+class Chunker:
+    """发送端: split(payload) -> [分片, ...]"""
+
+    def __init__(self, chunk_size=DEFAULT_CHUNK_SIZE):
+        if chunk_size <= CHUNK_HEADER.size:
+            raise ValueError(f"chunk_size 太小: {chunk_size}")
+        self.chunk_size = chunk_size
+        self._ids = itertools.count(random.getrandbits(32))
+        self.chunked = 0
+
+    def split(self, payload):
+        if len(payload) <= self.chunk_size and (not payload or payload[0] != CHUNK_MAGIC):
+            return [payload]
+        msg_id = next(self._ids) & 0xFFFFFFFF
+        step = self.chunk_size - CHUNK_HEADER.size
+        total = len(payload)
+        view = memoryview(payload)
+        self.chunked += 1
+        return [CHUNK_HEADER.pack(CHUNK_MAGIC, msg_id, total, offset) + view[offset:offset + step]
+                for offset in range(0, total, step)]
+
+    def publish(self, client, topic, payload, qos=0):
+        """逐片发布，返回最后一片的 MQTTMessageInfo (它写出去了整条消息就发完了)"""
+        info = None
+        for chunk in self.split(payload):
+            info = client.publish(topic, chunk, qos=qos)
+        return info
+
+
+class Reassembler:
+    """接收端: add(收到的负载) -> 完整消息或 None"""
+
+    def __init__(self, timeout=0.5, max_pending=8):
+        self.timeout = timeout
+        self.max_pending = max_pending
+        self._pending = {}  # msg_id -> [缓冲区, 已收字节数, 首片到达时间]
+        self._last_done = None
+        self._last_done_t = 0.0
+
+        self.completed = 0
+        self.expired = 0     # 超时没拼齐
+        self.superseded = 0  # 被更新的消息取代
+        self.bad = 0
+        self.restarts = 0    # 发送端重启，消息号重新计数
+
+    def add(self, payload, now=None):
+        if not payload or payload[0] != CHUNK_MAGIC:
+            return payload
+        if len(payload) < CHUNK_HEADER.size:
+            self.bad += 1
+            return None
+        now = time.monotonic() if now is None else now
+        _, msg_id, total, offset = CHUNK_HEADER.unpack_from(payload)
+        data = memoryview(payload)[CHUNK_HEADER.size:]
+        if offset + len(data) > total:
+            self.bad += 1
+            return None
+        if self._last_done is not None and not _newer(msg_id, self._last_done):
+            if ((self._last_done - msg_id) & 0xFFFFFFFF) <= REORDER_WINDOW and now - self._last_done_t <= self.timeout:
+                self.superseded += 1  # 已经有更新的消息拼齐了，迟到的旧分片不要
+                return None
+            # 倒退太多或隔了太久: 发送端重启了，旧的进度作废
+            self.restarts += 1
+            self._last_done = None
+            self.expired += len(self._pending)
+            self._pending.clear()
+
+        self.expire(now)
+        entry = self._pending.get(msg_id)
+        if entry is None:
+            if len(self._pending) >= self.max_pending:
+                oldest = min(self._pending, key=lambda k: self._pending[k][2])
+                del self._pending[oldest]
+                self.expired += 1
+            entry = self._pending[msg_id] = [bytearray(total), 0, now]
+        entry[0][offset:offset + len(data)] = data
+        entry[1] += len(data)
+        if entry[1] < total:
+            return None
+
+        del self._pending[msg_id]
+        for other in [k for k in self._pending if _newer(msg_id, k)]:
+            del self._pending[other]
+            self.superseded += 1
+        self._last_done, self._last_done_t = msg_id, now
+        self.completed += 1
+        return bytes(entry[0])
+
+    def expire(self, now=None):
+        now = time.monotonic() if now is None else now
+        for msg_id in [k for k, v in self._pending.items() if now - v[2] > self.timeout]:
+            del self._pending[msg_id]
+            self.expired += 1
+
+    def describe(self):
+        return (f"拼齐 {self.completed} 超时 {self.expired} 被取代 {self.superseded}"
+                f" 格式错误 {self.bad} 发送端重启 {self.restarts} 未完成 {len(self._pending)}")
@@ -0,0 +1,191 @@
+"""基于 MQTT ping/pong 的时钟偏差估计 (NTP 算法)
+
+两台机器直接用 time.time() 相减得到的"延迟"包含了双方的时钟偏差，
+这里通过往返交换估计偏差 (offset) 和漂移 (drift)，把对端时间戳换算到本机时钟。
+
+    t1 = 本机发 ping      t2 = 对端收 ping
+    t3 = 对端回 pong      t4 = 本机收 pong
+    offset = ((t2 - t1) + (t3 - t4)) / 2     # 对端时钟 - 本机时钟
+    delay  = (t4 - t1) - (t3 - t2)           # 纯网络往返
+
+偏差估计的误差上界是 delay/2 (去程和回程不对称时)，所以只用往返最短的样本，
+并对它们做线性拟合得到漂移。error_bound() 返回当前估计的误差上界。
+
+时间戳统一使用 now(): 启动时锚定一次墙上时间，之后只按单调时钟走，不会因为
+NTP 校时或手动改时间而跳变。
+"""
+import struct
+import threading
+import time
+from collections import deque
+
+_PERF_ANCHOR = time.perf_counter()
+_WALL_ANCHOR = time.time()
+
+
+def now():
+    """单调、高精度的时间戳 (秒)，起点对齐启动时的 time.time()"""
+    return _WALL_ANCHOR + (time.perf_counter() - _PERF_ANCHOR)
+
+
+PING = struct.Struct(">Id")     # seq, t1 | 后接回复 Topic
+PONG = struct.Struct(">Iddd")   # seq, t1, t2, t3 | 后接应答方 ID
+
+
+class ClockSyncResponder:
+    """应答端: 收到 ping 立刻回 pong (被测量的一方运行)"""
+
+    def __init__(self, topic_base, responder_id):
+        self.ping_topic = f"{topic_base}/ping"
+        self.responder_id = responder_id.encode("utf-8")
+
+    def attach(self, client):
+        client.message_callback_add(self.ping_topic, self._on_ping)
+
+    def subscribe(self, client):
+        """在 on_connect 里调用 (重连后需要重新订阅)"""
+        client.subscribe(self.ping_topic, qos=0)
+
+    def _on_ping(self, client, userdata, msg):
+        t2 = now()
+        if len(msg.payload) <= PING.size:
+            return
+        seq, t1 = PING.unpack_from(msg.payload)
+        reply_topic = msg.payload[PING.size:].decode("utf-8", errors="replace")
+        client.publish(reply_topic, PONG.pack(seq, t1, t2, now()) + self.responder_id, qos=0)
+
+
+class ClockSync:
+    """请求端: 周期发 ping，持续估计对端时钟相对本机的偏差和漂移"""
+
+    def __init__(self, topic_base, client_id, interval=1.0, window=64,
+                 fast_interval=0.1, min_samples=4, drift_span=10.0):
+        self.ping_topic = f"{topic_base}/ping"
+        self.pong_topic = f"{topic_base}/pong/{client_id}"
+        self.interval = interval
+        self.fast_interval = fast_interval
+        self.min_samples = min_samples
+        self.drift_span = drift_span
+
+        self.samples = deque(maxlen=window)  # (t_mid, offset, delay)
+        self.peer = None
+        self._lock = threading.Lock()
+        self._seq = 0
+        self._client = None
+        self._stop = threading.Event()
+
+        # 当前估计: offset(t) = base_offset + drift * (t - ref_t)
+        self._base_offset = 0.0
+        self._drift = 0.0
+        self._ref_t = 0.0
+        self._error = float("inf")
+
+    # ---------- MQTT 接入 ----------
+    def attach(self, client):
+        self._client = client
+        client.message_callback_add(self.pong_topic, self._on_pong)
+
+    def subscribe(self, client):
+        """在 on_connect 里调用 (重连后需要重新订阅)"""
+        client.subscribe(self.pong_topic, qos=0)
+
+    def start(self):
+        t = threading.Thread(target=self._ping_task, name="clock-sync", daemon=True)
+        t.start()
+        return t
+
+    def stop(self):
+        self._stop.set()
+
+    def _ping_task(self):
+        while not self._stop.is_set():
+            self.ping()
+            self._stop.wait(self.interval if self.synced else self.fast_interval)
+
+    def ping(self):
+        if self._client is None:
+            return
+        self._seq = (self._seq + 1) & 0xFFFFFFFF
+        payload = PING.pack(self._seq, now()) + self.pong_topic.encode("utf-8")
+        self._client.publish(self.ping_topic, payload, qos=0)
+
+    def _on_pong(self, client, userdata, msg):
+        t4 = now()
+        if len(msg.payload) < PONG.size:
+            return
+        _, t1, t2, t3 = PONG.unpack_from(msg.payload)
+        peer = msg.payload[PONG.size:].decode("utf-8", errors="replace")
+        self.add_sample(t1, t2, t3, t4, peer)
+
+    # ---------- 估计 ----------
+    def add_sample(self, t1, t2, t3, t4, peer=None):
+        offset = ((t2 - t1) + (t3 - t4)) / 2.0
+        delay = (t4 - t1) - (t3 - t2)
+        if delay < 0:
+            return
+        with self._lock:
+            if peer != self.peer:
+                # 对端换人了 (比如控制端重启)，旧样本作废
+                self.samples.clear()
+                self.peer = peer
+            self.samples.append(((t1 + t4) / 2.0, offset, delay))
+            self._update()
+
+    def _update(self):
+        if not self.samples:
+            return
+        # 只保留往返最短的四分之一样本，排队/调度带来的不对称最小
+        best = sorted(self.samples, key=lambda s: s[2])[:max(3, len(self.samples) // 4)]
+        self._error = best[0][2] / 2.0
+
+        ts = [s[0] for s in best]
+        offs = [s[1] for s in best]
+        span = max(ts) - min(ts)
+        if len(best) >= 3 and span >= self.drift_span:
+            mean_t = sum(ts) / len(ts)
+            mean_o = sum(offs) / len(offs)
+            var_t = sum((t - mean_t) ** 2 for t in ts)
+            self._drift = sum((t - mean_t) * (o - mean_o) for t, o in zip(ts, offs)) / var_t
+            self._base_offset = mean_o
+            self._ref_t = mean_t
+        else:
+            offs.sort()
+            self._drift = 0.0
+            self._base_offset = offs[len(offs) // 2]
+            self._ref_t = now()
+
+    @property
+    def synced(self):
+        return len(self.samples) >= self.min_samples
+
+    def offset(self, t=None):
+        """对端时钟 - 本机时钟 (秒)，未同步时为 0"""
+        if not self.synced:
+            return 0.0
+        if t is None:
+            t = now()
+        with self._lock:
+            return self._base_offset + self._drift * (t - self._ref_t)
+
+    def drift_ppm(self):
+        return self._drift * 1e6
+
+    def error_bound(self):
+        """偏差估计的误差上界 (秒)"""
+        return self._error
+
+    def to_local(self, remote_ts):
+        """把对端 now() 时间戳换算到本机时钟"""
+        return remote_ts - self.offset()
+
+    def latency(self, remote_ts, t_recv=None):
+        """单向延迟 (秒): 本机接收时刻 - 换算后的对端发送时刻"""
+        if t_recv is None:
+            t_recv = now()
+        return t_recv - self.to_local(remote_ts)
+
+    def describe(self):
+        if not self.synced:
+            return f"未同步 ({len(self.samples)}/{self.min_samples} 样本)"
+        return (f"offset={self.offset() * 1000:+.3f}ms ±{self._error * 1000:.3f}ms"
+                f" drift={self.drift_ppm():+.1f}ppm peer={self.peer}")
@@ -0,0 +1,78 @@
+"""机器人端指令合并: 只让最新的设定值到达底盘
+
+网络抖动时 Broker 会把积压的 cmd_vel 一口气推过来，如果逐条执行，机器人就会
+"回放"几百毫秒前的操作意图。这里按指令里的序号和时间戳过滤:
+
+- 序号不比上一条新 (乱序/重复)            -> 丢弃 (superseded)
+- 换算时钟偏差后，指令年龄超过 max_age     -> 丢弃 (stale)
+- 急停帧 (FLAG_ESTOP) 不做年龄检查，停车总是安全的
+
+通过的指令再投递到单槽邮箱，消费端只取最新值，两层一起保证积压时只执行最新的一条。
+"""
+import threading
+
+from common.clock_sync import now
+from common.cmd_codec import FLAG_ESTOP
+
+SEQ_MOD = 1 << 32
+
+
+def seq_newer(seq, ref):
+    """序号回绕比较 (RFC 1982): seq 是否比 ref 新"""
+    return 0 < (seq - ref) % SEQ_MOD < SEQ_MOD // 2
+
+
+class CommandCoalescer:
+    def __init__(self, max_age=0.3, clock=None):
+        self.max_age = max_age
+        self.clock = clock  # ClockSync，未同步时跳过年龄检查
+
+        self.last_seq = None
+        self.last_ts = None
+        self.accepted = 0
+        self.dropped_stale = 0
+        self.dropped_superseded = 0
+        self.restarts = 0
+        self._lock = threading.Lock()
+
+    def offer(self, cmd, t_recv=None):
+        """返回 True 表示这条指令应该执行"""
+        if t_recv is None:
+            t_recv = now()
+        with self._lock:
+            # 1. 序号检查 (seq=0 表示老版本控制端没带序号，跳过)
+            if cmd.seq and self.last_seq is not None and not seq_newer(cmd.seq, self.last_seq):
+                if self.last_ts is not None and cmd.ts > self.last_ts:
+                    # 序号倒退但时间更新: 控制端重启了，重新开始计数
+                    self.restarts += 1
+                else:
+                    self.dropped_superseded += 1
+                    return False
+
+            # 2. 年龄检查
+            if (self.max_age and cmd.ts and not cmd.flags & FLAG_ESTOP
+                    and self.clock is not None and self.clock.synced
+                    and self.clock.latency(cmd.ts, t_recv) > self.max_age):
+                self.dropped_stale += 1
+                # 过期指令也算"见过"，比它更老的乱序包同样要丢
+                self._remember(cmd)
+                return False
+
+            self._remember(cmd)
+            self.accepted += 1
+            return True
+
+    def _remember(self, cmd):
+        if cmd.seq:
+            self.last_seq = cmd.seq
+        if cmd.ts:
+            self.last_ts = cmd.ts
+
+    @property
+    def dropped(self):
+        return self.dropped_stale + self.dropped_superseded
+
+    def describe(self):
+        return (f"accepted={self.accepted} dropped={self.dropped}"
+                f" (stale={self.dropped_stale} superseded={self.dropped_superseded})"
+                f" restarts={self.restarts} max_age={self.max_age * 1000:.0f}ms")
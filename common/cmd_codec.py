@@ -0,0 +1,118 @@
+"""cmd_vel 指令编解码 (控制端和机器人共用)
+
+二进制帧 (大端，固定 22 字节，对比 JSON 的 40~60 字节):
+
+    | version(1) | flags(1) | seq(4) | ts(8, clock_sync.now()) | v(4, float) | w(4, float) |
+
+version 字节的最高位为 1，和 JSON 的首字符 '{' 不会冲突，所以机器人端可以
+同时接收两种格式。控制端默认先发 JSON，收到机器人在 <cmd_topic>/caps 上
+发布的能力声明 (保留消息) 后才切换到二进制，老版本机器人不受影响。
+"""
+import json
+import struct
+from collections import namedtuple
+
+from common.clock_sync import now
+
+FRAME_VERSION = 0x81
+CMD_FRAME = struct.Struct(">BBIdff")
+
+# flags
+FLAG_ESTOP = 0x01      # 急停 (v=w=0 且要求立即执行)
+FLAG_HEARTBEAT = 0x02  # 心跳重发，指令内容和上一帧相同
+
+ENCODING_BINARY = "bin1"
+ENCODING_JSON = "json"
+ENCODING_AUTO = "auto"
+SUPPORTED_ENCODINGS = (ENCODING_BINARY, ENCODING_JSON)
+
+CmdVel = namedtuple("CmdVel", "seq ts v w flags encoding")
+
+
+def caps_topic(cmd_topic):
+    return f"{cmd_topic}/caps"
+
+
+# ================= 编码 =================
+def encode_binary(seq, ts, v, w, flags=0):
+    return CMD_FRAME.pack(FRAME_VERSION, flags, seq & 0xFFFFFFFF, ts, v, w)
+
+
+def encode_json(seq, ts, v, w, flags=0):
+    payload = {"v": v, "w": w, "ts": ts, "seq": seq}
+    if flags:
+        payload["flags"] = flags
+    return json.dumps(payload, separators=(",", ":"))
+
+
+# ================= 解码 =================
+def decode(payload):
+    """自动识别二进制 / JSON，返回 CmdVel；格式错误抛 ValueError"""
+    if not payload:
+        raise ValueError("空指令")
+    if payload[0] == FRAME_VERSION:
+        if len(payload) != CMD_FRAME.size:
+            raise ValueError(f"二进制指令长度错误: {len(payload)}")
+        _, flags, seq, ts, v, w = CMD_FRAME.unpack(payload)
+        return CmdVel(seq, ts, v, w, flags, ENCODING_BINARY)
+    if payload[0] == ord("{"):
+        data = json.loads(payload)
+        return CmdVel(int(data.get("seq", 0)), float(data.get("ts", 0.0)),
+                      float(data.get("v", 0.0)), float(data.get("w", 0.0)),
+                      int(data.get("flags", 0)), ENCODING_JSON)
+    raise ValueError(f"未知指令格式: 0x{payload[0]:02x}")
+
+
+# ================= 协商 =================
+def advertise(client, cmd_topic, robot_id):
+    """机器人端: 在 on_connect 里发布自己支持的编码 (保留消息)"""
+    caps = {"id": robot_id, "encodings": list(SUPPORTED_ENCODINGS)}
+    client.publish(caps_topic(cmd_topic), json.dumps(caps), qos=1, retain=True)
+
+
+def clear_caps_on_disconnect(client, cmd_topic):
+    """机器人端: connect 之前调用，异常掉线时由 Broker 清掉能力声明"""
+    client.will_set(caps_topic(cmd_topic), b"", qos=1, retain=True)
+
+
+class CmdEncoder:
+    """控制端编码器: 维护序号，并根据机器人的能力声明选择编码"""
+
+    def __init__(self, cmd_topic, mode=ENCODING_AUTO):
+        if mode not in (ENCODING_AUTO,) + SUPPORTED_ENCODINGS:
+            raise ValueError(f"未知编码: {mode}")
+        self.cmd_topic = cmd_topic
+        self.mode = mode
+        self.peer_encodings = ()
+        self.seq = 0
+
+    @property
+    def encoding(self):
+        if self.mode != ENCODING_AUTO:
+            return self.mode
+        if ENCODING_BINARY in self.peer_encodings:
+            return ENCODING_BINARY
+        return ENCODING_JSON
+
+    def encode(self, v, w, flags=0):
+        self.seq = (self.seq + 1) & 0xFFFFFFFF
+        if self.encoding == ENCODING_BINARY:
+            return encode_binary(self.seq, now(), v, w, flags)
+        return encode_json(self.seq, now(), v, w, flags)
+
+    def attach(self, client):
+        client.message_callback_add(caps_topic(self.cmd_topic), self._on_caps)
+
+    def subscribe(self, client):
+        """在 on_connect 里调用"""
+        client.subscribe(caps_topic(self.cmd_topic), qos=1)
+
+    def _on_caps(self, client, userdata, msg):
+        old = self.encoding
+        try:
+            caps = json.loads(msg.payload) if msg.payload else {}
+            self.peer_encodings = tuple(caps.get("encodings", ()))
+        except (ValueError, AttributeError):
+            self.peer_encodings = ()
+        if self.encoding != old:
+            print(f"🔁 [指令编码] {old} -> {self.encoding}")
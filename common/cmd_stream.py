@@ -0,0 +1,106 @@
+"""控制端持续指令流
+
+机器人的看门狗 0.5s 收不到指令就停车，只在按键时发一条会导致松手续按的间隙
+里车子急停。这里持有"当前指令"并按心跳频率重发:
+
+- 指令变化 (或急停) 时立即发送
+- 指令不变时，最多按 heartbeat_hz 重发，多余的相同指令直接抑制
+- 当前指令是停车 (0, 0) 时降到 idle_hz，空闲时也只占很小的固定带宽；
+  idle 间隔可以长于机器人看门狗超时，机器人收到停车指令时不给看门狗上膛
+
+既可以 start() 用自带线程驱动，也可以由外部事件循环在 next_deadline() 到期时调用 tick()。
+"""
+import threading
+import time
+
+from common.cmd_codec import FLAG_ESTOP, FLAG_HEARTBEAT
+
+
+class CommandStreamer:
+    def __init__(self, client, topic, encoder, heartbeat_hz=10.0, idle_hz=1.0, qos=0):
+        self.client = client
+        self.topic = topic
+        self.encoder = encoder
+        self.heartbeat_interval = 1.0 / heartbeat_hz
+        self.idle_interval = 1.0 / idle_hz if idle_hz else None
+        self.qos = qos
+
+        self.current = (0.0, 0.0)
+        self._last_pub_t = None
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._stop_event = threading.Event()
+
+        # 统计
+        self.sent_changes = 0
+        self.sent_heartbeats = 0
+        self.suppressed = 0
+        self.bytes_sent = 0
+        self._t_start = time.monotonic()
+
+    # ---------- 指令输入 ----------
+    def set(self, v, w, flags=0):
+        """更新当前指令: 变化或急停时立即发送，相同指令被抑制"""
+        with self._lock:
+            if (v, w) == self.current and not flags & FLAG_ESTOP:
+                self.suppressed += 1
+                return False
+            self.current = (v, w)
+            self._publish(flags)
+            self.sent_changes += 1
+        self._wake.set()
+        return True
+
+    # ---------- 心跳 ----------
+    def interval(self):
+        if self.current == (0.0, 0.0) and self.idle_interval:
+            return self.idle_interval
+        return self.heartbeat_interval
+
+    def next_deadline(self):
+        """下一次需要心跳的单调时间"""
+        if self._last_pub_t is None:
+            return self._t_start
+        return self._last_pub_t + self.interval()
+
+    def tick(self):
+        """到期就重发当前指令，返回下一次的截止时间"""
+        with self._lock:
+            if time.monotonic() >= self.next_deadline():
+                self._publish(FLAG_HEARTBEAT)
+                self.sent_heartbeats += 1
+            return self.next_deadline()
+
+    def _publish(self, flags):
+        payload = self.encoder.encode(self.current[0], self.current[1], flags)
+        info = self.client.publish(self.topic, payload, qos=self.qos)
+        self.bytes_sent += len(payload)
+        self._last_pub_t = time.monotonic()
+        return info
+
+    # ---------- 自带线程 ----------
+    def start(self):
+        t = threading.Thread(target=self._run, name="cmd-stream", daemon=True)
+        t.start()
+        return t
+
+    def _run(self):
+        while not self._stop_event.is_set():
+            deadline = self.tick()
+            self._wake.wait(max(0.0, deadline - time.monotonic()))
+            self._wake.clear()
+
+    def stop(self, send_stop=True):
+        """停止心跳；默认最后发一帧急停，返回它的 MQTTMessageInfo"""
+        self._stop_event.set()
+        self._wake.set()
+        if send_stop:
+            with self._lock:
+                self.current = (0.0, 0.0)
+                return self._publish(FLAG_ESTOP)
+        return None
+
+    def describe(self):
+        elapsed = max(1e-6, time.monotonic() - self._t_start)
+        return (f"changes={self.sent_changes} heartbeats={self.sent_heartbeats}"
+                f" suppressed={self.suppressed} {self.bytes_sent * 8 / elapsed / 1000:.2f} kbit/s")
@@ -0,0 +1,127 @@
+import math
+
+# ================= HDR 风格延迟直方图 =================
+# 数值以整数 (默认微秒) 记录。小于 sub_bucket_count 的数值精确计数，
+# 更大的数值按 2 的幂分段，每段内再等分成 sub_bucket_half_count 个桶，
+# 因此任意数值的相对误差都不超过 10^-significant_figures。
+
+
+class LatencyHistogram:
+    """固定相对精度的延迟直方图，支持任意百分位查询"""
+
+    def __init__(self, highest=60_000_000, significant_figures=3):
+        if not 1 <= significant_figures <= 5:
+            raise ValueError("significant_figures 必须在 1~5 之间")
+        largest_single_unit = 2 * 10 ** significant_figures
+        self.sub_bucket_magnitude = math.ceil(math.log2(largest_single_unit))
+        self.sub_bucket_count = 1 << self.sub_bucket_magnitude
+        self.sub_bucket_half_count = self.sub_bucket_count // 2
+        self.highest = int(highest)
+
+        self.counts = [0] * (self._index_of(self.highest) + 1)
+        self.reset()
+
+    def reset(self):
+        for i in range(len(self.counts)):
+            self.counts[i] = 0
+        self.total = 0
+        self.overflow = 0
+        self.min = None
+        self.max = None
+        self._sum = 0
+        self._sum_sq = 0
+
+    # ---------- 桶索引 ----------
+    def _index_of(self, value):
+        if value < self.sub_bucket_count:
+            return value
+        shift = value.bit_length() - self.sub_bucket_magnitude
+        return (self.sub_bucket_count
+                + (shift - 1) * self.sub_bucket_half_count
+                + ((value >> shift) - self.sub_bucket_half_count))
+
+    def _range_of(self, index):
+        """返回桶 index 覆盖的 (最小值, 最大值)"""
+        if index < self.sub_bucket_count:
+            return index, index
+        offset = index - self.sub_bucket_count
+        shift = offset // self.sub_bucket_half_count + 1
+        sub = offset % self.sub_bucket_half_count + self.sub_bucket_half_count
+        low = sub << shift
+        return low, low + (1 << shift) - 1
+
+    # ---------- 记录 ----------
+    def record(self, value, count=1):
+        value = int(value)
+        if value < 0:
+            value = 0
+        if value > self.highest:
+            self.overflow += count
+            value = self.highest
+        self.counts[self._index_of(value)] += count
+        self.total += count
+        self._sum += value * count
+        self._sum_sq += value * value * count
+        if self.min is None or value < self.min:
+            self.min = value
+        if self.max is None or value > self.max:
+            self.max = value
+
+    def merge(self, other):
+        if other.sub_bucket_magnitude != self.sub_bucket_magnitude or other.highest != self.highest:
+            raise ValueError("只能合并相同配置的直方图")
+        for i, c in enumerate(other.counts):
+            self.counts[i] += c
+        self.total += other.total
+        self.overflow += other.overflow
+        self._sum += other._sum
+        self._sum_sq += other._sum_sq
+        if other.min is not None:
+            self.min = other.min if self.min is None else min(self.min, other.min)
+            self.max = other.max if self.max is None else max(self.max, other.max)
+
+    # ---------- 查询 ----------
+    def percentile(self, p):
+        """返回第 p 百分位 (0~100) 所在桶的上界"""
+        if self.total == 0:
+            return 0
+        target = max(1, math.ceil(p / 100.0 * self.total))
+        seen = 0
+        for i, c in enumerate(self.counts):
+            if not c:
+                continue
+            seen += c
+            if seen >= target:
+                return min(self._range_of(i)[1], self.max)
+        return self.max
+
+    def mean(self):
+        return self._sum / self.total if self.total else 0.0
+
+    def stddev(self):
+        if not self.total:
+            return 0.0
+        m = self.mean()
+        return math.sqrt(max(0.0, self._sum_sq / self.total - m * m))
+
+    def summary(self, percentiles=(50, 90, 99, 99.9)):
+        return {
+            "count": self.total,
+            "min": self.min or 0,
+            "max": self.max or 0,
+            "mean": self.mean(),
+            "stddev": self.stddev(),
+            "percentiles": {p: self.percentile(p) for p in percentiles},
+        }
+
+    def format(self, unit_div=1000.0, unit="ms", percentiles=(50, 90, 99, 99.9)):
+        """生成一行可读的统计结果 (默认把微秒换算成毫秒显示)"""
+        if not self.total:
+            return "无样本"
+        parts = [f"n={self.total}",
+                 f"min={self.min / unit_div:.3f}",
+                 f"mean={self.mean() / unit_div:.3f}"]
+        for p in percentiles:
+            parts.append(f"p{p:g}={self.percentile(p) / unit_div:.3f}")
+        parts.append(f"max={self.max / unit_div:.3f} {unit}")
+        return " ".join(parts)
@@ -0,0 +1,279 @@
+"""本地替身 MQTT Broker (MQTT 3.1.1，仅依赖标准库)
+
+用于在没有 broker.emqx.io 的情况下做可复现的压测/联调:
+
+    python common/local_broker.py --port 1883
+
+也可以在脚本里后台启动: LocalBroker(port=1883).start_in_thread()
+
+只实现测试需要的子集: CONNECT / PUBLISH (QoS 0/1/2) / SUBSCRIBE /
+UNSUBSCRIBE / PINGREQ / DISCONNECT / 保留消息。不做持久会话和认证。
+"""
+import argparse
+import asyncio
+import struct
+import threading
+
+# 报文类型
+CONNECT, CONNACK, PUBLISH, PUBACK, PUBREC, PUBREL, PUBCOMP = 1, 2, 3, 4, 5, 6, 7
+SUBSCRIBE, SUBACK, UNSUBSCRIBE, UNSUBACK = 8, 9, 10, 11
+PINGREQ, PINGRESP, DISCONNECT = 12, 13, 14
+
+
+def topic_matches(topic_filter, topic):
+    """MQTT 通配符匹配 (+ 单层, # 多层)"""
+    f_parts = topic_filter.split("/")
+    t_parts = topic.split("/")
+    for i, f in enumerate(f_parts):
+        if f == "#":
+            return True
+        if i >= len(t_parts):
+            return False
+        if f != "+" and f != t_parts[i]:
+            return False
+    return len(f_parts) == len(t_parts)
+
+
+def _encode_remaining_length(n):
+    out = bytearray()
+    while True:
+        byte = n % 128
+        n //= 128
+        if n:
+            byte |= 0x80
+        out.append(byte)
+        if not n:
+            return bytes(out)
+
+
+def _packet(ptype, flags, body):
+    return bytes([(ptype << 4) | flags]) + _encode_remaining_length(len(body)) + body
+
+
+def _utf8(s):
+    b = s.encode("utf-8")
+    return struct.pack(">H", len(b)) + b
+
+
+class _Session:
+    def __init__(self, broker, reader, writer):
+        self.broker = broker
+        self.reader = reader
+        self.writer = writer
+        self.client_id = None
+        self.subscriptions = {}  # topic_filter -> qos
+        self._next_mid = 0
+
+    def next_mid(self):
+        self._next_mid = self._next_mid % 65535 + 1
+        return self._next_mid
+
+    async def read_packet(self):
+        header = await self.reader.readexactly(1)
+        multiplier, length = 1, 0
+        while True:
+            byte = (await self.reader.readexactly(1))[0]
+            length += (byte & 0x7F) * multiplier
+            if not byte & 0x80:
+                break
+            multiplier *= 128
+        body = await self.reader.readexactly(length) if length else b""
+        return header[0] >> 4, header[0] & 0x0F, body
+
+    def send(self, data):
+        if not self.writer.is_closing():
+            self.writer.write(data)
+
+    def deliver(self, topic, payload, qos, retain=False):
+        flags = (qos << 1) | (1 if retain else 0)
+        body = _utf8(topic)
+        if qos:
+            body += struct.pack(">H", self.next_mid())
+        self.send(_packet(PUBLISH, flags, body + payload))
+
+
+class LocalBroker:
+    """极简 MQTT Broker，所有会话跑在同一个 asyncio 循环里"""
+
+    def __init__(self, host="127.0.0.1", port=1883, verbose=False):
+        self.host = host
+        self.port = port
+        self.verbose = verbose
+        self.sessions = set()
+        self.retained = {}  # topic -> (payload, qos)
+        self.server = None
+        self.loop = None
+
+    def log(self, text):
+        if self.verbose:
+            print(f"[Broker] {text}")
+
+    async def start(self):
+        self.server = await asyncio.start_server(self._handle, self.host, self.port)
+        self.log(f"监听 {self.host}:{self.port}")
+        return self.server
+
+    async def serve_forever(self):
+        await self.start()
+        async with self.server:
+            await self.server.serve_forever()
+
+    def start_in_thread(self):
+        """在后台守护线程里启动，返回时端口已经可以连接"""
+        ready = threading.Event()
+        errors = []
+
+        def runner():
+            self.loop = asyncio.new_event_loop()
+            asyncio.set_event_loop(self.loop)
+            try:
+                self.loop.run_until_complete(self.start())
+            except Exception as e:
+                errors.append(e)
+                ready.set()
+                return
+            ready.set()
+            self.loop.run_forever()
+
+        t = threading.Thread(target=runner, name="local-broker", daemon=True)
+        t.start()
+        ready.wait()
+        if errors:
+            raise errors[0]
+        return t
+
+    def stop(self):
+        if self.loop and self.server:
+            self.loop.call_soon_threadsafe(self.server.close)
+
+    # ---------- 消息路由 ----------
+    def route(self, topic, payload, qos, retain):
+        if retain:
+            if payload:
+                self.retained[topic] = (payload, qos)
+            else:
+                self.retained.pop(topic, None)
+        for session in list(self.sessions):
+            granted = [q for f, q in session.subscriptions.items() if topic_matches(f, topic)]
+            if granted:
+                session.deliver(topic, payload, min(qos, max(granted)))
+
+    # ---------- 连接处理 ----------
+    async def _handle(self, reader, writer):
+        session = _Session(self, reader, writer)
+        inbound_qos2 = set()
+        try:
+            ptype, _, body = await session.read_packet()
+            if ptype != CONNECT:
+                return
+            if not self._on_connect(session, body):
+                return
+            self.sessions.add(session)
+            while True:
+                ptype, flags, body = await session.read_packet()
+                if ptype == PUBLISH:
+                    qos = (flags >> 1) & 0x03
+                    retain = bool(flags & 0x01)
+                    tlen = struct.unpack_from(">H", body)[0]
+                    topic = body[2:2 + tlen].decode("utf-8")
+                    pos = 2 + tlen
+                    mid = None
+                    if qos:
+                        mid = struct.unpack_from(">H", body, pos)[0]
+                        pos += 2
+                    payload = body[pos:]
+                    if qos == 1:
+                        session.send(_packet(PUBACK, 0, struct.pack(">H", mid)))
+                    elif qos == 2:
+                        session.send(_packet(PUBREC, 0, struct.pack(">H", mid)))
+                        if mid in inbound_qos2:
+                            continue  # 重传的 QoS2 报文只确认不再转发
+                        inbound_qos2.add(mid)
+                    self.route(topic, payload, qos, retain)
+                    await writer.drain()
+                elif ptype == PUBREL:
+                    mid = struct.unpack_from(">H", body)[0]
+                    inbound_qos2.discard(mid)
+                    session.send(_packet(PUBCOMP, 0, body[:2]))
+                elif ptype == PUBREC:
+                    # 我们下发的 QoS2 消息: 回 PUBREL
+                    session.send(_packet(PUBREL, 0x02, body[:2]))
+                elif ptype in (PUBACK, PUBCOMP):
+                    pass
+                elif ptype == SUBSCRIBE:
+                    self._on_subscribe(session, body)
+                elif ptype == UNSUBSCRIBE:
+                    mid = body[:2]
+                    pos = 2
+                    while pos < len(body):
+                        tlen = struct.unpack_from(">H", body, pos)[0]
+                        session.subscriptions.pop(body[pos + 2:pos + 2 + tlen].decode("utf-8"), None)
+                        pos += 2 + tlen
+                    session.send(_packet(UNSUBACK, 0, mid))
+                elif ptype == PINGREQ:
+                    session.send(_packet(PINGRESP, 0, b""))
+                elif ptype == DISCONNECT:
+                    return
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            self.sessions.discard(session)
+            self.log(f"断开: {session.client_id}")
+            writer.close()
+
+    def _on_connect(self, session, body):
+        pos = 0
+        nlen = struct.unpack_from(">H", body, pos)[0]
+        pos += 2 + nlen
+        level = body[pos]
+        pos += 1 + 1 + 2  # level, connect flags, keepalive
+        if level not in (3, 4):
+            session.send(_packet(CONNACK, 0, b"\x00\x01"))  # 不支持的协议版本
+            return False
+        clen = struct.unpack_from(">H", body, pos)[0]
+        session.client_id = body[pos + 2:pos + 2 + clen].decode("utf-8") or f"anon-{id(session)}"
+
+        # 同名客户端: 踢掉旧连接
+        for old in list(self.sessions):
+            if old.client_id == session.client_id:
+                old.writer.close()
+                self.sessions.discard(old)
+
+        session.send(_packet(CONNACK, 0, b"\x00\x00"))
+        self.log(f"连接: {session.client_id}")
+        return True
+
+    def _on_subscribe(self, session, body):
+        mid = body[:2]
+        pos = 2
+        granted = bytearray()
+        new_filters = []
+        while pos < len(body):
+            tlen = struct.unpack_from(">H", body, pos)[0]
+            topic_filter = body[pos + 2:pos + 2 + tlen].decode("utf-8")
+            qos = min(body[pos + 2 + tlen] & 0x03, 2)
+            pos += 3 + tlen
+            session.subscriptions[topic_filter] = qos
+            granted.append(qos)
+            new_filters.append((topic_filter, qos))
+        session.send(_packet(SUBACK, 0, mid + bytes(granted)))
+
+        for topic, (payload, rqos) in list(self.retained.items()):
+            for topic_filter, qos in new_filters:
+                if topic_matches(topic_filter, topic):
+                    session.deliver(topic, payload, min(qos, rqos), retain=True)
+                    break
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="本地替身 MQTT Broker")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=1883)
+    parser.add_argument("-v", "--verbose", action="store_true")
+    args = parser.parse_args()
+
+    print(f"🧪 [Broker] 本地 Broker 启动: {args.host}:{args.port} (Ctrl+C 退出)")
+    try:
+        asyncio.run(LocalBroker(args.host, args.port, verbose=args.verbose).serve_forever())
+    except KeyboardInterrupt:
+        pass
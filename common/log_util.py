@@ -0,0 +1,96 @@
+"""异步、可限流的日志
+
+热路径 (MQTT 回调、控制循环) 里直接 print 会同步写终端，指令频率一高就成了
+回调里最大的开销。这里把 logging 接到一个有界队列上，由后台线程负责真正的
+输出；调用方只付出一次入队的代价，队列满了直接丢弃并计数，绝不阻塞。
+
+逐帧日志在调用处声明限流，同一调用点在窗口内只输出一条；被省略的条数附在
+该调用点下一条放行的日志后面 ("已省略 N 条")，调用点之后不再打日志就不会补报:
+
+    log.info("CAN发送 V=%.2f", v, extra={"throttle": 1.0})
+"""
+import atexit
+import logging
+import logging.handlers
+import queue
+import sys
+import time
+
+LOG_FORMAT = "%(asctime)s.%(msecs)03d %(levelname).1s [%(name)s] %(message)s"
+DATE_FORMAT = "%H:%M:%S"
+
+
+class DroppingQueueHandler(logging.handlers.QueueHandler):
+    """队列满时丢弃日志而不是阻塞调用线程"""
+
+    def __init__(self, q):
+        super().__init__(q)
+        self.dropped = 0
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+class ThrottleFilter(logging.Filter):
+    """按调用点限流: 带 extra={"throttle": 秒} 的记录，同一调用点每个窗口只放行一条
+
+    省略计数只在下一条放行时输出，不单独补发汇总。
+    """
+
+    def __init__(self):
+        super().__init__()
+        self._windows = {}  # (pathname, lineno) -> [窗口开始时间, 被省略条数]
+
+    def filter(self, record):
+        interval = getattr(record, "throttle", None)
+        if not interval:
+            return True
+        key = (record.pathname, record.lineno)
+        now = time.monotonic()
+        window = self._windows.get(key)
+        if window is not None and now - window[0] < interval:
+            window[1] += 1
+            return False
+        if window is not None and window[1]:
+            record.msg = f"{record.msg} (已省略 {window[1]} 条)"
+        self._windows[key] = [now, 0]
+        return True
+
+
+_listener = None
+_queue_handler = None
+
+
+def setup_logging(level=logging.INFO, queue_size=10000, stream=None):
+    """配置根 logger: 队列 + 后台输出线程，重复调用只会调整级别"""
+    global _listener, _queue_handler
+    root = logging.getLogger()
+    root.setLevel(level)
+    if _listener is not None:
+        return _listener
+
+    console = logging.StreamHandler(stream or sys.stdout)
+    console.setFormatter(logging.Formatter(LOG_FORMAT, DATE_FORMAT))
+
+    q = queue.Queue(queue_size)
+    _queue_handler = DroppingQueueHandler(q)
+    _queue_handler.addFilter(ThrottleFilter())
+    root.handlers = [_queue_handler]
+
+    _listener = logging.handlers.QueueListener(q, console, respect_handler_level=True)
+    _listener.start()
+    atexit.register(shutdown_logging)
+    return _listener
+
+
+def shutdown_logging():
+    """把队列里剩下的日志刷完 (程序退出时自动调用)"""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
+        if _queue_handler is not None and _queue_handler.dropped:
+            print(f"[log] 队列满丢弃了 {_queue_handler.dropped} 条日志", file=sys.stderr)
@@ -0,0 +1,48 @@
+import itertools
+import threading
+
+
+class LatestSlot:
+    """单槽邮箱: 写入方直接覆盖，读取方只拿最新值
+
+    槽里存的是 (版本号, 数据) 元组，写入就是一次引用赋值，CPython 下天然原子，
+    读写两边都不需要加锁。读取方用版本号判断有没有新数据，旧数据被覆盖即丢弃。
+    """
+
+    def __init__(self):
+        self._slot = None
+        self._counter = itertools.count(1)
+        self._event = threading.Event()
+        self._read_version = 0
+        self.overwritten = 0  # 读取方来不及取、被新值覆盖掉的次数
+
+    def put(self, item):
+        slot = (next(self._counter), item)
+        old, self._slot = self._slot, slot
+        if old is not None and old[0] > self._read_version:
+            self.overwritten += 1
+        self._event.set()
+        return slot[0]
+
+    def peek(self):
+        """返回 (版本号, 数据)，从未写入过则返回 None"""
+        slot = self._slot
+        if slot is not None:
+            self._read_version = slot[0]
+        return slot
+
+    def get_newer(self, version, timeout=None):
+        """阻塞等待比 version 更新的数据，超时返回 None"""
+        slot = self._slot
+        if slot is None or slot[0] <= version:
+            if timeout == 0:
+                return None
+            self._event.wait(timeout)
+            self._event.clear()
+            slot = self._slot
+            if slot is None or slot[0] <= version:
+                return None
+        else:
+            self._event.clear()
+        self._read_version = slot[0]
+        return slot
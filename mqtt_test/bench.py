@@ -0,0 +1,126 @@
+import struct
+import time
+
+from common.latency_histogram import LatencyHistogram
+
+# ================= 压测报文格式 =================
+# | magic(4) | flags(1) | seq(4) | ts(8, 发送时刻 clock_sync.now()) | total(4) | padding... |
+# total 只在 FIN 报文里有效: 告诉接收端一共发了多少条，用于计算尾部丢包
+BENCH_MAGIC = b"MQLB"
+BENCH_HEADER = struct.Struct(">4sBIdI")
+FLAG_FIN = 0x01
+
+
+def pack_bench(seq, ts, size, flags=0, total=0):
+    header = BENCH_HEADER.pack(BENCH_MAGIC, flags, seq, ts, total)
+    if size > len(header):
+        return header + bytes(size - len(header))
+    return header
+
+
+def unpack_bench(payload):
+    """返回 (flags, seq, ts, total)，不是压测报文则返回 None"""
+    if len(payload) < BENCH_HEADER.size or payload[:4] != BENCH_MAGIC:
+        return None
+    _, flags, seq, ts, total = BENCH_HEADER.unpack_from(payload)
+    return flags, seq, ts, total
+
+
+# ================= 接收端统计 =================
+class BenchStats:
+    """丢包 / 乱序 / 重复 / 抖动 / 吞吐 / 延迟分布"""
+
+    def __init__(self):
+        self.latency = LatencyHistogram()  # 微秒
+        self.seen = bytearray()
+        self.received = 0
+        self.bytes = 0
+        self.duplicates = 0
+        self.reordered = 0
+        self.max_seq = -1
+        self.total_sent = None
+        self.unsynced = 0
+        self.jitter_s = 0.0
+        self._last_transit = None
+        self.first_recv = None
+        self.last_recv = None
+
+    def on_packet(self, seq, ts, t_recv, size, synced=True):
+        """ts 必须已换算到本机时钟; synced=False 时只统计丢包/乱序，不计入延迟"""
+        if seq >= len(self.seen):
+            self.seen.extend(bytes(max(seq + 1 - len(self.seen), len(self.seen))))
+        if self.seen[seq]:
+            self.duplicates += 1
+            return
+        self.seen[seq] = 1
+
+        if seq < self.max_seq:
+            self.reordered += 1
+        else:
+            self.max_seq = seq
+
+        self.received += 1
+        self.bytes += size
+        if self.first_recv is None:
+            self.first_recv = t_recv
+        self.last_recv = t_recv
+
+        transit = t_recv - ts
+        if synced:
+            self.latency.record(transit * 1e6)
+        else:
+            self.unsynced += 1
+
+        # RFC 3550 到达间隔抖动: J += (|D| - J) / 16
+        if self._last_transit is not None:
+            d = abs(transit - self._last_transit)
+            self.jitter_s += (d - self.jitter_s) / 16.0
+        self._last_transit = transit
+
+    def on_fin(self, total):
+        self.total_sent = total
+
+    def expected(self):
+        if self.total_sent is not None:
+            return self.total_sent
+        return self.max_seq + 1
+
+    def lost(self):
+        return max(0, self.expected() - self.received)
+
+    def report(self):
+        expected = self.expected()
+        duration = (self.last_recv - self.first_recv) if self.received > 1 else 0.0
+        loss_pct = 100.0 * self.lost() / expected if expected else 0.0
+        lines = [
+            "=" * 60,
+            f"📊 收到 {self.received}/{expected} 条  丢包 {self.lost()} ({loss_pct:.2f}%)"
+            f"  乱序 {self.reordered}  重复 {self.duplicates}",
+            f"⏱️ 延迟 {self.latency.format()}",
+            f"〰️ 抖动 (RFC3550) {self.jitter_s * 1000:.3f} ms",
+        ]
+        if duration > 0:
+            lines.append(f"🚚 吞吐 {self.received / duration:.1f} msg/s"
+                         f"  {self.bytes * 8 / duration / 1e6:.3f} Mbit/s")
+        if self.unsynced:
+            lines.append(f"⚠️ {self.unsynced} 条在时钟同步完成前到达，未计入延迟")
+        if self.latency.overflow:
+            lines.append(f"⚠️ {self.latency.overflow} 个样本超过直方图上限")
+        lines.append("=" * 60)
+        return "\n".join(lines)
+
+
+class RatePacer:
+    """按绝对时间表发包，避免 sleep 误差累积"""
+
+    def __init__(self, rate_hz):
+        self.interval = 1.0 / rate_hz if rate_hz > 0 else 0.0
+        self.next_t = time.perf_counter()
+
+    def wait(self):
+        if not self.interval:
+            return
+        delay = self.next_t - time.perf_counter()
+        if delay > 0:
+            time.sleep(delay)
+        self.next_t += self.interval
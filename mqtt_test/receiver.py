@@ -1,57 +1,137 @@
-import time
+import os
+import sys
 import random
 import json
+import argparse
+import threading
 import paho.mqtt.client as mqtt
 
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from bench import BenchStats, unpack_bench, FLAG_FIN
+from common.local_broker import LocalBroker
+from common.clock_sync import ClockSync, now
+
 # --- 配置 ---
 BROKER = "broker.emqx.io"
 PORT = 1883
 TOPIC = "test/liang/command"
+BENCH_TOPIC = "test/liang/bench"
+CLOCK_TOPIC = "test/liang/clock"
 CLIENT_ID = f"mac_subscriber_{random.randint(0, 1000)}"
 
+FIN_GRACE = 1.0  # 收到 FIN 后再等一会儿，接住乱序的尾包
+
+args = None
+stats = BenchStats()
+stats_lock = threading.Lock()
+done = threading.Event()
+clock = ClockSync(CLOCK_TOPIC, CLIENT_ID)
+
 def on_connect(client, userdata, flags, rc, properties=None):
     if rc == 0:
         print(f"✅ [接收端] 连接成功! 监听中...")
-        client.subscribe(TOPIC)
+        clock.subscribe(client)
+        if args.bench:
+            client.subscribe(args.topic, qos=args.qos)
+        else:
+            client.subscribe(TOPIC)
     else:
         print(f"❌ 连接失败 code: {rc}")
 
 def on_message(client, userdata, msg):
     # 1. 获取接收时刻 (Arrival Time)
-    t_recv = time.time()
-    
+    t_recv = now()
+
     try:
         # 2. 解析 Payload
         payload_str = msg.payload.decode()
         data = json.loads(payload_str)
-        
+
         content = data.get("msg", "")
         t_send = data.get("ts", 0)
-        
-        # 3. 计算延迟 (秒 -> 毫秒)
-        latency_ms = (t_recv - t_send) * 1000
-        
+
+        # 3. 计算延迟 (秒 -> 毫秒)，扣除两台机器的时钟偏差
+        latency_ms = clock.latency(t_send, t_recv) * 1000
+
         # 4. 打印结果
         print("-" * 40)
         print(f"📩 [收到消息] 内容: {content}")
-        print(f"⏱️ [链路延迟] {latency_ms:.2f} ms")
-        
+        if clock.synced:
+            print(f"⏱️ [链路延迟] {latency_ms:.3f} ms (±{clock.error_bound() * 1000:.3f})")
+        else:
+            print(f"⏱️ [链路延迟] {latency_ms:.2f} ms (时钟未同步，仅供参考)")
+
         # 业务逻辑演示
         if content == "forward":
             print("   >>> 🤖 底盘前进")
-            
-    except json.JSONDecodeError:
+
+    except (UnicodeDecodeError, json.JSONDecodeError):
         print(f"⚠️ 收到非JSON格式消息: {msg.payload}")
 
+def on_bench_message(client, userdata, msg):
+    t_recv = now()
+    parsed = unpack_bench(msg.payload)
+    if parsed is None:
+        return
+    flags, seq, ts, total = parsed
+    with stats_lock:
+        if flags & FLAG_FIN:
+            stats.on_fin(total)
+            threading.Timer(FIN_GRACE, done.set).start()
+        else:
+            stats.on_packet(seq, clock.to_local(ts), t_recv, len(msg.payload), synced=clock.synced)
+
+def report_task(interval):
+    """压测过程中周期打印中间结果"""
+    while not done.wait(interval):
+        with stats_lock:
+            if stats.received:
+                print(f"… 已收 {stats.received} 条, 丢 {stats.lost()}, {stats.latency.format()}")
+        print(f"   🕒 时钟 {clock.describe()}")
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="MQTT 接收端 (交互 / 压测)")
+    parser.add_argument("--broker", default=BROKER)
+    parser.add_argument("--port", type=int, default=PORT)
+    parser.add_argument("--bench", action="store_true", help="压测模式")
+    parser.add_argument("--topic", default=BENCH_TOPIC, help="压测 Topic")
+    parser.add_argument("--qos", type=int, choices=(0, 1, 2), default=0, help="订阅 QoS")
+    parser.add_argument("--report-interval", type=float, default=2.0, help="中间结果打印间隔 s")
+    parser.add_argument("--local-broker", action="store_true",
+                        help="在本进程启动本地 Broker 并连接它 (发送端用 --broker 127.0.0.1)")
+    return parser.parse_args()
+
 # --- 主程序 ---
-client = mqtt.Client(mqtt.CallbackAPIVersion.VERSION2, client_id=CLIENT_ID)
-client.on_connect = on_connect
-client.on_message = on_message
+if __name__ == "__main__":
+    args = parse_args()
 
-print("[接收端] 连接 Broker: broker.emqx.io ...")
-client.connect(BROKER, PORT, 60)
+    if args.local_broker:
+        LocalBroker("0.0.0.0", args.port).start_in_thread()
+        args.broker = "127.0.0.1"
+        print(f"🧪 [接收端] 本地 Broker 已启动: 0.0.0.0:{args.port}")
 
-try:
-    client.loop_forever()
-except KeyboardInterrupt:
-    pass
+    client = mqtt.Client(mqtt.CallbackAPIVersion.VERSION2, client_id=CLIENT_ID)
+    client.on_connect = on_connect
+    client.on_message = on_bench_message if args.bench else on_message
+    clock.attach(client)
+
+    print(f"[接收端] 连接 Broker: {args.broker} ...")
+    client.connect(args.broker, args.port, 60)
+    clock.start()
+
+    try:
+        if args.bench:
+            client.loop_start()
+            threading.Thread(target=report_task, args=(args.report_interval,), daemon=True).start()
+            done.wait()
+        else:
+            client.loop_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        if args.bench:
+            client.loop_stop()
+            with stats_lock:
+                print(stats.report())
+            print(f"🕒 时钟 {clock.describe()}")
+        client.disconnect()
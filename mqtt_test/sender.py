@@ -1,46 +1,116 @@
+import os
+import sys
 import time
+import itertools
 import random
 import json
+import argparse
 import paho.mqtt.client as mqtt
 
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from bench import RatePacer, pack_bench, FLAG_FIN, BENCH_HEADER
+from common.clock_sync import ClockSyncResponder, now
+
 # --- 配置 ---
 BROKER = "broker.emqx.io"
 PORT = 1883
 TOPIC = "test/liang/command"
+BENCH_TOPIC = "test/liang/bench"
+CLOCK_TOPIC = "test/liang/clock"
 CLIENT_ID = f"mac_publisher_{random.randint(0, 1000)}"
 
+# 接收端会来 ping 我们，估计两边的时钟偏差
+clock_responder = ClockSyncResponder(CLOCK_TOPIC, CLIENT_ID)
+
 def on_connect(client, userdata, flags, rc, properties=None):
     if rc == 0:
         print(f"✅ [发送端] 就绪! (输入 q 退出)")
+        clock_responder.subscribe(client)
+
+def interactive(client):
+    """原来的交互模式: 每输入一行发一条"""
+    try:
+        while True:
+            msg = input("\n请输入指令 > ")
+            if msg.lower() == 'q': break
+
+            # 1. 封装数据包 (Payload)
+            # 打入当前的发送时刻 T_send (单调时钟，接收端负责换算偏差)
+            payload = {
+                "msg": msg,
+                "ts": now()
+            }
+
+            # 2. 序列化为 JSON 字符串
+            payload_str = json.dumps(payload)
+
+            # 3. 发送
+            client.publish(TOPIC, payload_str, qos=0)
+            print(f"🚀 数据包已发出 (Size: {len(payload_str)} bytes)")
+
+    except KeyboardInterrupt:
+        pass
+
+def run_bench(client, args):
+    """压测模式: 按固定速率发送带序号的定长报文"""
+    size = max(args.size, BENCH_HEADER.size)
+    # 没给 --count 时按时长发；--rate 0 (尽快) 算不出条数，发满 --duration 为止
+    total = args.count if args.count else (int(args.rate * args.duration) if args.rate > 0 else None)
+    amount = f"{total} 条" if total is not None else f"{args.duration:g}s"
+    rate = f"{args.rate} Hz" if args.rate > 0 else "尽快"
+    print(f"🏁 [压测] {amount} @ {rate}, {size} bytes, QoS {args.qos} -> {args.topic}")
+
+    pacer = RatePacer(args.rate)
+    t0 = time.perf_counter()
+    deadline = t0 + args.duration if total is None else None
+    sent = 0
+    try:
+        for seq in range(total) if total is not None else itertools.count():
+            if deadline is not None and time.perf_counter() >= deadline:
+                break
+            pacer.wait()
+            client.publish(args.topic, pack_bench(seq, now(), size), qos=args.qos)
+            sent += 1
+    except KeyboardInterrupt:
+        print("\n⏹️ 提前中止")
+    elapsed = time.perf_counter() - t0
+
+    # FIN 用 QoS1 发，保证接收端能拿到总数
+    info = client.publish(args.topic, pack_bench(sent, now(), 0, flags=FLAG_FIN, total=sent), qos=1)
+    info.wait_for_publish(timeout=5)
+    print(f"✅ [压测] 已发送 {sent} 条，用时 {elapsed:.2f}s，实际速率 {sent / elapsed if elapsed else 0:.1f} msg/s")
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="MQTT 发送端 (交互 / 压测)")
+    parser.add_argument("--broker", default=BROKER)
+    parser.add_argument("--port", type=int, default=PORT)
+    parser.add_argument("--bench", action="store_true", help="压测模式")
+    parser.add_argument("--topic", default=BENCH_TOPIC, help="压测 Topic")
+    parser.add_argument("--rate", type=float, default=100.0, help="发包速率 Hz (0=尽快)")
+    parser.add_argument("--size", type=int, default=64, help="报文大小 bytes")
+    parser.add_argument("--qos", type=int, choices=(0, 1, 2), default=0)
+    parser.add_argument("--count", type=int, default=0, help="发送条数 (优先于 --duration)")
+    parser.add_argument("--duration", type=float, default=10.0, help="压测时长 s")
+    return parser.parse_args()
+
+if __name__ == "__main__":
+    args = parse_args()
+
+    client = mqtt.Client(mqtt.CallbackAPIVersion.VERSION2, client_id=CLIENT_ID)
+    client.on_connect = on_connect
+    clock_responder.attach(client)
+    if args.bench:
+        # QoS1/2 压测时放开飞行窗口，避免被默认的 20 条限制住速率
+        client.max_inflight_messages_set(1000)
+    client.connect(args.broker, args.port, 60)
+    client.loop_start()
+
+    time.sleep(1) # 等连接稳定
+
+    if args.bench:
+        run_bench(client, args)
+    else:
+        interactive(client)
 
-client = mqtt.Client(mqtt.CallbackAPIVersion.VERSION2, client_id=CLIENT_ID)
-client.on_connect = on_connect
-client.connect(BROKER, PORT, 60)
-client.loop_start()
-
-time.sleep(1) # 等连接稳定
-
-try:
-    while True:
-        msg = input("\n请输入指令 > ")
-        if msg.lower() == 'q': break
-        
-        # 1. 封装数据包 (Payload)
-        # 打入当前的发送时刻 T_send
-        payload = {
-            "msg": msg,
-            "ts": time.time() 
-        }
-        
-        # 2. 序列化为 JSON 字符串
-        payload_str = json.dumps(payload)
-        
-        # 3. 发送
-        client.publish(TOPIC, payload_str, qos=0)
-        print(f"🚀 数据包已发出 (Size: {len(payload_str)} bytes)")
-
-except KeyboardInterrupt:
-    pass
-
-client.loop_stop()
-client.disconnect()
+    client.loop_stop()
+    client.disconnect()
@@ -0,0 +1,22 @@
+"""画质自适应: 反馈报告的解析"""
+import os
+import sys
+from types import SimpleNamespace
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.join(ROOT, "vision_test"))
+
+from adaptive_stream import AdaptiveController
+
+
+def test_feedback_must_be_an_object():
+    controller = AdaptiveController()
+    requests = []
+    controller.listeners.append(lambda report: report.get("need_keyframe") and requests.append(report))
+    for payload in (b"3", b"[1, 2]", b'"text"', b"null", b"not json"):
+        controller._on_feedback(None, None, SimpleNamespace(payload=payload))
+    assert controller.feedback is None and not requests
+
+    controller._on_feedback(None, None, SimpleNamespace(payload=b'{"need_keyframe": true}'))
+    assert controller.feedback == {"need_keyframe": True} and len(requests) == 1
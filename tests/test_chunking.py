@@ -0,0 +1,53 @@
+"""大消息分片: 拼装、迟到分片、发送端重启后消息号重新计数"""
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from common.chunking import Chunker, Reassembler
+
+
+def feed(reassembler, chunks, now):
+    done = [reassembler.add(chunk, now) for chunk in chunks]
+    return [d for d in done if d is not None]
+
+
+def test_round_trip_and_small_passthrough():
+    chunker, reassembler = Chunker(chunk_size=64), Reassembler()
+    payload = bytes(range(256)) * 3
+    assert feed(reassembler, chunker.split(payload), 0.0) == [payload]
+    assert reassembler.add(b"small", 0.0) == b"small"
+
+
+def test_late_fragment_of_older_message_is_dropped():
+    chunker, reassembler = Chunker(chunk_size=64), Reassembler()
+    old = chunker.split(b"a" * 200)
+    new = chunker.split(b"b" * 200)
+    assert feed(reassembler, new, 0.0) == [b"b" * 200]
+    assert feed(reassembler, old, 0.01) == []
+    assert reassembler.superseded == len(old)
+
+
+def test_sender_restart_resets_message_ids():
+    reassembler = Reassembler()
+    before = Chunker(chunk_size=64)
+    before._ids = iter(range(1000, 1010))
+    for i in range(10):
+        assert feed(reassembler, before.split(bytes([i]) * 200), i * 0.04)
+
+    # 重启后消息号从 0 重新开始，紧接着就到 (比超时还快)
+    after = Chunker(chunk_size=64)
+    after._ids = iter(range(10))
+    for i in range(10):
+        assert feed(reassembler, after.split(bytes([i]) * 200), 0.4 + i * 0.04) == [bytes([i]) * 200]
+    assert reassembler.restarts == 1
+    assert reassembler.superseded == 0
+
+
+def test_small_backward_jump_after_pause_starts_new_sequence():
+    reassembler = Reassembler(timeout=0.5)
+    chunker = Chunker(chunk_size=64)
+    chunker._ids = iter([100, 98])
+    assert feed(reassembler, chunker.split(b"x" * 200), 0.0)
+    assert feed(reassembler, chunker.split(b"y" * 200), 2.0) == [b"y" * 200]
+    assert reassembler.restarts == 1
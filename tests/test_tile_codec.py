@@ -0,0 +1,84 @@
+"""分块增量编码: 多个编码线程乱序完成时，观看端不能收到引用了未发出关键帧的增量帧"""
+import os
+import sys
+import threading
+import time
+
+import cv2
+import numpy as np
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.join(ROOT, "vision_test"))
+
+from frame_header import FLAG_KEYFRAME, pack_frame, unpack_frame
+from frame_pipeline import FramePipeline
+from tile_codec import TileDecoder, TileEncoder
+
+
+def make_frame(i, width=160, height=120):
+    image = np.full((height, width, 3), 80, np.uint8)
+    x = (i * 7) % (width - 24)
+    cv2.rectangle(image, (x, 40), (x + 24, 64), (0, 200, 255), -1)
+    return image
+
+
+def decode(decoder, seq, data, flags):
+    header, payload = unpack_frame(pack_frame(seq, 0.0, 0.0, 160, 120, data, flags))
+    return decoder.decode(header, payload)
+
+
+def test_delta_published_before_its_keyframe():
+    encoder = TileEncoder(keyframe_interval=60.0)
+    decoder = TileDecoder()
+
+    data, flags = encoder.encode(make_frame(0), 0, 80)
+    assert flags == FLAG_KEYFRAME
+    decode(decoder, 0, data, flags)
+    encoder.on_published(0, flags)
+
+    encoder.request_keyframe()
+    key_data, key_flags = encoder.encode(make_frame(1), 1, 80)
+    delta_data, delta_flags = encoder.encode(make_frame(2), 2, 80)
+    assert key_flags == FLAG_KEYFRAME and delta_flags != FLAG_KEYFRAME
+
+    # 增量帧 2 先编好先发出，关键帧 1 随后被流水线当作过时帧丢掉
+    assert decode(decoder, 2, delta_data, delta_flags) is not None
+    assert decoder.missing_ref == 0
+
+    # 关键帧 1 一直没确认，超时后重新出关键帧
+    encoder._pending[1] = (encoder._pending[1][0], time.monotonic() - 1.0)
+    data, flags = encoder.encode(make_frame(3), 3, 80)
+    assert flags == FLAG_KEYFRAME
+    assert encoder.lost_keyframes == 1
+
+
+def test_pipeline_with_several_encoders():
+    encoder = TileEncoder(keyframe_interval=0.03)
+    decoder = TileDecoder()
+    frames = iter(range(10 ** 9))
+    errors = []
+    lock = threading.Lock()
+
+    def capture():
+        return time.time(), make_frame(next(frames))
+
+    def encode(image, seq):
+        data, flags = encoder.encode(image, seq, 80)
+        if flags & FLAG_KEYFRAME:
+            time.sleep(0.02)  # 关键帧编得慢，后面的增量帧先完成
+        return data, image.shape[1], image.shape[0], flags
+
+    def publish(frame):
+        with lock:
+            if decode(decoder, frame.seq, frame.data, frame.flags) is None:
+                errors.append(frame.seq)
+        encoder.on_published(frame.seq, frame.flags)
+
+    pipeline = FramePipeline(capture, encode, publish, fps=200.0, encoders=4).start()
+    time.sleep(1.5)
+    pipeline.stop()
+
+    assert pipeline.published > 50
+    assert encoder.keyframes > 5 and encoder.deltas > 5
+    assert decoder.missing_ref == 0, errors
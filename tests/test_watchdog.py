@@ -0,0 +1,44 @@
+"""看门狗: 超时回调执行期间来了新指令，不能再停车"""
+import os
+import sys
+import threading
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.join(ROOT, "can_test"))
+
+from watchdog import ARMED, DeadlineWatchdog
+
+
+def run_expiry(feed_during_callback):
+    entered, release, done = threading.Event(), threading.Event(), threading.Event()
+    stopped = []
+
+    def on_expire(generation):
+        entered.set()
+        release.wait(1.0)
+        stopped.append(watchdog.if_still_expired(generation, lambda: None))
+        done.set()
+
+    watchdog = DeadlineWatchdog(0.02, on_expire)
+    watchdog.start()
+    watchdog.kick()
+    assert entered.wait(1.0)
+    if feed_during_callback:
+        watchdog.timeout = 10.0  # 重新上膛后别再超时
+        watchdog.kick()
+    release.set()
+    assert done.wait(1.0)
+    watchdog.stop()
+    return watchdog, stopped[0]
+
+
+def test_stop_when_no_command_arrived():
+    watchdog, stopped = run_expiry(feed_during_callback=False)
+    assert stopped and watchdog.fired == 1
+
+
+def test_no_stop_after_feed_during_callback():
+    watchdog, stopped = run_expiry(feed_during_callback=True)
+    assert not stopped
+    assert watchdog.rearmed == 1 and watchdog.state == ARMED
@@ -0,0 +1,207 @@
+"""图像流自适应: 按链路状况调整分辨率 / JPEG 质量 / 帧率
+
+输入两路信号:
+
+- 观看端每秒在 <camera_topic>/feedback 上回报接收帧率、解码耗时、到达间隔抖动
+- 本地 paho 发送队列里还没写进 socket 的帧数 (上行带宽不够时最先堆积的地方)
+
+控制策略 (类似 AIMD):
+- 发送积压、观看端帧率明显低于发送帧率、抖动超过半个帧间隔 -> 立即降一档
+- 连续 UPGRADE_AFTER 个周期健康才升一档；刚降档后升档被拒的话冷却时间加倍，
+  避免在带宽边缘来回抖
+- 没有观看端反馈 (没人看或反馈丢了) 时只看发送积压，不主动升档
+"""
+import json
+import time
+from collections import deque, namedtuple
+
+QualityLevel = namedtuple("QualityLevel", "width height quality fps")
+
+# 从低到高的档位
+LADDER = [
+    QualityLevel(160, 120, 35, 8),
+    QualityLevel(320, 240, 40, 10),
+    QualityLevel(320, 240, 55, 15),
+    QualityLevel(480, 360, 60, 20),
+    QualityLevel(640, 480, 70, 25),
+    QualityLevel(640, 480, 80, 30),
+]
+DEFAULT_LEVEL = 1  # 320x240 q40 10fps，和原来的固定配置接近
+
+FEEDBACK_INTERVAL = 1.0  # 观看端回报周期 (秒)
+FEEDBACK_STALE = 3.0     # 超过这么久没有反馈就当作没有
+UPGRADE_AFTER = 3        # 连续健康周期数
+MAX_BACKLOG = 2          # 发送队列里允许积压的帧数
+MIN_FPS_RATIO = 0.8      # 观看端帧率 / 发送帧率 低于它视为拥塞
+SETTLE_TIME = 2.5        # 换档后观看端统计窗口 (2 个回报周期) 还带着旧档位，这段时间的反馈不用
+
+
+def feedback_topic(camera_topic):
+    return f"{camera_topic}/feedback"
+
+
+# ================= 观看端: 统计并回报 =================
+class StreamMonitor:
+    """观看端统计: 每收到一帧调用 on_frame，每秒 report() 一次发回机器人"""
+
+    def __init__(self):
+        self._arrivals = deque(maxlen=120)  # 最近的到达时刻
+        self._decode_ms = deque(maxlen=120)
+        self.jitter = 0.0  # 到达间隔偏差的平滑值 (秒)，同 RFC 3550
+        self.received = 0
+        self._last_gap = None
+        self.need_keyframe = False  # 分块模式: 收到引用未知关键帧的增量帧，请机器人补发
+
+    def on_frame(self, t_arrival, decode_time):
+        if self._arrivals:
+            gap = t_arrival - self._arrivals[-1]
+            if self._last_gap is not None:
+                self.jitter += (abs(gap - self._last_gap) - self.jitter) / 16.0
+            self._last_gap = gap
+        self._arrivals.append(t_arrival)
+        self._decode_ms.append(decode_time * 1000.0)
+        self.received += 1
+
+    def fps(self, now=None):
+        now = time.monotonic() if now is None else now
+        recent = [t for t in self._arrivals if now - t <= FEEDBACK_INTERVAL * 2]
+        if len(recent) < 2:
+            return 0.0
+        return (len(recent) - 1) / max(now - recent[0], recent[-1] - recent[0])
+
+    def report(self):
+        decode = sorted(self._decode_ms)
+        report = {
+            "fps": round(self.fps(), 2),
+            "decode_ms": round(decode[len(decode) // 2], 2) if decode else 0.0,
+            "jitter_ms": round(self.jitter * 1000.0, 2),
+            "received": self.received,
+        }
+        if self.need_keyframe:
+            report["need_keyframe"] = True
+            self.need_keyframe = False
+        return report
+
+    def publish(self, client, camera_topic):
+        client.publish(feedback_topic(camera_topic), json.dumps(self.report()), qos=0)
+
+
+# ================= 机器人端: 发送积压 =================
+class OutboundTracker:
+    """记录已交给 paho 的帧，数一数还有多少没写进 socket"""
+
+    def __init__(self, maxlen=64):
+        self._infos = deque(maxlen=maxlen)
+
+    def add(self, info):
+        self._infos.append(info)
+
+    def depth(self):
+        while self._infos and self._infos[0].is_published():
+            self._infos.popleft()
+        return sum(1 for info in self._infos if not info.is_published())
+
+
+# ================= 机器人端: 档位控制 =================
+class AdaptiveController:
+    """每个控制周期调用一次 update()，返回当前档位"""
+
+    def __init__(self, ladder=None, level=DEFAULT_LEVEL, backlog=None):
+        self.ladder = ladder or LADDER
+        self.index = level
+        self.backlog = backlog  # 返回发送积压帧数的函数
+        self.feedback = None
+        self._feedback_t = None
+        self.listeners = []  # 收到反馈时额外通知的回调 listener(report)
+        self._healthy = 0
+        self._cooldown = UPGRADE_AFTER
+        self._upgrade_failed_at = None  # 上次升档的档位，升上去马上又掉下来就加长冷却
+        self._changed_t = float("-inf")
+
+        self.upgrades = 0
+        self.downgrades = 0
+        self.reason = ""
+
+    @property
+    def level(self):
+        return self.ladder[self.index]
+
+    def attach(self, client, camera_topic):
+        client.message_callback_add(feedback_topic(camera_topic), self._on_feedback)
+
+    def subscribe(self, client, camera_topic):
+        client.subscribe(feedback_topic(camera_topic))
+
+    def _on_feedback(self, client, userdata, msg):
+        try:
+            self.on_feedback(json.loads(msg.payload))
+        except (ValueError, TypeError):
+            pass
+
+    def on_feedback(self, report, t=None):
+        if not isinstance(report, dict):
+            return  # 合法 JSON 但不是对象 (数字、列表...)，不是观看端的报告
+        self.feedback = report
+        self._feedback_t = time.monotonic() if t is None else t
+        for listener in self.listeners:
+            listener(report)
+
+    def congestion(self, now=None):
+        """返回拥塞原因，健康时返回空字符串"""
+        now = time.monotonic() if now is None else now
+        level = self.level
+        backlog = self.backlog() if self.backlog else 0
+        if backlog > MAX_BACKLOG:
+            return f"发送积压 {backlog} 帧"
+        if not self._has_feedback(now):
+            return ""
+        fb = self.feedback
+        if fb.get("fps", 0.0) < level.fps * MIN_FPS_RATIO:
+            return f"观看端 {fb.get('fps', 0.0):.1f}fps < {level.fps}fps"
+        if fb.get("jitter_ms", 0.0) > 500.0 / level.fps:
+            return f"抖动 {fb.get('jitter_ms', 0.0):.1f}ms"
+        if fb.get("decode_ms", 0.0) > 1000.0 / level.fps:
+            return f"观看端解码 {fb.get('decode_ms', 0.0):.1f}ms 跟不上"
+        return ""
+
+    def _has_feedback(self, now):
+        """有新鲜的、换档之后的观看端反馈"""
+        return (self._feedback_t is not None and now - self._feedback_t < FEEDBACK_STALE
+                and self._feedback_t >= self._changed_t + SETTLE_TIME)
+
+    def update(self, now=None):
+        now = time.monotonic() if now is None else now
+        reason = self.congestion(now)
+        has_feedback = self._has_feedback(now)
+        if reason:
+            self._healthy = 0
+            if self.index > 0:
+                if self._upgrade_failed_at == self.index:
+                    # 刚升上来就拥塞: 这一档带宽不够，下次多等一会儿再试
+                    self._cooldown = min(self._cooldown * 2, 60)
+                self.index -= 1
+                self.downgrades += 1
+                self.reason = reason
+                self._changed_t = now
+        else:
+            self._healthy += 1
+            if has_feedback and self._healthy >= self._cooldown and self.index < len(self.ladder) - 1:
+                self.index += 1
+                self.upgrades += 1
+                self._healthy = 0
+                self._upgrade_failed_at = self.index
+                self.reason = "链路健康"
+                self._changed_t = now
+            elif self._healthy >= 10 * UPGRADE_AFTER:
+                # 长时间稳定在这一档: 冷却恢复默认
+                self._upgrade_failed_at = None
+                self._cooldown = UPGRADE_AFTER
+        return self.level
+
+    def describe(self):
+        level = self.level
+        fb = self.feedback or {}
+        return (f"档位 {self.index} {level.width}x{level.height} q{level.quality} {level.fps}fps"
+                f" | 升 {self.upgrades} 降 {self.downgrades} ({self.reason or '-'})"
+                f" | 观看端 {fb.get('fps', '-')}fps 解码 {fb.get('decode_ms', '-')}ms"
+                f" 抖动 {fb.get('jitter_ms', '-')}ms")
@@ -0,0 +1,128 @@
+"""图像帧元数据头 + 观看端的端到端指标
+
+每帧 JPEG 前面加一个固定 22 字节的二进制头 (大端):
+
+    | version(1) | flags(1) | seq(4) | capture_ts(8, clock_sync.now()) | encode_us(4) | width(2) | height(2) |
+
+JPEG 以 0xFFD8 开头，version 字节 0x91 不会和它冲突，观看端仍然能显示老版本
+机器人发来的裸 JPEG (只是没有指标)。
+
+观看端用 ClockSync 把机器人的采集时间换算到本机，得到采集 -> 显示的延迟
+(glass-to-glass，不含摄像头曝光和屏幕刷新)，并按序号统计丢帧。
+"""
+import struct
+import time
+from collections import deque, namedtuple
+
+from common.clock_sync import now
+from common.latency_histogram import LatencyHistogram
+
+FRAME_VERSION = 0x91
+FRAME_HEADER = struct.Struct(">BBIdIHH")
+JPEG_MAGIC = b"\xff\xd8"
+
+# flags
+FLAG_KEYFRAME = 0x01  # 分块模式的关键帧 (完整 JPEG，后续增量帧以它为参考)
+FLAG_DELTA = 0x02     # 分块模式的增量帧 (负载格式见 tile_codec)
+
+FrameHeader = namedtuple("FrameHeader", "seq ts encode_time width height flags")
+
+
+def pack_frame(seq, ts, encode_time, width, height, data, flags=0):
+    header = FRAME_HEADER.pack(FRAME_VERSION, flags, seq & 0xFFFFFFFF, ts,
+                               min(int(encode_time * 1e6), 0xFFFFFFFF), width, height)
+    return header + data
+
+
+def unpack_frame(payload):
+    """返回 (FrameHeader 或 None, 图像数据)；格式错误抛 ValueError"""
+    if payload[:2] == JPEG_MAGIC:
+        return None, payload
+    if len(payload) < FRAME_HEADER.size or payload[0] != FRAME_VERSION:
+        raise ValueError(f"未知图像帧格式: {bytes(payload[:2]).hex()}")
+    _, flags, seq, ts, encode_us, width, height = FRAME_HEADER.unpack_from(payload)
+    return FrameHeader(seq, ts, encode_us / 1e6, width, height, flags), payload[FRAME_HEADER.size:]
+
+
+class FrameMetrics:
+    """观看端指标: 收到帧调用 on_frame，真正显示出来时调用 on_display"""
+
+    def __init__(self, clock=None):
+        self.clock = clock
+        self.glass_to_glass = LatencyHistogram()  # 采集 -> 显示 (微秒)
+        self.network = LatencyHistogram()         # 编码完成 -> 到达
+        self.decode = LatencyHistogram()
+        self.encode = LatencyHistogram()          # 机器人端编码耗时
+
+        self.received = 0
+        self.lost = 0
+        self.late = 0      # 序号比已收到的最大值还小 (乱序)
+        self.restarts = 0  # 机器人重启，序号从头开始
+        self.skipped = 0   # 到达了但来不及解码被跳过的帧 (由解码方更新，也计入 lost)
+        self._max_seq = None
+        self._displays = deque(maxlen=60)
+        self.last_latency = None
+
+    def on_frame(self, header, t_arrival, decode_time):
+        """t_arrival: now() 时间戳"""
+        self.received += 1
+        self.decode.record(decode_time * 1e6)
+        if header is None:
+            return
+        self.encode.record(header.encode_time * 1e6)
+        if self._max_seq is None or header.seq + 1000 < self._max_seq:
+            if self._max_seq is not None:
+                self.restarts += 1
+            self._max_seq = header.seq
+        elif header.seq > self._max_seq:
+            self.lost += header.seq - self._max_seq - 1
+            self._max_seq = header.seq
+        else:
+            self.late += 1
+            self.lost = max(0, self.lost - 1)  # 之前算作丢失的帧迟到了
+        if self.clock is not None and self.clock.synced:
+            sent = self.clock.to_local(header.ts) + header.encode_time
+            self.network.record(max(0.0, t_arrival - sent) * 1e6)
+
+    def on_display(self, header, t_display=None):
+        t_display = now() if t_display is None else t_display
+        self._displays.append(time.monotonic())
+        if header is None or self.clock is None or not self.clock.synced:
+            self.last_latency = None
+            return
+        latency = t_display - self.clock.to_local(header.ts)
+        self.last_latency = latency
+        self.glass_to_glass.record(max(0.0, latency) * 1e6)
+
+    def fps(self):
+        if len(self._displays) < 2:
+            return 0.0
+        span = time.monotonic() - self._displays[0]
+        return (len(self._displays) - 1) / span if span > 0 else 0.0
+
+    def loss_ratio(self):
+        total = self.received + self.lost
+        return self.lost / total if total else 0.0
+
+    def overlay_lines(self):
+        """画在画面上的几行 (cv2.putText 只支持 ASCII)"""
+        if self.last_latency is not None:
+            e2e = f"e2e {self.last_latency * 1000:.0f}ms p50 {self.glass_to_glass.percentile(50) / 1000:.0f}ms"
+        elif self.clock is not None and not self.clock.synced:
+            e2e = "e2e -- (clock syncing)"
+        else:
+            e2e = "e2e -- (no header)"
+        return [
+            e2e,
+            f"decode {self.decode.percentile(50) / 1000:.1f}ms enc {self.encode.percentile(50) / 1000:.1f}ms",
+            f"{self.fps():.1f}fps loss {self.loss_ratio() * 100:.1f}% ({self.lost})",
+        ]
+
+    def describe(self):
+        lines = [f"收到 {self.received} 丢失 {self.lost} ({self.loss_ratio() * 100:.2f}%)"
+                 f" (其中解码前跳过 {self.skipped}) 乱序 {self.late} 重启 {self.restarts}"]
+        for name, hist in (("采集->显示", self.glass_to_glass), ("网络", self.network),
+                           ("解码", self.decode), ("编码", self.encode)):
+            if hist.total:
+                lines.append(f"  {name} {hist.format()}")
+        return "\n".join(lines)
@@ -0,0 +1,193 @@
+"""采集 -> 编码 -> 发布 三段流水线
+
+原来一个线程里串行 copy / putText / imencode / publish，任何一步卡一下帧率就掉。
+这里拆成三段，中间用有界的"丢最旧"队列连接:
+
+- 采集线程按目标帧率出帧，编码跟不上时队列里最旧的帧被挤掉，不会越积越多
+- 编码用线程池 (cv2.imencode 会释放 GIL，多核上是真并行)
+- 发布线程按序号发出，编码池乱序完成时比已发出的还旧的帧直接丢弃，画面不会倒退
+
+每段都记录耗时分布，describe() 一眼看出时间花在哪。
+"""
+import threading
+import time
+from collections import deque, namedtuple
+
+from common.latency_histogram import LatencyHistogram
+
+# seq: 帧序号；t_capture: 采集时刻 (采集函数给的时间戳)；encode_time: 编码耗时 (秒)
+# t_captured / t_encoded: 本机单调时钟，用于流水线内部计时
+CapturedFrame = namedtuple("CapturedFrame", "seq t_capture t_captured image")
+EncodedFrame = namedtuple("EncodedFrame", "seq t_capture t_captured t_encoded data encode_time width height flags")
+
+
+class DropOldestQueue:
+    """有界队列: 满了挤掉最旧的一项而不是阻塞生产者"""
+
+    def __init__(self, maxsize):
+        self._items = deque(maxlen=maxsize)
+        self._cond = threading.Condition()
+        self._closed = False
+        self.dropped = 0
+
+    def put(self, item):
+        with self._cond:
+            if len(self._items) == self._items.maxlen:
+                self.dropped += 1
+            self._items.append(item)
+            self._cond.notify()
+
+    def get(self, timeout=None):
+        """取最旧的一项；超时或已关闭返回 None"""
+        with self._cond:
+            if not self._items and not self._closed:
+                self._cond.wait(timeout)
+            return self._items.popleft() if self._items else None
+
+    def close(self):
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+
+    def __len__(self):
+        return len(self._items)
+
+
+class FramePipeline:
+    """capture() -> (t_capture, image)；encode(image, seq) -> (bytes, width, height, flags)；publish(EncodedFrame)
+
+    capture 返回 None 表示这一拍没有画面 (跳过)。fps 可以随时修改，下一拍生效。
+    """
+
+    def __init__(self, capture, encode, publish, fps=25.0, encoders=2, queue_size=2):
+        self.capture = capture
+        self.encode = encode
+        self.publish = publish
+        self.fps = fps
+        self.encoders = encoders
+
+        self.encode_queue = DropOldestQueue(queue_size)
+        self.publish_queue = DropOldestQueue(queue_size)
+        self._stop_event = threading.Event()
+        self._threads = []
+        self._seq = 0
+        self._last_published = -1
+
+        # 各段耗时 (微秒)
+        self.timing = {
+            "capture": LatencyHistogram(),
+            "encode_wait": LatencyHistogram(),   # 采集完到开始编码
+            "encode": LatencyHistogram(),
+            "publish_wait": LatencyHistogram(),  # 编码完到开始发布
+            "publish": LatencyHistogram(),
+            "total": LatencyHistogram(),         # 采集完成到发布完成
+        }
+        self.published = 0
+        self.bytes = 0
+        self.stale = 0  # 编码完成时已经比发出的帧旧，丢弃
+        self.errors = 0
+        self._fps_window = (time.monotonic(), 0, 0)
+        self.out_fps = 0.0
+        self.out_kbps = 0.0
+
+    # ---------- 生命周期 ----------
+    def start(self):
+        self._spawn(self._capture_loop, "capture")
+        for i in range(self.encoders):
+            self._spawn(self._encode_loop, f"encode-{i}")
+        self._spawn(self._publish_loop, "publish")
+        return self
+
+    def _spawn(self, target, name):
+        t = threading.Thread(target=target, name=f"pipeline-{name}", daemon=True)
+        t.start()
+        self._threads.append(t)
+
+    def stop(self, timeout=1.0):
+        self._stop_event.set()
+        self.encode_queue.close()
+        self.publish_queue.close()
+        for t in self._threads:
+            t.join(timeout)
+
+    # ---------- 各段 ----------
+    def _capture_loop(self):
+        next_t = time.monotonic()
+        while not self._stop_event.is_set():
+            t0 = time.monotonic()
+            try:
+                captured = self.capture()
+            except Exception:
+                captured = None
+                self.errors += 1
+            if captured is not None:
+                t_capture, image = captured
+                t1 = time.monotonic()
+                self.timing["capture"].record((t1 - t0) * 1e6)
+                self.encode_queue.put(CapturedFrame(self._seq, t_capture, t1, image))
+                self._seq += 1
+
+            # 按绝对时间表出帧；落后超过一帧就重新对齐
+            next_t += 1.0 / self.fps
+            now = time.monotonic()
+            if next_t < now - 1.0 / self.fps:
+                next_t = now
+            self._stop_event.wait(max(0.0, next_t - now))
+
+    def _encode_loop(self):
+        while not self._stop_event.is_set():
+            frame = self.encode_queue.get(timeout=0.5)
+            if frame is None:
+                continue
+            t0 = time.monotonic()
+            self.timing["encode_wait"].record((t0 - frame.t_captured) * 1e6)
+            try:
+                data, width, height, flags = self.encode(frame.image, frame.seq)
+            except Exception:
+                self.errors += 1
+                continue
+            t1 = time.monotonic()
+            self.timing["encode"].record((t1 - t0) * 1e6)
+            self.publish_queue.put(EncodedFrame(frame.seq, frame.t_capture, frame.t_captured, t1,
+                                                data, t1 - t0, width, height, flags))
+
+    def _publish_loop(self):
+        while not self._stop_event.is_set():
+            frame = self.publish_queue.get(timeout=0.5)
+            if frame is None:
+                continue
+            if frame.seq <= self._last_published:
+                self.stale += 1
+                continue
+            t0 = time.monotonic()
+            self.timing["publish_wait"].record((t0 - frame.t_encoded) * 1e6)
+            try:
+                self.publish(frame)
+            except Exception:
+                self.errors += 1
+                continue
+            t1 = time.monotonic()
+            self.timing["publish"].record((t1 - t0) * 1e6)
+            self._last_published = frame.seq
+            self.published += 1
+            self.bytes += len(frame.data)
+            self.timing["total"].record((t1 - frame.t_captured) * 1e6)
+
+    # ---------- 统计 ----------
+    def update_fps(self):
+        now = time.monotonic()
+        t0, n0, b0 = self._fps_window
+        if now - t0 > 0:
+            self.out_fps = (self.published - n0) / (now - t0)
+            self.out_kbps = (self.bytes - b0) * 8 / 1000.0 / (now - t0)
+        self._fps_window = (now, self.published, self.bytes)
+        return self.out_fps
+
+    def describe(self):
+        lines = [f"目标 {self.fps:.0f}fps 实际 {self.update_fps():.1f}fps {self.out_kbps:.0f}kbps 已发 {self.published}"
+                 f" | 丢帧: 待编码 {self.encode_queue.dropped} 待发布 {self.publish_queue.dropped}"
+                 f" 过时 {self.stale} 异常 {self.errors}"]
+        for name, hist in self.timing.items():
+            if hist.total:
+                lines.append(f"  {name:<12} {hist.format()}")
+        return "\n".join(lines)
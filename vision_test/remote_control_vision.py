@@ -1,75 +1,202 @@
+import os
+import sys
 import time
-import json
+import threading
 import cv2
 import numpy as np
 import paho.mqtt.client as mqtt
 
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from common.chunking import Reassembler
+from common.clock_sync import ClockSync, ClockSyncResponder, now
+from common.cmd_codec import CmdEncoder, FLAG_ESTOP, ENCODING_AUTO
+from common.cmd_stream import CommandStreamer
+from common.mailbox import LatestSlot
+from adaptive_stream import StreamMonitor, FEEDBACK_INTERVAL
+from frame_header import FrameMetrics, unpack_frame
+from tile_codec import TileDecoder
+
 # ================= 架构配置 =================
 MQTT_BROKER = "broker.emqx.io"
 MQTT_PORT = 1883
 
 TOPIC_CMD = "liang/retail/cmd_vel"   # 发送
 TOPIC_IMG = "liang/retail/camera"    # 接收
+TOPIC_CLOCK = "liang/retail/clock"   # 时钟同步 (机器人来 ping)
+TOPIC_CLOCK_ROBOT = "liang/retail/clock_robot"  # 时钟同步 (本端 ping 机器人，换算帧采集时间)
 
 CLIENT_ID = f"controller_mac_{int(time.time())}"
 
+# 指令编码: auto = 机器人声明支持二进制就用二进制，否则 JSON
+CMD_ENCODING = ENCODING_AUTO
+
+# 持续指令流: 指令不变时按心跳重发 (机器人看门狗 0.5s)，停车时降到 IDLE_HZ
+HEARTBEAT_HZ = 10.0
+IDLE_HZ = 1.0
+
+clock_responder = ClockSyncResponder(TOPIC_CLOCK, CLIENT_ID)
+robot_clock = ClockSync(TOPIC_CLOCK_ROBOT, CLIENT_ID)
+encoder = CmdEncoder(TOPIC_CMD, CMD_ENCODING)
+
 # 速度预设
 SPEED_LINEAR = 0.5  # m/s
 SPEED_ANGULAR = 1.0 # rad/s
 
-# 全局变量：存储最新一帧图像
-current_frame = None
+UI_POLL = 0.01  # 没有新帧时，界面线程最多等这么久就去处理一次按键
+
+# 图像单独走一条 MQTT 连接: 发指令不用和收图像抢同一条连接
+SEPARATE_MEDIA_CONNECTION = True
+# 机器人分片发来的大帧在这里拼回；超时没拼齐的整帧丢弃 (算作丢帧)
+CHUNK_TIMEOUT = 0.5
+reassembler = Reassembler(CHUNK_TIMEOUT)
+
+# 网络线程 -> 解码线程 -> 界面线程，都只传最新的一份:
+# 解码跟不上时没解的旧帧直接被覆盖跳过，界面跟不上时没显示的旧帧也一样
+payload_slot = LatestSlot()  # (帧头, 图像数据, 到达时刻 now(), 到达时刻 monotonic)
+frame_slot = LatestSlot()    # (图像, 帧头)
+# 分块模式的关键帧不能被跳过 (后面的增量帧都要用它)，单独存一份
+key_slot = LatestSlot()
+tiles = TileDecoder()
+
+# 接收统计，每秒回报给机器人用于自适应码率
+monitor = StreamMonitor()
+# 端到端指标: 采集->显示延迟、解码耗时、丢帧、帧率 (画在画面上)
+metrics = FrameMetrics(robot_clock)
 
 # ================= MQTT 逻辑 =================
 def on_connect(client, userdata, flags, rc, properties=None):
     if rc == 0:
         print(f"✅ [控制台] 连接成功! 等待视频流...")
-        client.subscribe(TOPIC_IMG)
+        if not SEPARATE_MEDIA_CONNECTION:
+            client.subscribe(TOPIC_IMG)
+        clock_responder.subscribe(client)
+        robot_clock.subscribe(client)
+        encoder.subscribe(client)
     else:
         print(f"❌ 连接失败: {rc}")
 
+def on_media_connect(client, userdata, flags, rc, properties=None):
+    if rc == 0:
+        print(f"✅ [控制台] 图像连接成功: {TOPIC_IMG}")
+        client.subscribe(TOPIC_IMG)
+    else:
+        print(f"❌ 图像连接失败: {rc}")
+
 def on_message(client, userdata, msg):
-    global current_frame
+    # paho 网络线程里只拼分片、拆帧头 (老版本机器人是裸 JPEG，header 为 None) 并登记最新的一帧，
+    # 解码交给 decode_task，不挡后面的收发
+    payload = reassembler.add(msg.payload)
+    if payload is None:
+        return  # 分片还没收齐
     try:
-        # 1. 接收二进制数据
-        img_bytes = msg.payload
-        
-        # 2. 解码 (Bytes -> Numpy -> Image)
-        np_arr = np.frombuffer(img_bytes, np.uint8)
-        img = cv2.imdecode(np_arr, cv2.IMREAD_COLOR)
-        
-        if img is not None:
-            current_frame = img
+        header, data = unpack_frame(payload)
+    except ValueError as e:
+        print(f"⚠️ 图像帧格式错误: {e}")
+        return
+    item = (header, data, now(), time.monotonic())
+    if TileDecoder.is_keyframe(header):
+        key_slot.put(item)
+    payload_slot.put(item)
+
+def decode_task():
+    """解码线程: 每次只解最新到达的一帧，来不及解的旧帧直接跳过"""
+    version = key_version = 0
+    while True:
+        slot = payload_slot.get_newer(version, timeout=1.0)
+        if slot is None:
+            continue
+        version, item = slot
+        header, img_bytes, t_arrival, t_arrival_mono = item
+        try:
+            # 1. 被跳过的帧里有关键帧的话先解它，后面的增量帧才拼得出来
+            key = key_slot.get_newer(key_version, timeout=0)
+            if key is not None:
+                key_version, key_item = key
+                if key_item is not item:
+                    tiles.decode(key_item[0], key_item[1])
+
+            # 2. 解码 (关键帧 / 整帧 JPEG 直接解，增量帧贴到关键帧上)
+            t0 = time.monotonic()
+            img = tiles.decode(header, img_bytes)
+            if tiles.need_keyframe:
+                monitor.need_keyframe = True
             
-    except Exception as e:
-        print(f"⚠️ 图像解码失败: {e}")
+            if img is not None:
+                decode_time = time.monotonic() - t0
+                monitor.on_frame(t_arrival_mono, decode_time)
+                metrics.skipped = payload_slot.overwritten
+                metrics.on_frame(header, t_arrival, decode_time)
+                frame_slot.put((img, header))
+                
+        except Exception as e:
+            print(f"⚠️ 图像解码失败: {e}")
+
+def draw_overlay(frame):
+    """左下角叠加端到端指标 (只改这一份显示用的拷贝)"""
+    frame = frame.copy()
+    h = frame.shape[0]
+    for i, line in enumerate(reversed(metrics.overlay_lines())):
+        y = h - 10 - i * 18
+        cv2.putText(frame, line, (8, y), cv2.FONT_HERSHEY_SIMPLEX, 0.45, (0, 0, 0), 3)
+        cv2.putText(frame, line, (8, y), cv2.FONT_HERSHEY_SIMPLEX, 0.45, (0, 255, 0), 1)
+    return frame
 
 # ================= 主程序 =================
 if __name__ == "__main__":
     client = mqtt.Client(mqtt.CallbackAPIVersion.VERSION2, client_id=CLIENT_ID)
     client.on_connect = on_connect
     client.on_message = on_message
+    clock_responder.attach(client)
+    robot_clock.attach(client)
+    encoder.attach(client)
+
+    # 图像连接 (不分开时和指令共用一条)
+    if SEPARATE_MEDIA_CONNECTION:
+        media_client = mqtt.Client(mqtt.CallbackAPIVersion.VERSION2, client_id=f"{CLIENT_ID}_media")
+        media_client.on_connect = on_media_connect
+        media_client.on_message = on_message
+    else:
+        media_client = client
     
     client.connect(MQTT_BROKER, MQTT_PORT, 60)
     client.loop_start()
+    if media_client is not client:
+        media_client.connect(MQTT_BROKER, MQTT_PORT, 60)
+        media_client.loop_start()
+    robot_clock.start()
+    threading.Thread(target=decode_task, daemon=True).start()
+
+    streamer = CommandStreamer(client, TOPIC_CMD, encoder, HEARTBEAT_HZ, IDLE_HZ)
+    streamer.start()
 
     print("🎮 [控制台] 启动成功！")
     print("操作指南: 点击视频窗口 -> 按 W/A/S/D 移动 -> 按 Q 停车 -> ESC 退出")
 
     # 创建一个黑色的初始画面
-    current_frame = np.zeros((480, 640, 3), dtype=np.uint8)
-    cv2.putText(current_frame, "Waiting for Video...", (100, 240), 
+    waiting = np.zeros((480, 640, 3), dtype=np.uint8)
+    cv2.putText(waiting, "Waiting for Video...", (100, 240), 
                 cv2.FONT_HERSHEY_SIMPLEX, 1, (255, 255, 255), 2)
+    cv2.imshow("Remote View (Liang)", waiting)
 
+    next_feedback = time.monotonic() + FEEDBACK_INTERVAL
+    shown_version = 0
     try:
         while True:
-            # 1. 刷新显示图像
-            if current_frame is not None:
-                cv2.imshow("Remote View (Liang)", current_frame)
+            # 0. 回报接收统计
+            if time.monotonic() >= next_feedback:
+                next_feedback += FEEDBACK_INTERVAL
+                monitor.publish(media_client, TOPIC_IMG)
+
+            # 1. 有新帧立刻显示 (叠加指标并计入采集->显示延迟)，没有新帧最多等 UI_POLL
+            slot = frame_slot.get_newer(shown_version, timeout=UI_POLL)
+            if slot is not None:
+                shown_version, (frame, header) = slot
+                metrics.on_display(header)
+                cv2.imshow("Remote View (Liang)", draw_overlay(frame))
             
-            # 2. 监听键盘 (每 50ms 刷新一次窗口)
+            # 2. 监听键盘 (只处理窗口事件，不再固定等 50ms)
             # waitKey 返回按键的 ASCII 码
-            key = cv2.waitKey(50) & 0xFF
+            key = cv2.waitKey(1) & 0xFF
             
             # 3. 处理按键逻辑
             v, w = 0.0, 0.0
@@ -94,19 +221,28 @@ if __name__ == "__main__":
                 w = 0.0
                 should_send = True
             
-            # 4. 发送指令 (仅当有按键时发送，避免空闲占用带宽)
+            # 4. 更新当前指令: 变化立即发送，不变的由心跳线程按固定频率重发
             if should_send:
-                payload = {
-                    "v": v, 
-                    "w": w,
-                    "ts": time.time() # 打上发送时间戳
-                }
-                client.publish(TOPIC_CMD, json.dumps(payload), qos=0)
-                print(f"📤 发送指令: v={v}, w={w}")
+                flags = FLAG_ESTOP if key == ord('q') else 0
+                if streamer.set(v, w, flags):
+                    print(f"📤 发送指令: v={v}, w={w} ({encoder.encoding})")
 
     except KeyboardInterrupt:
         pass
     finally:
+        try:
+            streamer.stop().wait_for_publish(timeout=1)
+        except (RuntimeError, ValueError) as e:
+            # 已经断线: 最后这帧急停发不出去，机器人那边靠看门狗停车；后面的清理照常做
+            print(f"⚠️ 退出急停未发出: {e}")
+        print(f"[指令流] {streamer.describe()}")
+        print(f"[视频] {metrics.describe()}")
+        print(f"[分块] 缺关键帧丢弃 {tiles.missing_ref} 帧")
+        print(f"[分片] {reassembler.describe()}")
+        print(f"[时钟] {robot_clock.describe()}")
+        if media_client is not client:
+            media_client.loop_stop()
+            media_client.disconnect()
         client.loop_stop()
         client.disconnect()
         cv2.destroyAllWindows()
@@ -1,10 +1,22 @@
+import os
+import sys
 import time
-import json
 import threading
 import cv2
 import numpy as np
 import paho.mqtt.client as mqtt
 
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from common.clock_sync import ClockSync, ClockSyncResponder, now
+from common import cmd_codec
+from common.chunking import Chunker
+from common.cmd_coalesce import CommandCoalescer
+from common.mailbox import LatestSlot
+from frame_pipeline import FramePipeline
+from adaptive_stream import AdaptiveController, OutboundTracker
+from frame_header import pack_frame
+from tile_codec import TileEncoder
+
 # ================= 架构配置 =================
 # 使用公共 Broker (生产环境请换成自建 EMQX)
 MQTT_BROKER = "broker.emqx.io"
@@ -13,75 +25,159 @@ MQTT_PORT = 1883
 # 定义专属 Topic (加上你的名字防止冲突)
 TOPIC_CMD = "liang/retail/cmd_vel"   # 接收：控制指令
 TOPIC_IMG = "liang/retail/camera"    # 发送：图像流
+TOPIC_CLOCK = "liang/retail/clock"   # 时钟同步 ping/pong
+TOPIC_CLOCK_ROBOT = "liang/retail/clock_robot"  # 反方向: 观看端来 ping，换算帧的采集时间
 
 # 客户端 ID
 CLIENT_ID = f"robot_agent_{int(time.time())}"
 
+# 向控制端 ping，估计两边时钟偏差，指令延迟才有意义
+clock = ClockSync(TOPIC_CLOCK, CLIENT_ID)
+clock_responder = ClockSyncResponder(TOPIC_CLOCK_ROBOT, CLIENT_ID)
+
+# 指令合并: 积压/乱序的旧指令直接丢弃，底盘只执行最新的一条
+MAX_CMD_AGE = 0.3  # 秒
+coalescer = CommandCoalescer(MAX_CMD_AGE, clock)
+cmd_slot = LatestSlot()
+
+outbound = OutboundTracker()
+quality = AdaptiveController(backlog=outbound.depth)
+tile_encoder = TileEncoder()
+# 观看端缺关键帧时在反馈里请求补发
+quality.listeners.append(lambda report: report.get("need_keyframe") and tile_encoder.request_keyframe())
+
 # 模拟配置
 IMAGE_SOURCE = "test_view.jpg"  # 本地图片路径
-SEND_FPS = 10                   # 限制帧率 (MQTT传图建议不要超过15fps)
+# 分辨率 / JPEG 质量 / 帧率由 AdaptiveController 按观看端反馈和发送积压自动换档
+# (档位表见 adaptive_stream.LADDER)；编码跟不上时流水线自动丢最旧的帧
+CONTROL_INTERVAL = 1.0          # 换档判断周期 (秒)
+# 推流模式: "tiles" = 分块增量 (只发和关键帧相比变化的块，静止画面省大部分带宽)
+#           "jpeg"  = 每帧完整 JPEG
+STREAM_MODE = "tiles"
+ENCODE_WORKERS = max(1, min(4, (os.cpu_count() or 2) - 1))  # 编码线程数，给采集/发布留一个核
+STATS_INTERVAL = 5.0            # 流水线统计输出间隔 (秒)
+
+# 大图分片发送 (超过 CHUNK_SIZE 的帧切成多条消息，观看端拼回)，0 = 不分片
+CHUNK_SIZE = 16 * 1024
+# 图像单独走一条 MQTT 连接: 指令 / 时钟同步不用排在整帧图像后面
+SEPARATE_MEDIA_CONNECTION = True
+chunker = Chunker(CHUNK_SIZE) if CHUNK_SIZE else None
 
 # ================= MQTT 回调逻辑 =================
 def on_connect(client, userdata, flags, rc, properties=None):
     if rc == 0:
         print(f"✅ [机器人] 上线成功! 正在监听: {TOPIC_CMD}")
         client.subscribe(TOPIC_CMD)
+        clock.subscribe(client)
+        clock_responder.subscribe(client)
+        if not SEPARATE_MEDIA_CONNECTION:
+            quality.subscribe(client, TOPIC_IMG)
+        cmd_codec.advertise(client, TOPIC_CMD, CLIENT_ID)
     else:
         print(f"❌ [机器人] 连接失败: {rc}")
 
+def on_media_connect(client, userdata, flags, rc, properties=None):
+    """图像连接: 只发图像、收观看端反馈"""
+    if rc == 0:
+        print(f"✅ [机器人] 图像连接上线: {TOPIC_IMG}")
+        quality.subscribe(client, TOPIC_IMG)
+    else:
+        print(f"❌ [机器人] 图像连接失败: {rc}")
+
 def on_message(client, userdata, msg):
-    """处理收到的控制指令"""
+    """处理收到的控制指令: 只做解码和过滤，执行交给底盘线程"""
     try:
-        payload = json.loads(msg.payload.decode())
-        v = payload.get('v', 0.0)
-        w = payload.get('w', 0.0)
-        ts_sent = payload.get('ts', 0)
+        # 二进制帧 / JSON 自动识别
+        cmd = cmd_codec.decode(msg.payload)
         
-        # 计算指令延迟
-        latency = (time.time() - ts_sent) * 1000
+        # 计算指令延迟 (已扣除时钟偏差)
+        latency = clock.latency(cmd.ts) * 1000
         
-        # 模拟驱动底盘
-        print(f"🤖 [底盘响应] 线速度: {v:>5.2f} | 角速度: {w:>5.2f} | 延迟: {latency:.1f}ms")
+        if coalescer.offer(cmd):
+            cmd_slot.put((cmd, latency))
         
     except Exception as e:
         print(f"⚠️ 指令解析异常: {e}")
 
-# ================= 视频推流线程 =================
+def chassis_task():
+    """模拟底盘: 每次只取最新的一条指令执行"""
+    version = 0
+    while True:
+        slot = cmd_slot.get_newer(version, timeout=1.0)
+        if slot is None:
+            continue
+        version, (cmd, latency) = slot
+        sync_note = "" if clock.synced else " (时钟未同步)"
+        dropped = coalescer.dropped + cmd_slot.overwritten
+        
+        # 模拟驱动底盘
+        print(f"🤖 [底盘响应] 线速度: {cmd.v:>5.2f} | 角速度: {cmd.w:>5.2f} | 延迟: {latency:.2f}ms{sync_note} | 已丢弃旧指令: {dropped}")
+
+# ================= 视频推流 (采集 -> 编码 -> 发布 流水线) =================
 def video_stream_task(client):
-    """模拟摄像头采集并推流"""
+    """模拟摄像头采集并推流: 三段流水线，编码在线程池里跑"""
     print("📷 [视觉] 摄像头推流线程启动...")
     
     # 读取底图
-    base_frame = cv2.imread(IMAGE_SOURCE)
-    if base_frame is not None:
-        base_frame = cv2.resize(base_frame, (320, 240), interpolation=cv2.INTER_AREA)
-    if base_frame is None:
+    source = cv2.imread(IMAGE_SOURCE)
+    if source is None:
         print(f"❌ 错误: 找不到 {IMAGE_SOURCE}，请在当前目录放一张图片！")
         return
+    base_frames = {}  # 每种分辨率缩放一次，之后复用
 
-    while True:
-        loop_start = time.time()
-        
-        # 1. 模拟动态画面 (在图片上画时间戳)
-        frame = base_frame.copy()
-        timestamp = time.strftime("%H:%M:%S", time.localtime())
+    def capture():
+        # 模拟动态画面 (在图片上画时间戳)；采集时间随帧头发出，观看端据此算端到端延迟
+        t_capture = now()
+        level = quality.level
+        size = (level.width, level.height)
+        if size not in base_frames:
+            base_frames[size] = cv2.resize(source, size, interpolation=cv2.INTER_AREA)
+        frame = base_frames[size].copy()
+        timestamp = time.strftime("%H:%M:%S", time.localtime(t_capture))
         # 在左上角画红色的时间
-        cv2.putText(frame, f"LIVE: {timestamp}", (20, 50), 
-                    cv2.FONT_HERSHEY_SIMPLEX, 1.2, (0, 0, 255), 3)
-        
-        # 2. 图像压缩 (关键！必须压缩成 JPEG)
-        # 质量设为 50，平衡画质和带宽
-        _, buffer = cv2.imencode('.jpg', frame, [cv2.IMWRITE_JPEG_QUALITY, 50])
-        img_bytes = buffer.tobytes()
-        
-        # 3. 发送数据
-        # QoS=0: 视频流允许丢包，追求实时性
-        client.publish(TOPIC_IMG, img_bytes, qos=0)
-        
-        # 4. 帧率控制
-        process_time = time.time() - loop_start
-        wait_time = max(0, (1.0 / SEND_FPS) - process_time)
-        time.sleep(wait_time)
+        scale = level.width / 320.0
+        cv2.putText(frame, f"LIVE: {timestamp}", (int(20 * scale), int(50 * scale)), 
+                    cv2.FONT_HERSHEY_SIMPLEX, 1.2 * scale, (0, 0, 255), max(1, int(3 * scale)))
+        return t_capture, frame
+
+    def encode(frame, seq):
+        # 图像压缩 (关键！必须压缩成 JPEG)，质量平衡画质和带宽
+        if STREAM_MODE == "tiles":
+            data, flags = tile_encoder.encode(frame, seq, quality.level.quality)
+            return data, frame.shape[1], frame.shape[0], flags
+        _, buffer = cv2.imencode('.jpg', frame, [cv2.IMWRITE_JPEG_QUALITY, quality.level.quality])
+        return buffer.tobytes(), frame.shape[1], frame.shape[0], 0
+
+    def publish(encoded):
+        # QoS=0: 视频流允许丢包，追求实时性；大帧分片发出，积压按最后一片算
+        payload = pack_frame(encoded.seq, encoded.t_capture, encoded.encode_time,
+                             encoded.width, encoded.height, encoded.data, encoded.flags)
+        if chunker is not None:
+            outbound.add(chunker.publish(client, TOPIC_IMG, payload, qos=0))
+        else:
+            outbound.add(client.publish(TOPIC_IMG, payload, qos=0))
+        if STREAM_MODE == "tiles":
+            tile_encoder.on_published(encoded.seq, encoded.flags)  # 关键帧发出后才作为增量帧的参考
+
+    pipeline = FramePipeline(capture, encode, publish, quality.level.fps, ENCODE_WORKERS).start()
+    next_stats = time.monotonic() + STATS_INTERVAL
+    try:
+        while True:
+            time.sleep(CONTROL_INTERVAL)
+            previous = quality.level
+            level = quality.update()
+            pipeline.fps = level.fps
+            if level != previous:
+                print(f"🎚️ [视觉] 换档: {quality.describe()}")
+            if time.monotonic() >= next_stats:
+                next_stats += STATS_INTERVAL
+                print(f"📊 [视觉] {quality.describe()}\n{pipeline.describe()}")
+                if STREAM_MODE == "tiles":
+                    print(f"  分块: {tile_encoder.describe()}")
+                if chunker is not None:
+                    print(f"  分片发送: {chunker.chunked} 帧")
+    finally:
+        pipeline.stop()
 
 # ================= 主程序 =================
 if __name__ == "__main__":
@@ -89,19 +185,39 @@ if __name__ == "__main__":
     client = mqtt.Client(mqtt.CallbackAPIVersion.VERSION2, client_id=CLIENT_ID)
     client.on_connect = on_connect
     client.on_message = on_message
+    clock.attach(client)
+    clock_responder.attach(client)
+    cmd_codec.clear_caps_on_disconnect(client, TOPIC_CMD)
+
+    # 图像连接 (不分开时和指令共用一条)
+    if SEPARATE_MEDIA_CONNECTION:
+        media_client = mqtt.Client(mqtt.CallbackAPIVersion.VERSION2, client_id=f"{CLIENT_ID}_media")
+        media_client.on_connect = on_media_connect
+    else:
+        media_client = client
+    quality.attach(media_client, TOPIC_IMG)
     
     print(f"[系统] 正在连接服务器 {MQTT_BROKER}...")
     client.connect(MQTT_BROKER, MQTT_PORT, 60)
+    if media_client is not client:
+        media_client.connect(MQTT_BROKER, MQTT_PORT, 60)
     
     # 启动后台线程处理 MQTT 网络收发
     client.loop_start()
+    if media_client is not client:
+        media_client.loop_start()
+    clock.start()
+    threading.Thread(target=chassis_task, daemon=True).start()
     
     # 在主线程中启动视频推流 (也可以单独开线程，这里简化处理)
     try:
-        video_stream_task(client)
+        video_stream_task(media_client)
     except KeyboardInterrupt:
         pass
     
     print("\n[系统] 机器人下线")
+    if media_client is not client:
+        media_client.loop_stop()
+        media_client.disconnect()
     client.loop_stop()
     client.disconnect()
\ No newline at end of file
@@ -0,0 +1,191 @@
+"""分块增量编码: 只发和关键帧相比变化了的块
+
+货架巡检的画面大部分是静止的，每帧发整张 JPEG 很浪费。这里把画面切成
+TILE x TILE 的块，和上一个关键帧逐块比较，只把变化的块拼成一张小图 (atlas)
+编码成一张 JPEG 发出去，JPEG 的表头开销一帧只付一次。
+
+- 增量帧总是相对最近的关键帧，而不是上一帧: 丢了任何一个增量帧都不影响后面的帧
+- 关键帧: 每 KEYFRAME_INTERVAL 秒一次、分辨率变化、变化块超过一半、观看端请求
+  (观看端收到引用了未知关键帧的增量帧时，在反馈里带 need_keyframe)
+- 关键帧要等发布阶段确认发出 (on_published) 才成为参考帧: 编码线程池乱序完成时，
+  后编好的增量帧可能先发出，而关键帧随后被当作过时帧丢掉。确认之前的增量帧仍然
+  相对上一个已发出的关键帧，所以观看端保留最近几个关键帧
+
+增量帧负载 (接在 frame_header 帧头之后，帧头 flags 带 FLAG_DELTA):
+
+    | ref_seq(4) | tile(2) | atlas_cols(2) | n(2) | n x (tx(1), ty(1)) | atlas JPEG |
+"""
+import struct
+import threading
+import time
+from collections import OrderedDict
+
+import cv2
+import numpy as np
+
+from frame_header import FLAG_KEYFRAME, FLAG_DELTA
+
+TILE = 32                # 块边长 (8 的倍数，JPEG 宏块不会跨块)
+KEYFRAME_INTERVAL = 2.0  # 秒
+MAX_CHANGED_RATIO = 0.5  # 变化块比例超过它就直接发关键帧
+MEAN_THRESHOLD = 1.5     # 块内平均差异 (灰度级)，大于它视为变化 (过滤传感器噪声)
+MAX_THRESHOLD = 40       # 块内单像素最大差异，大于它视为变化 (细小的文字变化)
+PENDING_TIMEOUT = 0.5    # 秒；关键帧编好这么久还没确认发出，视为被流水线丢掉了
+KEEP_KEYFRAMES = 4       # 观看端保留的关键帧个数
+
+DELTA_HEADER = struct.Struct(">IHHH")
+TILE_POS = struct.Struct(">BB")
+
+
+def _encode_jpeg(image, quality):
+    ok, buffer = cv2.imencode(".jpg", image, [cv2.IMWRITE_JPEG_QUALITY, quality])
+    if not ok:
+        raise ValueError("JPEG 编码失败")
+    return buffer.tobytes()
+
+
+def changed_tiles(frame, reference, tile=TILE):
+    """返回变化块的 (tx, ty) 列表"""
+    diff = cv2.absdiff(frame, reference)
+    if diff.ndim == 3:
+        diff = diff.max(axis=2)
+    h, w = diff.shape
+    rows, cols = -(-h // tile), -(-w // tile)
+    padded = np.zeros((rows * tile, cols * tile), dtype=diff.dtype)
+    padded[:h, :w] = diff
+    blocks = padded.reshape(rows, tile, cols, tile)
+    mean = blocks.mean(axis=(1, 3))
+    peak = blocks.max(axis=(1, 3))
+    ty, tx = np.nonzero((mean > MEAN_THRESHOLD) | (peak > MAX_THRESHOLD))
+    return list(zip(tx.tolist(), ty.tolist())), rows * cols
+
+
+class TileEncoder:
+    """机器人端: encode(image, seq, quality) -> (负载, flags)；发布后调用 on_published(seq, flags)
+
+    可以被编码线程池并发调用: 只有选关键帧 / 比较参考帧这一步加锁，JPEG 编码在锁外。
+    """
+
+    def __init__(self, tile=TILE, keyframe_interval=KEYFRAME_INTERVAL):
+        self.tile = tile
+        self.keyframe_interval = keyframe_interval
+        self._lock = threading.Lock()
+        self._ref = None     # (seq, 原始图像)，已确认发出的关键帧
+        self._ref_t = 0.0
+        self._pending = {}   # seq -> (原始图像, 编码时刻)，编好了还没确认发出的关键帧
+        self._force_key = False
+
+        self.keyframes = 0
+        self.deltas = 0
+        self.tiles_sent = 0
+        self.lost_keyframes = 0  # 没等到确认就超时的关键帧
+
+    def request_keyframe(self):
+        self._force_key = True
+
+    def encode(self, image, seq, quality):
+        with self._lock:
+            ref = self._ref
+            now = time.monotonic()
+            for key_seq in [k for k, p in self._pending.items() if now - p[1] > PENDING_TIMEOUT]:
+                del self._pending[key_seq]
+                self.lost_keyframes += 1
+                self._force_key = True  # 它要满足的补发请求 / 定时刷新还没做到
+            # 已经有同尺寸的关键帧在路上: 定时 / 请求补发都等它确认，期间继续相对旧参考帧发增量
+            waiting = any(p[0].shape == image.shape for p in self._pending.values())
+            tiles = None
+            if (ref is not None and ref[1].shape == image.shape
+                    and (waiting or (not self._force_key and now - self._ref_t < self.keyframe_interval))):
+                tiles, total = changed_tiles(image, ref[1], self.tile)
+                if len(tiles) > total * MAX_CHANGED_RATIO:
+                    tiles = None
+            if tiles is None:
+                self._pending[seq] = (image, now)
+                self._force_key = False
+                self.keyframes += 1
+            else:
+                self.deltas += 1
+                self.tiles_sent += len(tiles)
+
+        if tiles is None:
+            return _encode_jpeg(image, quality), FLAG_KEYFRAME
+        return self._encode_delta(image, ref[0], tiles, quality), FLAG_DELTA
+
+    def on_published(self, seq, flags):
+        """发布阶段发出一帧后调用；关键帧从这时起才作为后续增量帧的参考"""
+        if not flags & FLAG_KEYFRAME:
+            return
+        with self._lock:
+            pending = self._pending.pop(seq, None)
+            if pending is None or (self._ref is not None and seq <= self._ref[0]):
+                return
+            self._ref, self._ref_t = (seq, pending[0]), pending[1]
+            for key_seq in [k for k in self._pending if k < seq]:
+                del self._pending[key_seq]  # 更旧的关键帧已经不会再发出
+
+    def _encode_delta(self, image, ref_seq, tiles, quality):
+        t = self.tile
+        cols = max(1, int(np.ceil(np.sqrt(len(tiles)))))
+        rows = -(-len(tiles) // cols) if tiles else 1
+        atlas = np.zeros((rows * t, cols * t) + image.shape[2:], dtype=image.dtype)
+        positions = bytearray()
+        for i, (tx, ty) in enumerate(tiles):
+            block = image[ty * t:(ty + 1) * t, tx * t:(tx + 1) * t]
+            r, c = divmod(i, cols)
+            atlas[r * t:r * t + block.shape[0], c * t:c * t + block.shape[1]] = block
+            positions += TILE_POS.pack(tx, ty)
+        header = DELTA_HEADER.pack(ref_seq & 0xFFFFFFFF, t, cols, len(tiles))
+        return header + bytes(positions) + _encode_jpeg(atlas, quality)
+
+    def describe(self):
+        per_delta = self.tiles_sent / self.deltas if self.deltas else 0.0
+        return (f"关键帧 {self.keyframes} (未发出 {self.lost_keyframes}) 增量帧 {self.deltas}"
+                f" (平均 {per_delta:.1f} 块/帧)")
+
+
+class TileDecoder:
+    """观看端: decode(header, data) -> 完整图像；缺关键帧时返回 None 并置 need_keyframe"""
+
+    def __init__(self, keep=KEEP_KEYFRAMES):
+        self.keep = keep
+        self._keys = OrderedDict()  # seq -> 解码后的关键帧，最近 keep 个
+        self.need_keyframe = False
+        self.missing_ref = 0
+
+    def decode(self, header, data):
+        buf = np.frombuffer(data, np.uint8)
+        if header is None or not header.flags & FLAG_DELTA:
+            image = cv2.imdecode(buf, cv2.IMREAD_COLOR)
+            if image is not None and header is not None and header.flags & FLAG_KEYFRAME:
+                self._keys[header.seq] = image
+                self._keys.move_to_end(header.seq)
+                while len(self._keys) > self.keep:
+                    self._keys.popitem(last=False)
+                self.need_keyframe = False
+            return image
+
+        ref_seq, t, cols, n = DELTA_HEADER.unpack_from(data)
+        key = self._keys.get(ref_seq)
+        if key is None:
+            self.missing_ref += 1
+            self.need_keyframe = True
+            return None
+        pos = DELTA_HEADER.size
+        tiles = [TILE_POS.unpack_from(data, pos + i * TILE_POS.size) for i in range(n)]
+        pos += n * TILE_POS.size
+        image = key.copy()
+        if n:
+            atlas = cv2.imdecode(buf[pos:], cv2.IMREAD_COLOR)
+            if atlas is None:
+                return None
+            h, w = image.shape[:2]
+            for i, (tx, ty) in enumerate(tiles):
+                r, c = divmod(i, cols)
+                y, x = ty * t, tx * t
+                bh, bw = min(t, h - y), min(t, w - x)
+                image[y:y + bh, x:x + bw] = atlas[r * t:r * t + bh, c * t:c * t + bw]
+        return image
+
+    @staticmethod
+    def is_keyframe(header):
+        return header is not None and not header.flags & FLAG_DELTA
@@ -0,0 +1,218 @@
+"""多路摄像头轨道: 一个 PeerConnection 上挂 N 路视频，每路单独的分辨率 / 帧率 / 编码器
+
+多个会话 (PeerConnection) 共用同一组摄像头源。控制端通过 "control" DataChannel
+开关本会话的单路画面 (JSON):
+
+    控制端 -> 机器人  {"type": "list"}
+                      {"type": "enable", "name": "rear", "enabled": false}
+    机器人 -> 控制端  {"type": "tracks", "tracks": [{"name", "mid", "width", "height", "fps", "codec", "enabled"}]}
+
+暂停的轨道 recv() 挂起不出帧，编码器和上行带宽都不花在没人看的画面上；
+所有会话都暂停了的摄像头，连采集 / 绘制也停掉。
+控制端用 mid (SDP 里的媒体段编号) 把收到的轨道对应到摄像头名字。
+"""
+import asyncio
+import json
+import time
+from collections import namedtuple
+
+import cv2
+from aiortc import MediaStreamTrack, RTCRtpSender, VideoStreamTrack
+from aiortc.contrib.media import MediaRelay
+from aiortc.mediastreams import MediaStreamError, VIDEO_CLOCK_RATE, VIDEO_TIME_BASE
+
+from frame_source import YuvFrameSource
+
+CONTROL_CHANNEL = "control"
+
+# codec: 优先使用的编码器 ("video/VP8" / "video/H264")，None = 按默认协商
+CameraSpec = namedtuple("CameraSpec", "name image width height fps codec enabled")
+
+
+class SimulatedCameraTrack(VideoStreamTrack):
+    """
+    这是一个符合 WebRTC 标准的视频源。
+    架构优势：未来换成真实相机，只需替换读取逻辑，WebRTC 管道不用动。
+    帧直接以 yuv420p 交给编码器，每帧只重画时间戳那一小块 (见 frame_source)。
+    """
+    def __init__(self, spec):
+        super().__init__()
+        self.spec = spec
+        self.img = cv2.imread(spec.image) # 请确保图片存在
+        if self.img is None: raise Exception(f"找不到图片! {spec.image}")
+        self.source = YuvFrameSource(self.img, spec.width, spec.height)
+        self._enabled = asyncio.Event()
+        if spec.enabled:
+            self._enabled.set()
+        self._start = None
+        self._timestamp = 0
+
+    @property
+    def enabled(self):
+        return self._enabled.is_set()
+
+    def set_enabled(self, enabled):
+        if enabled:
+            self._enabled.set()
+        else:
+            self._enabled.clear()
+
+    def stop(self):
+        super().stop()
+        self._enabled.set()  # 让暂停中挂起的 recv 醒来，随后 next_timestamp 抛 MediaStreamError
+
+    async def next_timestamp(self):
+        """按本轨道的帧率出时间戳；暂停或落后超过一帧后按墙钟重新对齐，不补发积压的帧"""
+        if self.readyState != "live":
+            raise MediaStreamError
+        step = int(VIDEO_CLOCK_RATE / self.spec.fps)
+        if self._start is None:
+            self._start = time.time()
+            self._timestamp = 0
+        else:
+            self._timestamp += step
+            wait = self._start + self._timestamp / VIDEO_CLOCK_RATE - time.time()
+            if wait > 0:
+                await asyncio.sleep(wait)
+            elif wait < -1.0 / self.spec.fps:
+                self._timestamp = int((time.time() - self._start) * VIDEO_CLOCK_RATE)
+        return self._timestamp, VIDEO_TIME_BASE
+
+    async def recv(self):
+        # 暂停时挂在这里: 编码器拿不到帧就不编码、不发包
+        await self._enabled.wait()
+        pts, time_base = await self.next_timestamp()
+
+        # 绘图：打上高精度的流逝时间，证明是实时流 (帧来自帧池，不做整图拷贝和颜色转换)
+        new_frame = self.source.render(f"{self.spec.name} {time.time():.3f}")
+        new_frame.pts = pts
+        new_frame.time_base = time_base
+        return new_frame
+
+
+class GatedTrack(MediaStreamTrack):
+    """一个会话里的一路视频: 包着 MediaRelay 分出来的代理轨道，本会话暂停时 recv 挂起"""
+    kind = "video"
+
+    def __init__(self, source, enabled):
+        super().__init__()
+        self.source = source
+        self._enabled = asyncio.Event()
+        if enabled:
+            self._enabled.set()
+
+    @property
+    def enabled(self):
+        return self._enabled.is_set()
+
+    def set_enabled(self, enabled):
+        if enabled:
+            self._enabled.set()
+        else:
+            self._enabled.clear()
+
+    async def recv(self):
+        await self._enabled.wait()
+        if self.readyState != "live":
+            raise MediaStreamError
+        return await self.source.recv()
+
+    def stop(self):
+        super().stop()
+        self.source.stop()
+        self._enabled.set()
+
+
+class TrackSubscription:
+    """一个 PeerConnection 订阅的全部摄像头；开关只影响本会话"""
+
+    def __init__(self, registry, pc):
+        self.registry = registry
+        self.pc = pc
+        self.gates = {}
+        self.senders = {}
+        for name, track in registry.tracks.items():
+            spec = registry.specs[name]
+            # buffered=False: 本会话编码跟不上时只拿最新一帧，不拖慢别的会话
+            gate = GatedTrack(registry.relay.subscribe(track, buffered=False), spec.enabled)
+            self.gates[name] = gate
+            self.senders[name] = pc.addTrack(gate)
+            if spec.codec:
+                transceiver = next(t for t in pc.getTransceivers() if t.sender is self.senders[name])
+                preferred = [c for c in RTCRtpSender.getCapabilities("video").codecs
+                             if c.mimeType == spec.codec or c.mimeType == "video/rtx"]
+                transceiver.setCodecPreferences(preferred)
+
+    def set_enabled(self, name, enabled):
+        gate = self.gates.get(name)
+        if gate is None:
+            return False
+        gate.set_enabled(enabled)
+        print(f"🎛️ [轨道] {name} {'开启' if enabled else '暂停'}")
+        self.registry.refresh()
+        return True
+
+    def state(self):
+        mids = {name: t.mid for t in self.pc.getTransceivers()
+                for name, sender in self.senders.items() if t.sender is sender}
+        return [{"name": name, "mid": mids.get(name), "width": track.source.width,
+                 "height": track.source.height, "fps": track.spec.fps,
+                 "codec": track.spec.codec, "enabled": self.gates[name].enabled}
+                for name, track in self.registry.tracks.items()]
+
+    def handle(self, message):
+        """处理控制通道的一条消息，返回要回给控制端的 JSON (无需回复时返回 None)"""
+        try:
+            request = json.loads(message)
+        except (TypeError, ValueError):
+            return None
+        if not isinstance(request, dict):
+            return None
+        kind = request.get("type")
+        if kind == "enable":
+            self.set_enabled(request.get("name"), bool(request.get("enabled", True)))
+        elif kind != "list":
+            return None
+        return json.dumps({"type": "tracks", "tracks": self.state()})
+
+    def close(self):
+        for gate in self.gates.values():
+            gate.stop()
+        self.registry.unsubscribe(self)
+
+
+class TrackRegistry:
+    """所有摄像头轨道；subscribe(pc) 把它们挂到一个 PeerConnection 上
+
+    每路摄像头只采集 / 绘制一次，经 MediaRelay 分给各个会话 (编码仍是每个会话各自一份，
+    aiortc 的编码器属于 RTCRtpSender)。没有任何会话开着某一路时，这一路的采集也暂停。
+    """
+
+    def __init__(self, specs):
+        self.specs = {spec.name: spec for spec in specs}
+        self.tracks = {spec.name: SimulatedCameraTrack(spec) for spec in specs}
+        self.relay = MediaRelay()
+        self.subscriptions = []
+        self.refresh()
+
+    def subscribe(self, pc):
+        subscription = TrackSubscription(self, pc)
+        self.subscriptions.append(subscription)
+        self.refresh()
+        return subscription
+
+    def unsubscribe(self, subscription):
+        if subscription in self.subscriptions:
+            self.subscriptions.remove(subscription)
+        self.refresh()
+
+    def refresh(self):
+        """摄像头源只在至少一个会话开着它时出帧"""
+        for name, track in self.tracks.items():
+            track.set_enabled(any(sub.gates[name].enabled for sub in self.subscriptions))
+
+    def stop(self):
+        for subscription in list(self.subscriptions):
+            subscription.close()
+        for track in self.tracks.values():
+            track.stop()
@@ -0,0 +1,116 @@
+"""模拟相机的 yuv420p 帧源: 预转换底图 + 帧池 + 只重画叠加区域
+
+原来每帧: 整图 copy -> putText -> VideoFrame.from_ndarray(bgr24)，编码器里再做一次
+整图 BGR -> YUV 转换，30fps 下大部分 CPU 花在搬像素上。这里:
+
+- 底图只在启动时转换一次 yuv420p (I420)，按平面存好
+- VideoFrame 从帧池里轮流取用，池里的帧创建时填好底图，之后不再整图写
+- 每帧只把文字所在的小矩形 (底图 + 文字) 转成 I420 写回三个平面
+
+编码器拿到的已经是 yuv420p，不再转换。帧池轮流复用，但只复用没人引用的帧:
+编码慢的会话、MediaRelay 里还没取走的帧都还拿着引用，改写它们会出现半新半旧的
+画面。引用计数比池里空闲时多就跳过；整池都在用时池子加一帧，到 pool_size 后
+临时新建 (不入池)。
+"""
+import sys
+
+import cv2
+import numpy as np
+from av import VideoFrame
+
+DEFAULT_POOL_SIZE = 8
+FONT = cv2.FONT_HERSHEY_SIMPLEX
+
+
+def _even(n):
+    return n - n % 2
+
+
+def _plane_view(plane):
+    """VideoFrame 平面的可写 numpy 视图 (去掉行尾对齐填充)"""
+    buf = np.frombuffer(plane, np.uint8).reshape(-1, plane.line_size)
+    return buf[:plane.height, :plane.width]
+
+
+class YuvFrameSource:
+    """render(text) -> yuv420p VideoFrame (调用方设置 pts / time_base)"""
+
+    def __init__(self, image, width=None, height=None, pool_size=DEFAULT_POOL_SIZE,
+                 origin=(20, 50), font_scale=1.0, color=(0, 255, 0), thickness=2,
+                 sample_text="WebRTC Live: 0000000000.000"):
+        h, w = image.shape[:2]
+        width, height = _even(width or w), _even(height or h)
+        if (width, height) != (w, h):
+            image = cv2.resize(image, (width, height), interpolation=cv2.INTER_AREA)
+        self.width, self.height = width, height
+        self.base = image
+        self.base_planes = self._split_i420(cv2.cvtColor(image, cv2.COLOR_BGR2YUV_I420), width, height)
+
+        self.origin = origin
+        self.font_scale = font_scale
+        self.color = color
+        self.thickness = thickness
+        self.region = self._text_region(sample_text)
+
+        self.pool_size = pool_size
+        self._pool = []  # [(VideoFrame, (Y, U, V) 视图)]
+        self._next = 0
+        self._idle_refs = None  # 池里的帧没人用时的引用计数 (平面视图也引用着帧)
+        self.busy_skips = 0     # 轮到的帧还在用，跳过
+        self.overflow = 0       # 整池都在用，临时新建的帧
+
+    @staticmethod
+    def _split_i420(i420, width, height):
+        """cv2 的 I420 是 (h*3/2, w) 的一整块，拆成 Y / U / V 三个平面"""
+        y = i420[:height]
+        uv = i420[height:].reshape(2, height // 2, width // 2)
+        return y, uv[0], uv[1]
+
+    def _text_region(self, sample_text):
+        """文字可能覆盖的矩形 (x0, y0, x1, y1)，四边对齐到偶数 (色度平面是半分辨率)"""
+        (tw, th), baseline = cv2.getTextSize(sample_text, FONT, self.font_scale, self.thickness)
+        x, y = self.origin
+        pad = self.thickness + 2
+        x0 = _even(max(0, x - pad))
+        y0 = _even(max(0, y - th - pad))
+        x1 = min(self.width, _even(x + int(tw * 1.2) + pad + 1))  # 留余量给变宽的数字
+        y1 = min(self.height, _even(y + baseline + pad + 1))
+        return x0, y0, x1, y1
+
+    def _new_frame(self):
+        """新建一帧并整图填一次底图"""
+        frame = VideoFrame(self.width, self.height, "yuv420p")
+        views = tuple(_plane_view(p) for p in frame.planes)
+        for dst, src in zip(views, self.base_planes):
+            dst[:] = src
+        return frame, views
+
+    def _take(self):
+        """从帧池轮流取一帧没人在用的；都在用时池子加一帧，池满了就临时新建"""
+        for _ in range(len(self._pool)):
+            item = self._pool[self._next]
+            self._next = (self._next + 1) % len(self._pool)
+            if sys.getrefcount(item[0]) <= self._idle_refs:
+                return item
+            self.busy_skips += 1
+        item = self._new_frame()
+        if len(self._pool) >= self.pool_size:
+            self.overflow += 1
+            return item
+        self._pool.append(item)
+        if self._idle_refs is None:
+            self._idle_refs = sys.getrefcount(item[0])
+        return item
+
+    def render(self, text):
+        frame, (y, u, v) = self._take()
+        x0, y0, x1, y1 = self.region
+        # 只在叠加区域的小块上画字并转换 (上一次的文字也一起被覆盖掉)
+        patch = self.base[y0:y1, x0:x1].copy()
+        ox, oy = self.origin
+        cv2.putText(patch, text, (ox - x0, oy - y0), FONT, self.font_scale, self.color, self.thickness)
+        py, pu, pv = self._split_i420(cv2.cvtColor(patch, cv2.COLOR_BGR2YUV_I420), x1 - x0, y1 - y0)
+        y[y0:y1, x0:x1] = py
+        u[y0 // 2:y1 // 2, x0 // 2:x1 // 2] = pu
+        v[y0 // 2:y1 // 2, x0 // 2:x1 // 2] = pv
+        return frame
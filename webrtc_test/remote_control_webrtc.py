@@ -1,43 +1,120 @@
+import os
+import sys
 import asyncio
 import json
-import time
+import threading
+import uuid
 import cv2
 import numpy as np
-import paho.mqtt.client as mqtt
 from aiortc import RTCPeerConnection, RTCSessionDescription
 from aiortc.contrib.media import MediaBlackhole
 
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from common.aio_mqtt import AsyncMqttClient
+from common.cmd_codec import CmdEncoder, FLAG_ESTOP, ENCODING_AUTO
+from common.mailbox import LatestSlot
+
 # ================= 配置 =================
 MQTT_BROKER = "broker.emqx.io"
 TOPIC_SIGNAL_OUT = "liang/signal/c2r"  # 发给机器人的 Offer
 TOPIC_SIGNAL_IN  = "liang/signal/r2c"  # 接收机器人的 Answer
-TOPIC_CONTROL    = "liang/retail/cmd"
+TOPIC_CONTROL    = "liang/retail/cmd"        # 指令后备通道 (DataChannel 不通时)
+TOPIC_TELEMETRY  = "liang/retail/telemetry"  # 遥测后备通道
+CMD_CHANNEL      = "cmd"          # 指令 / 遥测 DataChannel: 不排序、不重传，丢了等下一条
+CMD_ENCODING     = ENCODING_AUTO  # auto: 机器人声明支持二进制就用二进制
+CONTROL_CHANNEL  = "control"      # 开关摄像头的 DataChannel (协议见 robot 端 camera_tracks)
+MAX_TRACKS       = 3              # 最多接收几路视频 (Offer 里的视频段数)
+ANSWER_TIMEOUT   = 10.0           # 秒；等不到 Answer 就重新呼叫
+RECONNECT_DELAY  = 2.0            # 秒；连接断开后隔多久重新呼叫
+UI_POLL          = 0.01           # 秒；没有新帧时界面线程最多等这么久就去处理一次按键
+
+# 信令里带上会话号: 机器人可以同时服务多个控制端，重连时用同一个号替换旧连接
+SESSION_ID = f"controller_{uuid.uuid4().hex[:8]}"
 
 # ================= 全局变量 =================
-current_frame = None  # 用于 UI 显示的最新帧
-signal_queue = asyncio.Queue()
+# asyncio 事件循环在自己的线程里一直跑 (收 RTP、解码、信令)，界面线程只从 frame_slot
+# 取最新画面、把按键投递回事件循环，两边互不等待。
+# 下面这些只在事件循环线程里修改；界面线程读的 track_info / telemetry / selected 都是整体替换
+frames = {}         # mid -> 该路最新一帧 (BGR)
+frame_slot = LatestSlot()  # 每来一帧放一份 frames 的快照给界面线程
+track_info = {}     # mid -> 机器人回报的轨道信息 (name / 分辨率 / fps / enabled)
+selected = None     # 当前看的摄像头名字，None = 全部拼在一起
+control_channel = None
+cmd_channel = None
+pc = None
+telemetry = None    # 机器人最新一条遥测
+mqtt_client = None  # AsyncMqttClient，在事件循环里创建
+encoder = CmdEncoder(TOPIC_CONTROL, CMD_ENCODING)
 
-# ================= MQTT =================
-def on_connect(client, userdata, flags, rc, properties=None):
+# ================= MQTT (收发都在事件循环里，见 common/aio_mqtt) =================
+def on_connect(client):
+    """每次 (重新) 连上时调用；信令 / 遥测订阅由 AsyncMqttClient 自动恢复"""
     print(f"✅ [控制端] MQTT连接成功，监听信令: {TOPIC_SIGNAL_IN}")
-    client.subscribe(TOPIC_SIGNAL_IN)
+    encoder.subscribe(client)
+
+async def start_mqtt():
+    """连上 Broker，返回 Answer 消息流"""
+    global mqtt_client
+    mqtt_client = AsyncMqttClient()
+    encoder.attach(mqtt_client.client)
+    mqtt_client.connect_callbacks.append(on_connect)
+    answers = mqtt_client.messages(TOPIC_SIGNAL_IN)
+    telemetry_stream = mqtt_client.messages(TOPIC_TELEMETRY)
+    await mqtt_client.connect(MQTT_BROKER, 1883, 60)
+    await mqtt_client.subscribe(TOPIC_SIGNAL_IN)
+    await mqtt_client.subscribe(TOPIC_TELEMETRY)
+    asyncio.create_task(mqtt_telemetry_task(telemetry_stream))
+    return answers
+
+async def mqtt_telemetry_task(stream):
+    async for msg in stream:
+        try:
+            on_telemetry(json.loads(msg.payload.decode()), "mqtt")
+        except ValueError:
+            pass
 
-def on_message(client, userdata, msg):
-    payload = json.loads(msg.payload.decode())
-    if payload.get("type") == "answer":
+async def next_answer(answers):
+    """等发给本会话的 Answer (别的控制端的跳过；老版本机器人不带 session_id)"""
+    async for msg in answers:
+        try:
+            payload = json.loads(msg.payload.decode())
+        except ValueError:
+            continue
+        if payload.get("type") != "answer" or payload.get("session_id", SESSION_ID) != SESSION_ID:
+            continue
         print("📩 [信令] 收到机器人的 Answer 名片")
-        signal_queue.put_nowait(payload)
+        return payload
+
+# ================= 指令 / 遥测 =================
+def channel_open():
+    return (cmd_channel is not None and cmd_channel.readyState == "open"
+            and pc is not None and pc.connectionState == "connected")
+
+def send_command(v, w, flags=0):
+    """DataChannel 通就走 P2P (和视频同一条路径)，否则自动退回 MQTT；返回实际走的通道"""
+    payload = encoder.encode(v, w, flags)
+    if channel_open():
+        cmd_channel.send(payload)
+        return "datachannel"
+    if mqtt_client is None:
+        return "离线"
+    mqtt_client.publish_nowait(TOPIC_CONTROL, payload, qos=0)
+    return "mqtt"
+
+def on_telemetry(report, via):
+    global telemetry
+    if report.get("type") == "telemetry":
+        telemetry = dict(report, link=via)
 
-mqtt_client = mqtt.Client(mqtt.CallbackAPIVersion.VERSION2)
-mqtt_client.on_connect = on_connect
-mqtt_client.on_message = on_message
-mqtt_client.connect(MQTT_BROKER, 1883, 60)
-mqtt_client.loop_start()
+def telemetry_line():
+    if telemetry is None:
+        return "telemetry --"
+    return (f"v={telemetry.get('v', 0.0):.2f} w={telemetry.get('w', 0.0):.2f}"
+            f" cmd via {telemetry.get('via', '-')} | tlm via {telemetry['link']}")
 
 # ================= WebRTC 协程逻辑 =================
-async def consume_video(track):
+async def consume_video(track, mid):
     """从 WebRTC 轨道中不断取帧"""
-    global current_frame
     while True:
         try:
             # 这一步是关键：从 UDP 管道中解码出一帧
@@ -46,86 +123,210 @@ async def consume_video(track):
             # 转换为 OpenCV 格式 (YUV -> BGR)
             # aiortc 的 frame.to_ndarray 自动处理格式转换
             img = frame.to_ndarray(format="bgr24")
-            current_frame = img
+            frames[mid] = img
+            frame_slot.put(dict(frames))
         except Exception as e:
             print(f"视频流中断: {e}")
             break
 
-async def start_webrtc():
+async def start_webrtc(lost, answers):
+    """呼叫一次机器人；连接 failed / closed 时置位 lost"""
+    global pc, cmd_channel
     pc = RTCPeerConnection()
     
-    # 创建一个收发器 (Transceiver)，告诉对方我想收视频
-    pc.addTransceiver("video", direction="recvonly")
+    # 创建收发器 (Transceiver)，告诉对方我想收视频 (每路摄像头一个)
+    for _ in range(MAX_TRACKS):
+        pc.addTransceiver("video", direction="recvonly")
+
+    # 开关摄像头的控制通道 (由发起方创建，随 Offer 一起协商)
+    global control_channel
+    control_channel = pc.createDataChannel(CONTROL_CHANNEL)
+
+    @control_channel.on("open")
+    def on_control_open():
+        control_channel.send(json.dumps({"type": "list"}))
+
+    @control_channel.on("message")
+    def on_control_message(message):
+        global track_info
+        try:
+            reply = json.loads(message)
+        except (TypeError, ValueError):
+            return
+        if isinstance(reply, dict) and reply.get("type") == "tracks":
+            track_info = {t["mid"]: t for t in reply["tracks"] if t.get("mid") is not None}
+            print("🎛️ [轨道] " + ", ".join(f"{t['name']} {t['width']}x{t['height']}@{t['fps']}"
+                                         f"{'' if t['enabled'] else ' (暂停)'}" for t in reply["tracks"]))
+    
+    # 指令 / 遥测通道: 实时控制只要最新值，不排序、不重传，避免队头阻塞
+    cmd_channel = pc.createDataChannel(CMD_CHANNEL, ordered=False, maxRetransmits=0)
+
+    @cmd_channel.on("open")
+    def on_cmd_open():
+        print("🔗 [WebRTC] 指令通道已建立，指令改走 P2P")
+
+    @cmd_channel.on("message")
+    def on_cmd_message(message):
+        on_telemetry(json.loads(message), "datachannel")
+
+    @pc.on("connectionstatechange")
+    def on_state():
+        if pc.connectionState in ("failed", "disconnected", "closed"):
+            print(f"⚠️ [WebRTC] 连接 {pc.connectionState}，指令退回 MQTT")
+        if pc.connectionState in ("failed", "closed"):
+            lost.set()
     
     # 监听轨道事件：当对方视频流过来时触发
     @pc.on("track")
     def on_track(track):
-        print("🎥 [WebRTC] 捕捉到视频流轨道！")
+        mid = next((t.mid for t in pc.getTransceivers() if t.receiver.track is track), None)
+        print(f"🎥 [WebRTC] 捕捉到视频流轨道！(mid={mid})")
         # 启动一个后台任务去消费这个视频流
-        asyncio.create_task(consume_video(track))
+        asyncio.create_task(consume_video(track, mid))
 
     # 1. 创建 Offer
     offer = await pc.createOffer()
     await pc.setLocalDescription(offer)
     
     # 2. 发送 Offer 给机器人
-    payload = {"type": "offer", "sdp": pc.localDescription.sdp}
-    mqtt_client.publish(TOPIC_SIGNAL_OUT, json.dumps(payload))
-    print("📤 [信令] 发送 Offer，呼叫机器人...")
+    answers.drain()  # 上一次呼叫迟到的 Answer
+    payload = {"type": "offer", "sdp": pc.localDescription.sdp, "session_id": SESSION_ID}
+    await mqtt_client.publish(TOPIC_SIGNAL_OUT, json.dumps(payload))
+    print(f"📤 [信令] 发送 Offer，呼叫机器人... (会话 {SESSION_ID})")
     
     # 3. 等待 Answer
-    answer_json = await signal_queue.get()
+    answer_json = await asyncio.wait_for(next_answer(answers), ANSWER_TIMEOUT)
     
     # 4. 设置远端描述
     answer = RTCSessionDescription(sdp=answer_json["sdp"], type=answer_json["type"])
     await pc.setRemoteDescription(answer)
     print("✅ [WebRTC] 握手完成，P2P 通道建立！")
 
+async def webrtc_session():
+    """保持连接: 断开、等不到 Answer 或协商出错时，隔 RECONNECT_DELAY 用同一个会话号重新呼叫"""
+    global track_info
+    answers = await start_mqtt()
+    while True:
+        lost = asyncio.Event()
+        try:
+            await start_webrtc(lost, answers)
+            await lost.wait()
+        except asyncio.TimeoutError:
+            print("⚠️ [信令] 等待 Answer 超时")
+        except Exception as e:
+            # Answer 格式不对、setRemoteDescription 失败等: 这一次呼叫作废，不能让整个循环退出
+            print(f"❌ [WebRTC] 呼叫失败: {e!r}")
+        if pc is not None:
+            await pc.close()
+        frames.clear()
+        frame_slot.put({})
+        track_info = {}
+        await asyncio.sleep(RECONNECT_DELAY)
+        print("🔁 [WebRTC] 重新呼叫机器人...")
+
+def on_session_done(future):
+    """webrtc_session 本该一直运行，结束了一定是出了错 (比如连不上 Broker)，在这里报出来"""
+    if future.cancelled():
+        return
+    error = future.exception()
+    if error is not None:
+        print(f"❌ [WebRTC] 会话循环异常退出: {error!r}，按 ESC 退出后重启控制台")
+
+def select_camera(index):
+    """数字键选摄像头: 只开选中的那一路，其余暂停 (省机器人的编码 CPU 和上行)；0 = 全开"""
+    global selected
+    names = [t["name"] for t in sorted(track_info.values(), key=lambda t: t["mid"])]
+    if control_channel is None or control_channel.readyState != "open" or index > len(names):
+        return
+    selected = names[index - 1] if index else None
+    for name in names:
+        enabled = selected is None or name == selected
+        control_channel.send(json.dumps({"type": "enable", "name": name, "enabled": enabled}))
+    print(f"📺 [画面] {selected or '全部摄像头'}")
+
+def handle_key(key):
+    """按键处理，在事件循环线程里执行 (DataChannel / MQTT 发送都不是线程安全的)"""
+    v, w = 0.0, 0.0
+    send = False
+
+    if key == ord('w'): v=0.5; send=True
+    elif key == ord('s'): v=-0.5; send=True
+    elif key == ord('a'): w=1.0; send=True
+    elif key == ord('d'): w=-1.0; send=True
+    elif key == ord('q'): v=0; w=0; send=True
+    elif ord('0') <= key <= ord('9'): select_camera(key - ord('0'))
+
+    if send:
+        flags = FLAG_ESTOP if key == ord('q') else 0
+        via = send_command(v, w, flags)
+        print(f"指令发送: {v}, {w} ({via})")
+
+async def shutdown():
+    if pc is not None:
+        await pc.close()
+    if mqtt_client is not None:
+        await mqtt_client.disconnect()
+
+def compose_view(frames):
+    """选中单路时显示那一路，否则把有画面的各路缩放后横向拼在一起 (界面线程调用)"""
+    info, camera = track_info, selected
+    shown = [(mid, img) for mid, img in sorted(frames.items(), key=lambda kv: str(kv[0]))
+             if info.get(mid, {}).get("enabled", True)]
+    if camera is not None:
+        shown = [(mid, img) for mid, img in shown if info.get(mid, {}).get("name") == camera]
+    if not shown:
+        return None
+    if len(shown) == 1:
+        return shown[0][1]
+    return np.hstack([cv2.resize(img, (320, 240)) for _, img in shown])
+
+def draw_telemetry(view):
+    view = view.copy()  # 不改 frames 里的原图
+    cv2.putText(view, telemetry_line(), (8, view.shape[0] - 10), cv2.FONT_HERSHEY_SIMPLEX, 0.45, (0, 255, 0), 1)
+    return view
+
 # ================= 主线程 (UI Loop) =================
 def main():
-    # 启动 WebRTC 协程 (在后台运行)
+    # asyncio 事件循环在后台线程里持续运行，不再由界面循环一次 tick 10ms
     loop = asyncio.new_event_loop()
-    asyncio.set_event_loop(loop)
-    loop.create_task(start_webrtc())
+    loop_thread = threading.Thread(target=loop.run_forever, name="asyncio", daemon=True)
+    loop_thread.start()
+    asyncio.run_coroutine_threadsafe(webrtc_session(), loop).add_done_callback(on_session_done)
     
-    # 为了让 asyncio 和 opencv 共存，我们手动 tick loop
-    print("🎮 [控制台] 启动。点击窗口，WASD 控制...")
+    print("🎮 [控制台] 启动。点击窗口，WASD 控制，数字键 1-9 切换摄像头 (0 = 全部)...")
     
+    # 没图的时候显示黑屏等待
+    blank = np.zeros((480, 640, 3), dtype=np.uint8)
+    cv2.putText(blank, "Connecting...", (200, 240), cv2.FONT_HERSHEY_SIMPLEX, 1, (255,255,255))
+    cv2.imshow("Industrial Remote View", blank)
+    shown_version = 0
+
     try:
         while True:
-            # 1. 手动驱动 asyncio 跑一点点 (非阻塞)
-            loop.run_until_complete(asyncio.sleep(0.01))
-            
-            # 2. OpenCV 显示
-            if current_frame is not None:
-                cv2.imshow("Industrial Remote View", current_frame)
-            else:
-                # 没图的时候显示黑屏等待
-                blank = np.zeros((480, 640, 3), dtype=np.uint8)
-                cv2.putText(blank, "Connecting...", (200, 240), cv2.FONT_HERSHEY_SIMPLEX, 1, (255,255,255))
-                cv2.imshow("Industrial Remote View", blank)
+            # 1. 有新帧立刻显示，没有新帧最多等 UI_POLL (事件循环那边收帧不等界面)
+            slot = frame_slot.get_newer(shown_version, timeout=UI_POLL)
+            if slot is not None:
+                shown_version, snapshot = slot
+                view = compose_view(snapshot)
+                cv2.imshow("Industrial Remote View", blank if view is None else draw_telemetry(view))
             
-            # 3. 键盘控制 (通过 MQTT 发送)
+            # 2. 键盘控制: 投递到事件循环里处理 (DataChannel 优先，不通时走 MQTT)
             key = cv2.waitKey(1) & 0xFF
-            v, w = 0.0, 0.0
-            send = False
-            
-            if key == 27: break
-            elif key == ord('w'): v=0.5; send=True
-            elif key == ord('s'): v=-0.5; send=True
-            elif key == ord('a'): w=1.0; send=True
-            elif key == ord('d'): w=-1.0; send=True
-            elif key == ord('q'): v=0; w=0; send=True
-            
-            if send:
-                cmd = {"v": v, "w": w, "ts": time.time()}
-                mqtt_client.publish(TOPIC_CONTROL, json.dumps(cmd), qos=0)
-                print(f"指令发送: {v}, {w}")
+            if key == 27:
+                break
+            if key != 0xFF:
+                loop.call_soon_threadsafe(handle_key, key)
                 
     except KeyboardInterrupt:
         pass
     finally:
-        mqtt_client.loop_stop()
+        try:
+            asyncio.run_coroutine_threadsafe(shutdown(), loop).result(timeout=2)
+        except Exception as e:
+            print(f"⚠️ 退出清理失败: {e}")
+        loop.call_soon_threadsafe(loop.stop)
+        loop_thread.join(timeout=2)
+        cv2.destroyAllWindows()
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
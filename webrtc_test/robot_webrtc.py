@@ -1,110 +1,125 @@
+import os
+import sys
 import asyncio
 import json
 import time
-import cv2
-import numpy as np
-import paho.mqtt.client as mqtt
-from aiortc import RTCPeerConnection, RTCSessionDescription, VideoStreamTrack
-from av import VideoFrame
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from common import cmd_codec
+from common.aio_mqtt import AsyncMqttClient
+from common.clock_sync import now
+from common.cmd_coalesce import CommandCoalescer
+from camera_tracks import CameraSpec, TrackRegistry
+from session_manager import SessionManager
 
 # ================= 配置 =================
 MQTT_BROKER = "broker.emqx.io"
 TOPIC_SIGNAL_IN  = "liang/signal/c2r"  # 接收来自控制端的信令
 TOPIC_SIGNAL_OUT = "liang/signal/r2c"  # 发送给控制端的信令
-TOPIC_CONTROL    = "liang/retail/cmd"  # 控制指令
+TOPIC_CONTROL    = "liang/retail/cmd"  # 控制指令 (DataChannel 不通时的后备通道)
+TOPIC_TELEMETRY  = "liang/retail/telemetry"  # 遥测 (DataChannel 不通时的后备通道)
 
-# ================= 1. 定义虚拟相机轨道 =================
-class SimulatedCameraTrack(VideoStreamTrack):
-    """
-    这是一个符合 WebRTC 标准的视频源。
-    架构优势：未来换成真实相机，只需替换读取逻辑，WebRTC 管道不用动。
-    """
-    def __init__(self):
-        super().__init__()
-        self.img = cv2.imread("test_view.jpg") # 请确保图片存在
-        if self.img is None: raise Exception("找不到图片!")
+# 指令 / 遥测走 P2P DataChannel (不排序、不重传，和视频同一条路径)，通道断开时自动退回 MQTT
+CMD_CHANNEL   = "cmd"
+TELEMETRY_HZ  = 5.0
+MAX_CMD_AGE   = 0.3  # 秒；两条通道切换时的重复 / 乱序指令按序号丢弃
 
-    async def recv(self):
-        # 模拟 30fps 的帧生成
-        pts, time_base = await self.next_timestamp()
-        
-        # 绘图：打上高精度的流逝时间，证明是实时流
-        frame = self.img.copy()
-        timestamp = f"WebRTC Live: {time.time():.3f}"
-        cv2.putText(frame, timestamp, (20, 50), cv2.FONT_HERSHEY_SIMPLEX, 1, (0, 255, 0), 2)
-        
-        # 转换为 WebRTC 需要的 VideoFrame
-        new_frame = VideoFrame.from_ndarray(frame, format="bgr24")
-        new_frame.pts = pts
-        new_frame.time_base = time_base
-        return new_frame
+# ================= 1. 摄像头轨道 (实现见 camera_tracks) =================
+# 模拟: 都用同一张图；每路单独的分辨率 / 帧率 / 编码器，控制端可通过 control 通道单独开关
+CAMERAS = [
+    CameraSpec("front", "test_view.jpg", 640, 480, 30, None, True),
+    CameraSpec("rear",  "test_view.jpg", 320, 240, 15, None, False),
+    CameraSpec("arm",   "test_view.jpg", 480, 360, 20, "video/H264", False),
+]
 
 # ================= 2. 全局变量 =================
-pc = None # PeerConnection 对象
-signal_queue = asyncio.Queue() # 用于从 MQTT 线程传递消息到 Async 循环
+sessions = None # SessionManager: 每个控制端一个 PeerConnection
+coalescer = CommandCoalescer(MAX_CMD_AGE)
+last_cmd = None    # (CmdVel, 来源, 收到时刻)
 
-# ================= 3. MQTT 各种回调 =================
-def on_mqtt_connect(client, userdata, flags, rc, properties=None):
+# ================= 3. MQTT (收发都在事件循环里，见 common/aio_mqtt) =================
+def on_mqtt_connect(client):
+    """每次 (重新) 连上时调用；订阅由 AsyncMqttClient 自动恢复"""
     print(f"✅ [机器人] MQTT连接成功，监听信令: {TOPIC_SIGNAL_IN}")
-    client.subscribe(TOPIC_SIGNAL_IN)
-    client.subscribe(TOPIC_CONTROL)
+    cmd_codec.advertise(client, TOPIC_CONTROL, "robot_webrtc")
+
+async def mqtt_command_task(commands):
+    """后备通道上的控制指令"""
+    async for msg in commands:
+        handle_command(msg.payload, "mqtt")
+
+# ================= 4. 指令 / 遥测 =================
+def handle_command(payload, via):
+    """两条通道收到的指令都走这里 (二进制帧 / JSON 自动识别)，按序号只执行最新的"""
+    global last_cmd
+    if isinstance(payload, str):
+        payload = payload.encode()
+    try:
+        cmd = cmd_codec.decode(payload)
+    except ValueError as e:
+        print(f"⚠️ 指令解析异常: {e}")
+        return
+    if not coalescer.offer(cmd):
+        return
+    last_cmd = (cmd, via, time.monotonic())
+    print(f"🤖 [底盘驱动] V={cmd.v:.2f} W={cmd.w:.2f} ({via})")
+
+async def telemetry_task(mqtt_client):
+    """按 TELEMETRY_HZ 回报底盘状态: 发给所有指令通道已打开的会话，一个都没有时走 MQTT"""
+    while True:
+        await asyncio.sleep(1.0 / TELEMETRY_HZ)
+        report = {"type": "telemetry", "ts": now()}
+        if last_cmd is not None:
+            cmd, via, t = last_cmd
+            report.update(v=cmd.v, w=cmd.w, seq=cmd.seq, via=via,
+                          cmd_age_ms=round((time.monotonic() - t) * 1000.0, 1))
+        payload = json.dumps(report)
+        if not sessions.broadcast(payload):
+            mqtt_client.publish_nowait(TOPIC_TELEMETRY, payload, qos=0)
 
-def on_mqtt_message(client, userdata, msg):
-    payload = json.loads(msg.payload.decode())
-    
-    # 区分是控制指令 还是 WebRTC信令
-    if msg.topic == TOPIC_CONTROL:
-        # 处理控制 (实时性要求低，直接打印)
-        print(f"🤖 [底盘驱动] V={payload.get('v')} W={payload.get('w')}")
-    
-    elif msg.topic == TOPIC_SIGNAL_IN:
-        # WebRTC 信令放入队列，交给主线程处理
-        if payload.get("type") == "offer":
-            print("📩 [信令] 收到控制端的 Offer 名片")
-            signal_queue.put_nowait(payload)
+# ================= 5. WebRTC 核心逻辑 =================
+async def run_robot():
+    global sessions
+    mqtt_client = AsyncMqttClient()
+    cmd_codec.clear_caps_on_disconnect(mqtt_client.client, TOPIC_CONTROL)
+    mqtt_client.connect_callbacks.append(on_mqtt_connect)
+    # 先建消息流再订阅，订阅生效后到达的消息一条不漏
+    offers = mqtt_client.messages(TOPIC_SIGNAL_IN)
+    commands = mqtt_client.messages(TOPIC_CONTROL)
+    await mqtt_client.connect(MQTT_BROKER, 1883, 60)
+    await mqtt_client.subscribe(TOPIC_SIGNAL_IN)
+    await mqtt_client.subscribe(TOPIC_CONTROL)
+    asyncio.create_task(mqtt_command_task(commands))
 
-# ================= 4. WebRTC 核心逻辑 =================
-async def run_robot(mqtt_client):
-    global pc
-    pc = RTCPeerConnection()
-    
-    # 挂载摄像头轨道
-    pc.addTrack(SimulatedCameraTrack())
-    
-    # 等待控制端发来 Offer (呼叫)
+    # 摄像头只采集一次，分给所有会话；控制端通过 control 通道开关本会话的画面
+    registry = TrackRegistry(CAMERAS)
+    sessions = SessionManager(
+        registry,
+        # 等连上再发，发送途中断线就等重连后补发 (控制端还在等这个 Answer)
+        lambda answer: mqtt_client.publish(TOPIC_SIGNAL_OUT, json.dumps(answer)),
+        handle_command, CMD_CHANNEL)
+    asyncio.create_task(telemetry_task(mqtt_client))
+
+    # 等待控制端发来 Offer (呼叫)，每个 Offer 建一个会话，可以同时服务多个控制端
     print("⏳ [WebRTC] 等待呼叫...")
-    
-    # 从队列取 Offer
-    offer_json = await signal_queue.get()
-    
-    # 1. 设置远端描述 (读对方的名片)
-    offer = RTCSessionDescription(sdp=offer_json["sdp"], type=offer_json["type"])
-    await pc.setRemoteDescription(offer)
-    
-    # 2. 创建应答 (印自己的名片)
-    answer = await pc.createAnswer()
-    await pc.setLocalDescription(answer)
-    
-    # 3. 通过 MQTT 发回 Answer
-    answer_payload = {"type": "answer", "sdp": pc.localDescription.sdp}
-    mqtt_client.publish(TOPIC_SIGNAL_OUT, json.dumps(answer_payload))
-    print("📤 [信令] 发送 Answer 名片，P2P 通道即将建立...")
-    
-    # 保持运行
-    await asyncio.Future() # run forever
+    try:
+        async for msg in offers:
+            try:
+                offer_json = json.loads(msg.payload.decode())
+            except ValueError:
+                continue
+            if offer_json.get("type") == "offer":
+                print(f"📩 [信令] 收到控制端的 Offer 名片 (会话 {offer_json.get('session_id', 'default')})")
+                asyncio.create_task(sessions.handle_offer(offer_json))
+    finally:
+        print(f"[会话] {sessions.describe()}")
+        await sessions.close_all()
+        registry.stop()
+        await mqtt_client.disconnect()
 
 # ================= 主入口 =================
 if __name__ == "__main__":
-    # 启动 MQTT
-    client = mqtt.Client(mqtt.CallbackAPIVersion.VERSION2)
-    client.on_connect = on_mqtt_connect
-    client.on_message = on_mqtt_message
-    client.connect(MQTT_BROKER, 1883, 60)
-    client.loop_start()
-
     try:
-        asyncio.run(run_robot(client))
+        asyncio.run(run_robot())
     except KeyboardInterrupt:
         pass
-    finally:
-        client.loop_stop()
\ No newline at end of file
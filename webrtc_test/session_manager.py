@@ -0,0 +1,125 @@
+"""机器人端 WebRTC 会话管理: 每个 Offer 一个 PeerConnection，按 session_id 区分
+
+信令 (MQTT) 里带 session_id，多个控制端 (操作员 + 监督员) 可以同时连进来；
+同一个 session_id 再发 Offer (网络断开后重连) 时先关掉旧的连接。连接状态变成
+failed / closed 的会话自动清理，摄像头订阅随之释放。
+
+老版本控制端的信令不带 session_id，统一当作 DEFAULT_SESSION。
+"""
+import time
+
+from aiortc import RTCPeerConnection, RTCSessionDescription
+
+from camera_tracks import CONTROL_CHANNEL
+
+DEFAULT_SESSION = "default"
+
+
+class RobotSession:
+    def __init__(self, session_id, pc, tracks):
+        self.session_id = session_id
+        self.pc = pc
+        self.tracks = tracks      # TrackSubscription
+        self.cmd_channel = None   # 控制端创建的指令 / 遥测通道
+        self.created = time.monotonic()
+
+    def channel_open(self):
+        return self.cmd_channel is not None and self.cmd_channel.readyState == "open"
+
+
+class SessionManager:
+    """handle_offer(信令) 建立会话；await publish_answer(dict) 负责把 Answer 发回去 (带 session_id)
+
+    on_command(message, via) 处理指令通道上收到的每一条消息。
+    """
+
+    def __init__(self, registry, publish_answer, on_command, cmd_channel="cmd"):
+        self.registry = registry
+        self.publish_answer = publish_answer
+        self.on_command = on_command
+        self.cmd_channel = cmd_channel
+        self.sessions = {}
+        self.opened = 0
+        self.closed = 0
+
+    async def handle_offer(self, offer_json):
+        session_id = str(offer_json.get("session_id") or DEFAULT_SESSION)
+        if session_id in self.sessions:
+            await self.close(session_id, "同一会话重新呼叫")
+
+        pc = RTCPeerConnection()
+        session = RobotSession(session_id, pc, self.registry.subscribe(pc))
+        self.sessions[session_id] = session
+        self.opened += 1
+        self._bind(session)
+
+        try:
+            # 1. 设置远端描述 (读对方的名片)
+            offer = RTCSessionDescription(sdp=offer_json["sdp"], type=offer_json["type"])
+            await pc.setRemoteDescription(offer)
+
+            # 2. 创建应答 (印自己的名片)
+            answer = await pc.createAnswer()
+            await pc.setLocalDescription(answer)
+        except Exception as e:
+            print(f"❌ [会话 {session_id}] 协商失败: {e}")
+            await self.close(session_id, "协商失败")
+            return
+
+        # 3. 发回 Answer (带上 session_id，其它控制端据此忽略)
+        await self.publish_answer({"type": "answer", "sdp": pc.localDescription.sdp, "session_id": session_id})
+        print(f"📤 [会话 {session_id}] 发送 Answer 名片，当前会话数 {len(self.sessions)}")
+
+    def _bind(self, session):
+        pc = session.pc
+
+        @pc.on("datachannel")
+        def on_datachannel(channel):
+            if channel.label == self.cmd_channel:
+                session.cmd_channel = channel
+                print(f"🔗 [会话 {session.session_id}] 指令通道已建立，指令 / 遥测改走 P2P")
+
+                @channel.on("message")
+                def on_cmd(message):
+                    self.on_command(message, "datachannel")
+            elif channel.label == CONTROL_CHANNEL:
+                @channel.on("message")
+                def on_control(message):
+                    reply = session.tracks.handle(message)
+                    if reply is not None:
+                        channel.send(reply)
+
+        @pc.on("connectionstatechange")
+        async def on_state():
+            print(f"🔄 [会话 {session.session_id}] 连接状态: {pc.connectionState}")
+            if pc.connectionState in ("failed", "closed"):
+                await self.close(session.session_id, pc.connectionState, pc)
+
+    async def close(self, session_id, reason="", pc=None):
+        """pc 不为空时只关这个连接 (重连后同一个 id 已经换成新连接就不动)"""
+        session = self.sessions.get(session_id)
+        if session is None or (pc is not None and session.pc is not pc):
+            return
+        del self.sessions[session_id]
+        self.closed += 1
+        session.tracks.close()
+        await session.pc.close()
+        print(f"🔚 [会话 {session_id}] 已关闭 ({reason})，剩余会话 {len(self.sessions)}")
+
+    async def close_all(self):
+        for session_id in list(self.sessions):
+            await self.close(session_id, "退出")
+
+    def broadcast(self, payload):
+        """发给所有指令通道已打开的会话，返回是否至少发出了一份"""
+        sent = False
+        for session in list(self.sessions.values()):
+            if session.channel_open():
+                session.cmd_channel.send(payload)
+                sent = True
+        return sent
+
+    def describe(self):
+        return (f"当前会话 {len(self.sessions)} (累计建立 {self.opened} 关闭 {self.closed})"
+                + "".join(f"\n  {s.session_id}: {s.pc.connectionState}"
+                          f" {'P2P' if s.channel_open() else 'MQTT'}" for s in self.sessions.values()))